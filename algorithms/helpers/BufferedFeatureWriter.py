@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Collects the features an algorithm creates and hands them to the sink in batches with addFeatures(). Every addFeature() call
+# has its own overhead (on file based outputs like GeoPackage a large share of the runtime of algorithms creating many small
+# features), one call per batch does not. The features must not be modified after they have been added.
+# Call flush() after the last feature, or use it as context manager so the last batch is written when the block is left:
+#     with BufferedFeatureWriter(sink, QgsFeatureSink.FastInsert) as writer:
+#         writer.addFeature(new_feat)
+
+BATCH_SIZE = 10000 # features per addFeatures() call
+
+class BufferedFeatureWriter():
+    def __init__(self, sink, flags = None, batch_size = BATCH_SIZE):
+        self.sink = sink
+        self.flags = flags
+        self.batch_size = max(1, batch_size)
+        self.buffer = []
+
+    def addFeature(self, feature):
+        self.buffer.append(feature)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def addFeatures(self, features):
+        self.buffer.extend(features)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the collected features to the sink."""
+        if not self.buffer:
+            return
+        if self.flags is None:
+            self.sink.addFeatures(self.buffer)
+        else:
+            self.sink.addFeatures(self.buffer, self.flags)
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        return False
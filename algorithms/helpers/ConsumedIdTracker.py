@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Bookkeeping of feature ids that have already been used ("count/snap/connect a feature only once").
+# A hash set, so testing an id takes the same time no matter how many ids have been consumed; with a list every test
+# walks through all consumed ids and large layers take quadratic time. Derived from set, so "fid in tracker" stays a C call.
+
+class ConsumedIdTracker(set):
+    def consume(self, fid):
+        """Marks a feature id as used."""
+        self.add(fid)
+
+    def is_consumed(self, fid):
+        return fid in self
+
+    def filter(self, fids):
+        """Returns the ids of fids that have not been consumed yet, in their original order."""
+        if not self:
+            return list(fids)
+        return [fid for fid in fids if fid not in self]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Progress reports of algorithms creating many small features. feedback.setProgress() emits a signal to the GUI on every
+# call, which costs more than creating a small feature; this passes a new progress on at most once per interval.
+# Used like the feedback: progress.setProgress(int(current * total)); call finish() at the end, so the last progress held back is reported.
+
+import time
+
+PROGRESS_INTERVAL = 0.2 # seconds
+
+class ThrottledProgress():
+    def __init__(self, feedback, interval = PROGRESS_INTERVAL):
+        self.feedback = feedback
+        self.interval = interval
+        self.progress = None # last reported progress
+        self.reported = 0.0 # time of the last report
+        self.pending = None # progress held back because it came within the interval after the last report
+
+    def setProgress(self, progress):
+        if progress == self.progress:
+            self.pending = None
+            return
+        now = time.monotonic()
+        if now - self.reported < self.interval:
+            self.pending = progress
+            return
+        self.report(progress, now)
+
+    def finish(self):
+        """Reports the last progress if it was held back."""
+        if self.pending is not None:
+            self.report(self.pending, time.monotonic())
+
+    def report(self, progress, now):
+        self.progress = progress
+        self.reported = now
+        self.pending = None
+        self.feedback.setProgress(progress)
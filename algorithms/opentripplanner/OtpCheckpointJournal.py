@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from PyQt5.QtCore import QDateTime, Qt
+from qgis.core import QgsFeature, QgsGeometry
+import json
+import os
+
+class OtpCheckpointJournal():
+    """
+    Append-only journal of the finished relations of an OTP run, one json line per relation containing
+    its route url and the resulting features (geometry as WKB and the attributes added by the algorithm).
+    Every line is flushed right after the relation is finished, so a canceled or crashed run can be resumed
+    without requesting these routes again.
+    """
+
+    def __init__(self, path, resume = False):
+        self.path = path
+        self.finished = {} # relation id: journal record
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+        if resume and os.path.exists(path):
+            with open(path, 'r', encoding = 'utf-8') as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError: # e.g. the last line, if the run crashed while writing it
+                        continue
+                    self.finished[record['relation']] = record
+            self.file = open(path, 'a', encoding = 'utf-8')
+        else: # start a new journal
+            self.file = open(path, 'w', encoding = 'utf-8')
+
+    def get(self, relation_id, route_url):
+        """Returns the record of a finished relation or None; records of a different url (e.g. changed source data) are ignored."""
+        record = self.finished.get(relation_id)
+        if record is None or record['url'] != route_url:
+            return None
+        return record
+
+    def record(self, relation_id, route_url, features, n_source_fields):
+        """Writes the features of a finished relation to the journal. Source attributes are not stored, they are taken from the source again on resume."""
+        journal_features = []
+        for feature in features:
+            attributes = []
+            for value in feature.attributes()[n_source_fields:]:
+                if isinstance(value, QDateTime):
+                    value = {'datetime': value.toString(Qt.ISODate)} if value.isValid() else None
+                elif value is not None and not isinstance(value, (str, int, float, bool)): # e.g. NULL-QVariants
+                    value = None
+                attributes.append(value)
+            journal_features.append({'wkb': bytes(feature.geometry().asWkb()).hex(), 'attributes': attributes})
+        record = {'relation': relation_id, 'url': route_url, 'features': journal_features}
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.finished[relation_id] = record
+
+    def restore(self, record, fields, source_feature):
+        """Recreates the features of a journal record, combined with the attributes of the current source feature."""
+        features = []
+        source_attributes = source_feature.attributes()
+        for journal_feature in record['features']:
+            attributes = []
+            for value in journal_feature['attributes']:
+                if isinstance(value, dict) and 'datetime' in value:
+                    value = QDateTime.fromString(value['datetime'], Qt.ISODate)
+                attributes.append(value)
+            geometry = QgsGeometry()
+            geometry.fromWkb(bytes.fromhex(journal_feature['wkb']))
+            feature = QgsFeature(fields)
+            feature.setGeometry(geometry)
+            feature.setAttributes(source_attributes + attributes)
+            features.append(feature)
+        return features
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Field extraction tables for OTP plan responses: which value of the response goes into which output field.
+# Every entry is (fieldname, path of keys in the response, name of a converter or None). The tables are compiled once
+# per run into (fieldindex, path, converter function) and then fill a preallocated attribute list for every route and leg,
+# values that are not available in a response become None.
+
+PLAN_FIELDS = ( # once per response, relative to the response
+    ('Route_From_Lat', ('plan', 'from', 'lat'), None),
+    ('Route_From_Lon', ('plan', 'from', 'lon'), None),
+    ('Route_From_StopId', ('plan', 'from', 'stopId'), None),
+    ('Route_From_StopCode', ('plan', 'from', 'stopCode'), None),
+    ('Route_From_Name', ('plan', 'from', 'name'), None),
+    ('Route_To_Lat', ('plan', 'to', 'lat'), None),
+    ('Route_To_Lon', ('plan', 'to', 'lon'), None),
+    ('Route_To_StopId', ('plan', 'to', 'stopId'), None),
+    ('Route_To_StopCode', ('plan', 'to', 'stopCode'), None),
+    ('Route_To_Name', ('plan', 'to', 'name'), None),
+    )
+
+ITINERARY_FIELDS = ( # once per itinerary, relative to the itinerary
+    ('Route_From_StartTime', ('startTime',), 'datetime'),
+    ('Route_To_EndTime', ('endTime',), 'datetime'),
+    ('Route_Total_Duration', ('duration',), None),
+    ('Route_Total_TransitTime', ('transitTime',), None),
+    ('Route_Total_WaitingTime', ('waitingTime',), None),
+    ('Route_Total_WalkTime', ('walkTime',), None),
+    ('Route_Total_WalkDistance', ('walkDistance',), None),
+    ('Route_Total_Transfers', ('transfers',), None),
+    )
+
+LEG_FIELDS = ( # once per leg, relative to the leg
+    ('Route_Leg_StartTime', ('startTime',), 'datetime'),
+    ('Route_Leg_DepartureDelay', ('departureDelay',), None),
+    ('Route_Leg_EndTime', ('endTime',), 'datetime'),
+    ('Route_Leg_ArrivalDelay', ('arrivalDelay',), None),
+    ('Route_Leg_Duration', ('duration',), None),
+    ('Route_Leg_Distance', ('distance',), None),
+    ('Route_Leg_Mode', ('mode',), None),
+    ('Route_Leg_From_Lat', ('from', 'lat'), None),
+    ('Route_Leg_From_Lon', ('from', 'lon'), None),
+    ('Route_Leg_From_StopId', ('from', 'stopId'), None),
+    ('Route_Leg_From_StopCode', ('from', 'stopCode'), None),
+    ('Route_Leg_From_Name', ('from', 'name'), None),
+    ('Route_Leg_From_Departure', ('from', 'departure'), 'datetime'),
+    ('Route_Leg_To_Lat', ('to', 'lat'), None),
+    ('Route_Leg_To_Lon', ('to', 'lon'), None),
+    ('Route_Leg_To_StopId', ('to', 'stopId'), None),
+    ('Route_Leg_To_StopCode', ('to', 'stopCode'), None),
+    ('Route_Leg_To_Name', ('to', 'name'), None),
+    ('Route_Leg_To_Arrival', ('to', 'arrival'), 'datetime'),
+    )
+
+def compile_fields(field_table, index_of, converters = None):
+    """
+    Compiles a field table into a list of (fieldindex, path, converter) using index_of (e.g. QgsFields.indexOf).
+    converters maps the converter names of the table to functions; fields that do not exist are skipped.
+    """
+    compiled = []
+    for fieldname, path, converter_name in field_table:
+        fieldindex = index_of(fieldname)
+        if fieldindex < 0:
+            continue
+        converter = None
+        if converter_name is not None:
+            converter = converters[converter_name]
+        compiled.append((fieldindex, path, converter))
+    return compiled
+
+def fill_attributes(data, compiled_fields, attributes):
+    """Writes the values of data (a decoded json object) into the attribute list at the compiled field indexes."""
+    for fieldindex, path, converter in compiled_fields:
+        value = data
+        try:
+            for key in path:
+                value = value[key]
+            if converter is not None:
+                value = converter(value)
+        except: # not every response delivers every value
+            value = None
+        attributes[fieldindex] = value
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import urllib.request
+import urllib.error
+import urllib.parse
+import http.client
+import threading
+import gzip
+import zlib
+
+MAX_REDIRECTS = 5 # a few hops are enough for proxies redirecting to https or a trailing slash
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+class OtpHttpStatusError(Exception):
+    """Raised when the server answers with a status code that is not a success (e.g. 404 or 503)."""
+
+    def __init__(self, status, reason = '', retry_after = None):
+        Exception.__init__(self, 'HTTP ' + str(status) + ' ' + str(reason))
+        self.status = status
+        try: # seconds the server asks to wait before trying again (only the numeric form is supported)
+            self.retry_after = float(retry_after)
+        except (TypeError, ValueError):
+            self.retry_after = None
+
+
+class OtpHttpClient():
+    """
+    Small HTTP client for GET requests against an OTP instance with persistent (keep-alive) connections.
+    Every thread keeps its own connection per server, so the TCP (and TLS) handshake is only paid once
+    per worker instead of once per request. Optionally asks for gzip-compressed responses.
+    Requests to hosts that have to go through a proxy are sent with urllib as before.
+    """
+
+    def __init__(self, headers = None, use_gzip = False, timeout = None):
+        self.headers = dict(headers) if headers is not None else {}
+        if use_gzip:
+            self.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.timeout = timeout
+        self.proxies = urllib.request.getproxies()
+        self.local = threading.local()
+        self.connections = [] # all connections of all threads, to be able to close them at the end
+        self.connections_lock = threading.Lock()
+
+    def prepare(self, url):
+        """Splits an url into (scheme, netloc, path incl. query); raises ValueError if it cannot be requested."""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ValueError('unknown url type: ' + str(url))
+        path = parts.path or '/'
+        if parts.query:
+            path = path + '?' + parts.query
+        return (parts.scheme, parts.netloc, path)
+
+    def connection(self, scheme, netloc):
+        connections = getattr(self.local, 'connections', None)
+        if connections is None:
+            connections = {}
+            self.local.connections = connections
+        connection = connections.get((scheme, netloc))
+        if connection is None:
+            if scheme == 'https':
+                connection = http.client.HTTPSConnection(netloc, timeout = self.timeout)
+            else:
+                connection = http.client.HTTPConnection(netloc, timeout = self.timeout)
+            connections[(scheme, netloc)] = connection
+            with self.connections_lock:
+                self.connections.append(connection)
+        return connection
+
+    def uses_proxy(self, scheme, netloc):
+        if scheme not in self.proxies:
+            return False
+        return not urllib.request.proxy_bypass(urllib.parse.urlsplit(scheme + '://' + netloc).hostname or '')
+
+    def send(self, target):
+        """Sends a GET request for a prepared target and returns (headers, body). The body is not decompressed yet."""
+        for redirect in range(MAX_REDIRECTS + 1):
+            scheme, netloc, path = target
+            if self.uses_proxy(scheme, netloc):
+                request = urllib.request.Request(scheme + '://' + netloc + path, headers = self.headers)
+                try:
+                    response = urllib.request.urlopen(request, timeout = self.timeout) # follows redirects itself
+                except urllib.error.HTTPError as e:
+                    raise OtpHttpStatusError(e.code, e.reason, e.headers.get('Retry-After') if e.headers is not None else None)
+                return response.headers, response.read()
+
+            response, body = self.send_direct(scheme, netloc, path)
+            location = response.getheader('Location')
+            if response.status in REDIRECT_STATUSES and location:
+                # e.g. a reverse proxy redirecting http to https or to a path with trailing slash, as urlopen() followed them before
+                target = self.prepare(urllib.parse.urljoin(scheme + '://' + netloc + path, location))
+                continue
+            if response.status >= 400:
+                raise OtpHttpStatusError(response.status, response.reason, response.getheader('Retry-After'))
+            return response.headers, body
+        raise OtpHttpStatusError(response.status, 'more than ' + str(MAX_REDIRECTS) + ' redirects')
+
+    def send_direct(self, scheme, netloc, path):
+        """Sends a GET request on the kept-alive connection of this thread and returns (response, body)."""
+        connection = self.connection(scheme, netloc)
+        for attempt in (1, 2):
+            try:
+                connection.request('GET', path, headers = self.headers)
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, http.client.BadStatusLine):
+                # The server may have closed the kept-alive connection in the meantime: retry once on a fresh one
+                connection.close()
+                if attempt == 2:
+                    raise
+            except:
+                connection.close()
+                raise
+        if response.will_close:
+            connection.close() # reopened automatically with the next request
+        return response, body
+
+    def decode(self, headers, body):
+        """Decompresses the body if necessary and decodes it to text using the charset of the response."""
+        content_encoding = (headers.get('Content-Encoding') or '').lower()
+        if content_encoding == 'gzip':
+            body = gzip.decompress(body)
+        elif content_encoding == 'deflate':
+            try:
+                body = zlib.decompress(body)
+            except zlib.error: # some servers send raw deflate streams without zlib header
+                body = zlib.decompress(body, -zlib.MAX_WBITS)
+        return body.decode(headers.get_content_charset('utf-8'))
+
+    def close(self):
+        with self.connections_lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
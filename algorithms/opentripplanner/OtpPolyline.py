@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Decoder for encoded polylines (https://developers.google.com/maps/documentation/utilities/polylinealgorithm) as used in
+# the legGeometry of OTP responses. Returns flat coordinate buffers (x = longitude, y = latitude) instead of one object per vertex,
+# so a linestring can be built from them in one go.
+
+from array import array
+
+try:
+    import numpy
+except ImportError: # numpy is shipped with QGIS, but fall back to pure python just in case
+    numpy = None
+
+NUMPY_MIN_LENGTH = 200 # below this length the pure python decoder is faster than setting up the numpy arrays
+
+def decode_polyline_python(polyline_str, precision = 5):
+    factor = float(10 ** precision)
+    data = polyline_str.encode('ascii')
+    length = len(data)
+    xs = array('d')
+    ys = array('d')
+    index, lat, lng = 0, 0, 0
+    while index < length:
+        # Each coordinate consists of a lat-change followed by a lon-change with variable length
+        shift, result = 0, 0
+        while True:
+            byte = data[index] - 63
+            index += 1
+            result |= (byte & 0x1f) << shift
+            shift += 5
+            if byte < 0x20:
+                break
+        lat += ~(result >> 1) if result & 1 else (result >> 1)
+        shift, result = 0, 0
+        while True:
+            byte = data[index] - 63
+            index += 1
+            result |= (byte & 0x1f) << shift
+            shift += 5
+            if byte < 0x20:
+                break
+        lng += ~(result >> 1) if result & 1 else (result >> 1)
+        xs.append(lng / factor)
+        ys.append(lat / factor)
+    return xs, ys
+
+def decode_polyline_numpy(polyline_str, precision = 5):
+    chunks = numpy.frombuffer(polyline_str.encode('ascii'), dtype = numpy.uint8).astype(numpy.int64) - 63
+    if len(chunks) == 0:
+        return numpy.empty(0), numpy.empty(0)
+    last_chunks = chunks < 0x20 # the last 5-bit-chunk of every value has no continuation bit
+    if not last_chunks[-1]:
+        raise ValueError('Polyline ends in the middle of a value')
+    first_chunks = numpy.concatenate(([True], last_chunks[:-1]))
+    starts = numpy.flatnonzero(first_chunks)
+    value_index = numpy.cumsum(first_chunks) - 1
+    shifts = (numpy.arange(len(chunks)) - starts[value_index]) * 5
+    values = numpy.add.reduceat((chunks & 0x1f) << shifts, starts) # the chunks do not overlap, so adding equals or-ing
+    if len(values) % 2:
+        raise ValueError('Polyline contains an incomplete coordinate')
+    deltas = numpy.where(values & 1, ~(values >> 1), values >> 1).reshape(-1, 2)
+    coordinates = numpy.cumsum(deltas, axis = 0) / float(10 ** precision) # integer sums, so no rounding errors add up
+    return coordinates[:, 1], coordinates[:, 0]
+
+def decode_polyline(polyline_str, precision = 5):
+    """
+    Decodes an encoded polyline and returns two coordinate buffers (xs, ys) with longitudes and latitudes.
+    precision is the number of decimals the polyline was encoded with: 5 (OTP default) or 6.
+    """
+    if numpy is not None and len(polyline_str) >= NUMPY_MIN_LENGTH:
+        return decode_polyline_numpy(polyline_str, precision)
+    return decode_polyline_python(polyline_str, precision)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+import http.client
+import threading
+import json
+import time
+from .OtpHttpClient import OtpHttpClient, OtpHttpStatusError
+from .OtpRequestScheduler import OtpRequestScheduler
+
+class OtpRequestEngine():
+    """
+    Sends plan-requests to an OpenTripPlanner instance. Requests are either sent one after another
+    or by a bounded pool of workers; results are always returned in the order of the requests.
+    If an OtpResponseCache is given, responses are taken from and stored in it; with read_cache = False
+    the cache is only written, so all requests go to the server and refresh the cached responses.
+    Requests are sent through an OtpHttpClient, which keeps the connections to the server open between requests,
+    and are paced by an OtpRequestScheduler (requests per second, adaptive concurrency). Transient failures
+    (timeouts, dropped connections, HTTP 429/502/503/504) are retried up to retries times with exponential backoff.
+    """
+
+    TRANSIENT_STATUS = (429, 502, 503, 504)
+
+    def __init__(self, headers = None, max_workers = 1, cache = None, read_cache = True, use_gzip = False,
+                 max_requests_per_second = 0, timeout = None, retries = 0, adaptive = False):
+        if headers is None:
+            headers = {"accept":"application/json"} # this plugin only works for json responses
+        self.headers = headers
+        self.max_workers = max(1, int(max_workers))
+        self.cache = cache
+        self.read_cache = read_cache
+        self.http_client = OtpHttpClient(headers, use_gzip, timeout if timeout else None) # 0 means no timeout
+        self.scheduler = OtpRequestScheduler(max_requests_per_second, self.max_workers, adaptive)
+        self.retries = max(0, int(retries))
+        self.requests_saved = 0
+        # Statistics for benchmarks: requests sent to the server, seconds spent waiting for responses and decoding them
+        self.stats_lock = threading.Lock()
+        self.requests_sent = 0
+        self.network_seconds = 0.0
+        self.parse_seconds = 0.0
+
+    def add_stats(self, requests_sent, network_seconds, parse_seconds):
+        with self.stats_lock:
+            self.requests_sent += requests_sent
+            self.network_seconds += network_seconds
+            self.parse_seconds += parse_seconds
+
+    def is_transient(self, error):
+        """Returns True for failures that may be gone when trying again a little later."""
+        if isinstance(error, OtpHttpStatusError):
+            return error.status in self.TRANSIENT_STATUS
+        return isinstance(error, (OSError, http.client.HTTPException)) # timeouts, refused or dropped connections
+
+    def fetch(self, route_url):
+        """
+        Requests a single url and returns a tuple (route_data, route_error).
+        route_data is the decoded json response or None, route_error is None on success or one of the
+        error strings the OTP algorithms write to their Route_Error field.
+        """
+        if self.cache is not None and self.read_cache:
+            try:
+                cached_response = self.cache.get(route_url)
+                if cached_response is not None:
+                    parse_start = time.perf_counter()
+                    route_data = json.loads(cached_response)
+                    self.add_stats(0, 0.0, time.perf_counter() - parse_start)
+                    return route_data, None
+            except: # a broken cache entry is treated like a missing one
+                pass
+        try: # Try to request route
+            route_request = self.http_client.prepare(route_url)
+        except:
+            return None, 'Error: Requesting the route failed'
+        attempt = 0
+        while True: # Try to receive response
+            if not self.scheduler.acquire(): # canceled
+                return None, 'Error: No response received'
+            request_start = time.monotonic()
+            try:
+                response_headers, response_data = self.http_client.send(route_request)
+            except Exception as e:
+                transient = self.is_transient(e)
+                self.scheduler.release(None, transient)
+                self.add_stats(1, time.monotonic() - request_start, 0.0)
+                attempt += 1
+                if not transient or attempt > self.retries or not self.scheduler.backoff(attempt, getattr(e, 'retry_after', None)):
+                    return None, 'Error: No response received'
+                continue
+            request_seconds = time.monotonic() - request_start
+            self.scheduler.release(request_seconds)
+            break
+        parse_start = time.perf_counter()
+        try: # Try to read response data
+            response_text = self.http_client.decode(response_headers, response_data)
+            route_data = json.loads(response_text)
+        except:
+            return None, 'Error: Cannot read response data'
+        finally:
+            self.add_stats(1, request_seconds, time.perf_counter() - parse_start)
+        if self.cache is not None: # only valid json responses are cached, failed requests are tried again next time
+            try:
+                self.cache.put(route_url, response_text)
+            except:
+                pass
+        return route_data, None
+
+    def fetch_ordered(self, route_jobs, feedback = None, url_counts = None):
+        """
+        Takes an iterable of (payload, route_url) tuples and yields (payload, route_url, route_data, route_error)
+        in exactly the same order. The payload (e.g. the source feature) is passed through untouched.
+        Jobs are only pulled from the iterable when there is room in the pool, so at most 2 * max_workers
+        requests are queued or in flight at any time. No new requests are started once feedback is canceled.
+        If url_counts (a dict route_url: number of jobs with this url) is given, identical urls are only requested
+        once and the result is handed to all their jobs; it is kept only until the last of these jobs got it.
+        Jobs with route_url None are passed through without a request, with route_data and route_error None.
+        """
+        self.requests_saved = 0
+        if feedback is not None:
+            self.scheduler.is_canceled = feedback.isCanceled
+        shared = {} # route_url: [future, number of jobs still waiting for it]
+        executor = None
+        if self.max_workers > 1:
+            executor = ThreadPoolExecutor(max_workers = self.max_workers)
+            window = self.max_workers * 2 # twice as many jobs as workers, so the workers do not idle while the results are processed
+        else:
+            window = 1
+
+        def start(route_url):
+            if executor is not None:
+                return executor.submit(self.fetch, route_url)
+            future = Future() # without workers the request is sent right now, directly before its result is needed
+            future.set_result(self.fetch(route_url))
+            return future
+
+        def submit(route_url):
+            if route_url is None: # nothing to request, e.g. a relation restored from a checkpoint
+                future = Future()
+                future.set_result((None, None))
+                return future
+            if url_counts is None:
+                return start(route_url)
+            entry = shared.get(route_url)
+            if entry is None:
+                entry = [start(route_url), url_counts.get(route_url, 1)]
+                shared[route_url] = entry
+            else:
+                self.requests_saved += 1
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del shared[route_url]
+            return entry[0]
+
+        route_jobs = iter(route_jobs)
+        pending = deque()
+        jobs_exhausted = False
+        try:
+            while True:
+                while not jobs_exhausted and len(pending) < window:
+                    if feedback is not None and feedback.isCanceled():
+                        jobs_exhausted = True
+                        break
+                    try:
+                        payload, route_url = next(route_jobs)
+                    except StopIteration:
+                        jobs_exhausted = True
+                        break
+                    pending.append((payload, route_url, submit(route_url)))
+                if not pending:
+                    break
+                payload, route_url, future = pending.popleft()
+                route_data, route_error = future.result()
+                yield payload, route_url, route_data, route_error
+        finally: # Also reached if the consumer stops iterating, e.g. on cancel
+            self.scheduler.stop() # wake up workers waiting for their turn or a retry
+            for payload, route_url, future in pending:
+                future.cancel()
+            if executor is not None:
+                executor.shutdown(wait = True)
+            self.scheduler.reset()
+            self.scheduler.is_canceled = None
+
+    def close(self):
+        self.http_client.close()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+import random
+import time
+
+class OtpRequestScheduler():
+    """
+    Decides when the workers of an OtpRequestEngine may send their next request.
+    - max_requests_per_second > 0 spaces the requests evenly, so the server never gets more than this rate
+    - with adaptive = True the number of requests in flight is adjusted to the server (additive increase,
+      multiplicative decrease): it is halved as soon as the smoothed latency rises far above the best latency
+      seen so far or the server reports overload (e.g. HTTP 503), and increased by one after a full round
+      of fast responses, starting from one and never above max_concurrency
+    - backoff() waits exponentially longer before each retry of a failed request
+    All waits end early once stop() is called or the callable is_canceled (e.g. feedback.isCanceled) returns True.
+    """
+
+    LATENCY_SMOOTHING = 0.2 # weight of the newest latency in the moving average
+    LATENCY_TOLERANCE = 2.0 # back off if the average latency is more than this times the best average latency
+    BACKOFF_BASE = 0.5 # seconds before the first retry
+    BACKOFF_MAX = 30.0 # seconds, upper limit for a single wait
+
+    def __init__(self, max_requests_per_second = 0, max_concurrency = 1, adaptive = False):
+        self.interval = 1.0 / max_requests_per_second if max_requests_per_second > 0 else 0.0
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.adaptive = adaptive
+        self.limit = 1 if adaptive else self.max_concurrency # start slow, so the best latency is measured on a server that is not busy yet
+        self.in_flight = 0
+        self.next_start = 0.0
+        self.latency_average = None
+        self.latency_best = None
+        self.completed_since_change = 0
+        self.limit_decreases = 0
+        self.retry_count = 0
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.is_canceled = None
+
+    def reset(self):
+        with self.condition:
+            self.stopped.clear()
+            self.in_flight = 0
+
+    def stop(self):
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify_all()
+
+    def wait(self, seconds):
+        """Sleeps for the given time; returns False if stopped or canceled in the meantime."""
+        end = time.monotonic() + seconds
+        while True:
+            if self.is_canceled is not None and self.is_canceled():
+                self.stop()
+            remaining = end - time.monotonic()
+            if remaining <= 0 or self.stopped.is_set():
+                return not self.stopped.is_set()
+            self.stopped.wait(min(remaining, 0.1)) # look for cancellation regularly
+
+    def acquire(self):
+        """Blocks until a request may be sent; returns False if the scheduler was stopped in the meantime."""
+        with self.condition:
+            while self.in_flight >= self.limit and not self.stopped.is_set():
+                self.condition.wait()
+            if self.stopped.is_set():
+                return False
+            self.in_flight += 1
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now and not self.wait(start - now): # wait for the turn of this request outside of the lock
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+            return False
+        return True
+
+    def release(self, latency = None, overloaded = False):
+        """Called after every acquired request with its latency in seconds (None if it failed) and whether the server was overloaded."""
+        with self.condition:
+            self.in_flight -= 1
+            if self.adaptive:
+                self.adapt(latency, overloaded)
+            self.condition.notify_all()
+
+    def adapt(self, latency, overloaded):
+        if latency is not None:
+            if self.latency_average is None:
+                self.latency_average = latency
+            else:
+                self.latency_average += self.LATENCY_SMOOTHING * (latency - self.latency_average)
+            if self.latency_best is None or self.latency_average < self.latency_best:
+                self.latency_best = self.latency_average
+        slow = self.latency_average is not None and self.latency_average > self.latency_best * self.LATENCY_TOLERANCE
+        self.completed_since_change += 1
+        if overloaded or slow:
+            # Only decrease once per round of requests, the requests still in flight were sent with the old limit
+            if self.completed_since_change >= self.limit and self.limit > 1:
+                self.limit = max(1, self.limit // 2)
+                self.completed_since_change = 0
+                self.limit_decreases += 1
+        elif self.completed_since_change >= self.limit and self.limit < self.max_concurrency:
+            self.limit += 1
+            self.completed_since_change = 0
+
+    def backoff(self, attempt, retry_after = None):
+        """Waits before retry number attempt (1, 2, ...); returns False if the scheduler was stopped meanwhile."""
+        with self.condition:
+            self.retry_count += 1
+        delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * (2 ** (attempt - 1)))
+        delay = delay * random.uniform(0.5, 1.0) # jitter, so the workers do not retry all at the same moment
+        if retry_after is not None: # the server knows best how long it needs
+            delay = min(self.BACKOFF_MAX, max(delay, retry_after))
+        return self.wait(delay)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.core import QgsApplication
+import urllib.parse
+import threading
+import sqlite3
+import time
+import os
+
+CACHE_VERSION = 1 # increased whenever the keys change, entries of older versions are dropped
+
+class OtpResponseCache():
+    """
+    Persistent on-disk cache for OTP responses, stored in a SQLite database.
+    Entries are keyed on the normalized request url, expire after ttl seconds (0 means never)
+    and the least recently used entries are evicted as soon as more than max_entries are stored.
+    """
+
+    def __init__(self, path, ttl = 0, max_entries = 100000):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+        self.ttl = ttl
+        self.max_entries = max(1, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.lock = threading.Lock() # the connection is shared by all request workers
+        self.connection = sqlite3.connect(path, check_same_thread = False, isolation_level = None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] < CACHE_VERSION:
+            # Keys of former versions sorted the values of repeated parameters, so their entries may belong to another request
+            self.connection.execute('DELETE FROM responses')
+            self.connection.execute('PRAGMA user_version = ' + str(CACHE_VERSION))
+        self.entries = self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def default_path():
+        return os.path.join(QgsApplication.qgisSettingsDirPath(), 'processx', 'otp_response_cache.sqlite')
+
+    @staticmethod
+    def normalize_url(url):
+        # Same request, same key: ignore case of scheme and host, order of the parameters and the fragment. Parameters are sorted by name only
+        # (the sort is stable), so the values of a repeated parameter keep their order, e.g. of several intermediatePlaces
+        parts = urllib.parse.urlsplit(url.strip())
+        query = sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values = True), key = lambda parameter: parameter[0])
+        return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urllib.parse.urlencode(query), ''))
+
+    def get(self, url):
+        key = self.normalize_url(url)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute('SELECT response, created FROM responses WHERE url = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if self.ttl > 0 and row[1] < now - self.ttl: # expired
+                self.connection.execute('DELETE FROM responses WHERE url = ?', (key,))
+                self.entries -= 1
+                self.misses += 1
+                return None
+            self.connection.execute('UPDATE responses SET accessed = ? WHERE url = ?', (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, url, response):
+        key = self.normalize_url(url)
+        now = time.time()
+        with self.lock:
+            cursor = self.connection.execute('UPDATE responses SET response = ?, created = ?, accessed = ? WHERE url = ?', (response, now, now, key))
+            if cursor.rowcount == 0:
+                self.connection.execute('INSERT INTO responses (url, response, created, accessed) VALUES (?, ?, ?, ?)', (key, response, now, now))
+                self.entries += 1
+            self.stored += 1
+            if self.entries > self.max_entries: # evict least recently used
+                self.connection.execute('DELETE FROM responses WHERE url IN (SELECT url FROM responses ORDER BY accessed ASC LIMIT ?)', (self.entries - self.max_entries,))
+                self.entries = self.max_entries
+
+    def purge(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM responses')
+            self.entries = 0
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
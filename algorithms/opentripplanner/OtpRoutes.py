@@ -20,55 +20,30 @@ License: GNU General Public License v3.0
 # Tested with: QGIS 3.4.15 and QGIS 3.18.0 (recommend 3.18, as at least 3.4 crashes sometimes without any reason or error message, but works on the same data and same settings perfectly when trying another time)
 
 from PyQt5.QtCore import QCoreApplication, QVariant, QDate, QTime, QDateTime, Qt
-from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsGeometry, QgsPoint, QgsFields, QgsWkbTypes, QgsCoordinateReferenceSystem, QgsDateTimeFieldFormatter,
+from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsGeometry, QgsPoint, QgsLineString, QgsFields, QgsWkbTypes, QgsCoordinateReferenceSystem, QgsDateTimeFieldFormatter,
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm,
-                       QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterString, QgsProcessingParameterNumber)
+                       QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterString, QgsProcessingParameterNumber, QgsProcessingParameterBoolean, QgsProcessingParameterFileDestination)
 from osgeo import ogr
 from datetime import *
 import os.path
 import os
-import urllib.request
-import urllib
-import json
+from .OtpRequestEngine import OtpRequestEngine
+from .OtpResponseCache import OtpResponseCache
+from .OtpPolyline import decode_polyline
+from .OtpFieldTable import PLAN_FIELDS, ITINERARY_FIELDS, LEG_FIELDS, compile_fields, fill_attributes
+from .OtpCheckpointJournal import OtpCheckpointJournal
 
 class OtpRoutes(QgsProcessingAlgorithm):
     
-    # Source: https://stackoverflow.com/a/33557535/8947209 (slightly modified)
-    def decode_polyline(self, polyline_str):
-        index, lat, lng = 0, 0, 0
-        #coordinates = []
-        pointlist = []
-        changes = {'latitude': 0, 'longitude': 0}
+    # Decodes the encoded polyline of a leg directly into a linestring; see OtpPolyline.py
+    # (based on https://stackoverflow.com/a/33557535/8947209, decoding into coordinate buffers instead of one QgsPoint per vertex)
+    def decode_polyline(self, polyline_str, precision = 5):
+        xs, ys = decode_polyline(polyline_str, precision)
+        return QgsGeometry(QgsLineString(list(xs), list(ys)))
     
-        # Coordinates have variable length when encoded, so just keep
-        # track of whether we've hit the end of the string. In each
-        # while loop iteration, a single coordinate is decoded.
-        while index < len(polyline_str):
-            # Gather lat/lon changes, store them in a dictionary to apply them later
-            for unit in ['latitude', 'longitude']: 
-                shift, result = 0, 0
-
-                while True:
-                    byte = ord(polyline_str[index]) - 63
-                    index+=1
-                    result |= (byte & 0x1f) << shift
-                    shift += 5
-                    if not byte >= 0x20:
-                        break
-
-                if (result & 1):
-                    changes[unit] = ~(result >> 1)
-                else:
-                    changes[unit] = (result >> 1)
-
-            lat += changes['latitude']
-            lng += changes['longitude']
-            
-            qgspointgeom = QgsPoint(float(lng / 100000.0),float(lat / 100000.0))
-            pointlist.append(qgspointgeom)
-
-            #coordinates.append((lat / 100000.0, lng / 100000.0)) # original code, but we dont need a tuple of coords, only the qgspoints
-        return pointlist    
+    # Converts OTP timestamps (milliseconds since epoch) to QDateTime
+    def otp_datetime(self, timestamp):
+        return QDateTime.fromString(str(datetime.fromtimestamp(int(timestamp)/1000)),'yyyy-MM-dd hh:mm:ss')
     
     SERVER_URL = 'SERVER_URL'
     SOURCE_LYR = 'SOURCE_LYR'
@@ -82,6 +57,18 @@ class OtpRoutes(QgsProcessingAlgorithm):
     OPTIMIZE = 'OPTIMIZE'
     ADDITIONAL_PARAMS = 'ADDITIONAL_PARAMS'
     ITERINARIES = 'ITERINARIES'
+    POLYLINE_PRECISION = 'POLYLINE_PRECISION'
+    MAX_WORKERS = 'MAX_WORKERS'
+    MAX_REQUESTS_PER_SECOND = 'MAX_REQUESTS_PER_SECOND'
+    ADAPTIVE_CONCURRENCY = 'ADAPTIVE_CONCURRENCY'
+    TIMEOUT = 'TIMEOUT'
+    RETRIES = 'RETRIES'
+    GZIP = 'GZIP'
+    CACHE_MODE = 'CACHE_MODE'
+    CACHE_TTL = 'CACHE_TTL'
+    CACHE_MAX_ENTRIES = 'CACHE_MAX_ENTRIES'
+    CHECKPOINT_FILE = 'CHECKPOINT_FILE'
+    RESUME = 'RESUME'
     OUTPUT = 'OUTPUT'
 
     def initAlgorithm(self, config=None):
@@ -124,6 +111,45 @@ class OtpRoutes(QgsProcessingAlgorithm):
         self.addParameter(
             QgsProcessingParameterNumber(
                 self.ITERINARIES, self.tr('Number of Iterinaries'),type=0,defaultValue=1,minValue=1))
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.POLYLINE_PRECISION, self.tr('Precision of the encoded route geometries'),
+                ['5 decimals (OTP default)','6 decimals'],defaultValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_WORKERS, self.tr('Number of parallel requests (1 means one request after another)'),type=0,defaultValue=1,minValue=1,maxValue=64))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_REQUESTS_PER_SECOND, self.tr('Maximum number of requests per second (0 means no limit)'),type=1,defaultValue=0,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.ADAPTIVE_CONCURRENCY, self.tr('Adapt the number of parallel requests to the server (send fewer requests while its response times rise)'),defaultValue=False))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.TIMEOUT, self.tr('Timeout per request in seconds (0 means no timeout)'),type=1,defaultValue=0,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.RETRIES, self.tr('Number of retries for temporary failures (timeouts, lost connections, server busy), waiting longer before each retry (0 means no retries)'),type=0,defaultValue=0,minValue=0,maxValue=10))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.GZIP, self.tr('Request gzip-compressed responses (less data to transfer, a little more work to unpack)'),defaultValue=False))
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.CACHE_MODE, self.tr('Local response cache (reruns with the same requests do not query the server again)'),
+                ['Do not use cache','Use cache','Bypass cache (query the server and refresh the cached responses)','Purge cache before running, then use it'],defaultValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CACHE_TTL, self.tr('Hours until a cached response expires (0 means never)'),type=1,defaultValue=168,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CACHE_MAX_ENTRIES, self.tr('Maximum number of cached responses (least recently used ones are removed first)'),type=0,defaultValue=100000,minValue=1))
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.CHECKPOINT_FILE, self.tr('Checkpoint journal (finished routes are written here, so a canceled or crashed run can be resumed)'),
+                fileFilter='Checkpoint journal (*.jsonl)',optional=True,createByDefault=False))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.RESUME, self.tr('Resume from checkpoint journal (routes already in the journal are not requested again)'),defaultValue=False))
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 self.OUTPUT, self.tr('OTP Routes'))) # Output
@@ -149,6 +175,18 @@ class OtpRoutes(QgsProcessingAlgorithm):
         
         additional_params = self.parameterAsString(parameters, self.ADDITIONAL_PARAMS, context)
         iterinaries = self.parameterAsInt(parameters, self.ITERINARIES, context)
+        polyline_precision = self.parameterAsInt(parameters, self.POLYLINE_PRECISION, context) + 5
+        max_workers = self.parameterAsInt(parameters, self.MAX_WORKERS, context)
+        max_requests_per_second = self.parameterAsDouble(parameters, self.MAX_REQUESTS_PER_SECOND, context)
+        adaptive_concurrency = self.parameterAsBool(parameters, self.ADAPTIVE_CONCURRENCY, context)
+        request_timeout = self.parameterAsDouble(parameters, self.TIMEOUT, context)
+        request_retries = self.parameterAsInt(parameters, self.RETRIES, context)
+        use_gzip = self.parameterAsBool(parameters, self.GZIP, context)
+        cache_mode = self.parameterAsInt(parameters, self.CACHE_MODE, context)
+        cache_ttl = self.parameterAsDouble(parameters, self.CACHE_TTL, context)
+        cache_max_entries = self.parameterAsInt(parameters, self.CACHE_MAX_ENTRIES, context)
+        checkpoint_file = self.parameterAsFileOutput(parameters, self.CHECKPOINT_FILE, context)
+        resume = self.parameterAsBool(parameters, self.RESUME, context)
         
         total = 100.0 / source_layer.featureCount() if source_layer.featureCount() else 0 # Initialize progress for progressbar
         
@@ -207,18 +245,20 @@ class OtpRoutes(QgsProcessingAlgorithm):
             ]
         for field in fieldlist:
             fields.append(field) # add fields from the list
-        # Fieldindex as dictionary to avoid a mess
-        fieldindexcounter = 0 # start with index 0
-        fieldindexdict = {} # empty dictionary
-        for field in fields: # iterate through field list we just created above
-            x = str(field.name()).lower() # convert to lowercase, string
-            fieldindexdict[fieldindexcounter] = x # assign index as key and fieldname as value
-            if '_url' in x:
-                fieldindex_position_of_last_alwaysneededfield = fieldindexcounter
-            if 'route_total_distance' in x:
-                fieldindex_position_of_routetotaldistance = fieldindexcounter
-            fieldindexcounter += 1
-        len_fieldindexdict = len(fieldindexdict)
+        # Fieldindex of the added fields by name (not using fields.indexOf, the sourcelayer may contain fields with the same names)
+        fieldindexdict = {}
+        for fieldindexcounter, field in enumerate(fieldlist):
+            fieldindexdict[field.name()] = n_source_fields + fieldindexcounter
+        fieldindex_position_of_first_alwaysneededfield = fieldindexdict['Route_LegID']
+        fieldindex_position_of_last_alwaysneededfield = fieldindexdict['Route_URL'] # the fields up to here are filled on errors as well
+        fieldindex_position_of_routetotaldistance = fieldindexdict['Route_Total_Distance']
+        fieldindex_position_of_routetotalmode = fieldindexdict['Route_Total_Mode']
+        # Compiled field extraction (see OtpFieldTable.py): which value of the response goes into which field
+        fieldindex_of = lambda fieldname: fieldindexdict.get(fieldname, -1)
+        plan_fields = compile_fields(PLAN_FIELDS, fieldindex_of, {'datetime': self.otp_datetime})
+        itinerary_fields = compile_fields(ITINERARY_FIELDS, fieldindex_of, {'datetime': self.otp_datetime})
+        leg_fields = compile_fields(LEG_FIELDS, fieldindex_of, {'datetime': self.otp_datetime})
+        attributes = [None] * fields.count() # preallocated once, refilled for every feature
         
         
         # Counter
@@ -240,84 +280,110 @@ class OtpRoutes(QgsProcessingAlgorithm):
         
         # some general settings
         route_headers = {"accept":"application/json"} # this plugin only works for json responses
+        route_cache = None
+        if cache_mode != 0:
+            route_cache = OtpResponseCache(OtpResponseCache.default_path(), cache_ttl * 3600, cache_max_entries)
+            if cache_mode == 3:
+                feedback.setProgressText('Purging response cache...')
+                route_cache.purge()
+        route_engine = OtpRequestEngine(route_headers, max_workers, route_cache, cache_mode != 2, use_gzip,
+                                        max_requests_per_second, request_timeout, request_retries, adaptive_concurrency)
+        checkpoint_journal = None
+        if checkpoint_file:
+            checkpoint_journal = OtpCheckpointJournal(checkpoint_file, resume)
+            if resume:
+                feedback.setProgressText(str(len(checkpoint_journal.finished)) + ' finished relations found in checkpoint journal')
+        route_legid_index = fieldindexdict['Route_LegID']
+        route_routeid_index = fieldindexdict['Route_RouteID']
         
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
                                                fields, 2, # 2 = wkbType LineString
                                                QgsCoordinateReferenceSystem('EPSG:4326'))
+        
+        def route_requests(): # Create URL for each feature; the requests are sent by the engine, results come back in source order
+            for relation_id, source_feature in enumerate(source_layer.getFeatures(), 1): # iterate over source
+                # Making Script compatible with earlier versions than QGIS 3.18: If date or time field is a string, do not convert it to a string...
+                use_date = ''
+                use_time = ''
+                try:
+                    use_date = str(source_feature[date_field].toString('yyyy-MM-dd'))
+                except:
+                    use_date = str(source_feature[date_field])
+                try:
+                    use_time = str(source_feature[time_field].toString('HH:mm:ss'))
+                except:
+                    use_time = str(source_feature[time_field])
+                
+                # Create URL for current feature
+                route_url = (str(server_url) + "plan?" + # Add Plan request to server url
+                    "fromPlace=" + str(source_feature[startlat_field]) + "," + str(source_feature[startlon_field]) +
+                    "&toPlace=" + str(source_feature[endlat_field]) + "," + str(source_feature[endlon_field]) +
+                    "&mode=" + travelmode +
+                    "&date=" + use_date +
+                    "&time=" + use_time +
+                    "&numItineraries=" + str(iterinaries) +
+                    "&optimize=" + traveloptimize +
+                    additional_params # Additional Parameters entered as OTP-Readable string -> User responsibility
+                )
+                checkpoint_record = None
+                if checkpoint_journal is not None:
+                    checkpoint_record = checkpoint_journal.get(relation_id, route_url)
+                if checkpoint_record is not None: # finished in an earlier run: do not request it again
+                    yield (source_feature, checkpoint_record), None
+                else:
+                    yield (source_feature, None), route_url
                                                
-        for current, source_feature in enumerate(source_layer.getFeatures()): # iterate over source
+        for current, ((source_feature, checkpoint_record), route_url, route_data, route_error) in enumerate(route_engine.fetch_ordered(route_requests(), feedback)):
         
             route_relationid += 1
             
-            # Making Script compatible with earlier versions than QGIS 3.18: If date or time field is a string, do not convert it to a string...
-            use_date = ''
-            use_time = ''
-            try:
-                use_date = str(source_feature[date_field].toString('yyyy-MM-dd'))
-            except:
-                use_date = str(source_feature[date_field])
-            try:
-                use_time = str(source_feature[time_field].toString('HH:mm:ss'))
-            except:
-                use_time = str(source_feature[time_field])
+            if checkpoint_record is not None: # Restore the features of this relation from the checkpoint journal, continuing the ids of this run
+                stored_routeid = None
+                for new_feature in checkpoint_journal.restore(checkpoint_record, fields, source_feature):
+                    route_legid += 1
+                    if stored_routeid is None or new_feature[route_routeid_index] != stored_routeid: # a new route of the relation starts
+                        stored_routeid = new_feature[route_routeid_index]
+                        route_routeid += 1
+                    new_feature[route_legid_index] = route_legid
+                    new_feature[route_routeid_index] = route_routeid
+                    sink.addFeature(new_feature, QgsFeatureSink.FastInsert)
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(int(current * total))
+                continue
             
-            # Create URL for current feature
-            route_url = (str(server_url) + "plan?" + # Add Plan request to server url
-                "fromPlace=" + str(source_feature[startlat_field]) + "," + str(source_feature[startlon_field]) +
-                "&toPlace=" + str(source_feature[endlat_field]) + "," + str(source_feature[endlon_field]) +
-                "&mode=" + travelmode +
-                "&date=" + use_date +
-                "&time=" + use_time +
-                "&numItineraries=" + str(iterinaries) +
-                "&optimize=" + traveloptimize +
-                additional_params # Additional Parameters entered as OTP-Readable string -> User responsibility
-            )
+            relation_features = [] # features of this relation, for the checkpoint journal
+            request_failed = route_error is not None # transport errors are not journaled, so they are requested again on resume
             
-            #print(route_url)
             
             # Reset Error Indicators
-            route_error = 'Success'
             route_error_bool = False
             route_errorid = None
             route_errordescription = None
             route_errormessage = None
             route_errornopath = None
 
-            try: # Try to request route
-                route_request = urllib.request.Request(route_url, headers=route_headers)
-                try: # Try to receive response
-                    route_response = urllib.request.urlopen(route_request)
-                    try: # Try to read response data
-                        response_data = route_response.read()
-                        encoding = route_response.info().get_content_charset('utf-8')
-                        route_data = json.loads(response_data.decode(encoding))
-                        try: # Check if response says Error
-                            route_error = 'Error: No Route'
-                            route_error_bool = True
-                            route_errorid = route_data['error']['id']
-                            route_errordescription = route_data['error']['msg']
-                            try: # not every error delivers this
-                                route_errormessage = route_data['error']['message']
-                            except:
-                                pass
-                            try: # not every error delivers this
-                                route_errornopath = route_data['error']['noPath']
-                            except:
-                                pass
-                        except:
-                            route_error = 'Success'
-                            route_error_bool = False
+            if route_error is not None: # Requesting or reading the route failed
+                route_error_bool = True
+            else:
+                route_error = 'Success'
+                try: # Check if response says Error
+                    route_error = 'Error: No Route'
+                    route_error_bool = True
+                    route_errorid = route_data['error']['id']
+                    route_errordescription = route_data['error']['msg']
+                    try: # not every error delivers this
+                        route_errormessage = route_data['error']['message']
                     except:
-                        route_error = 'Error: Cannot read response data'
-                        route_error_bool = True
+                        pass
+                    try: # not every error delivers this
+                        route_errornopath = route_data['error']['noPath']
+                    except:
+                        pass
                 except:
-                    route_error = 'Error: No response received'
-                    route_error_bool = True
-            except:
-                route_error = 'Error: Requesting the route failed'
-                route_error_bool = True
+                    route_error = 'Success'
+                    route_error_bool = False
             
-            #print(route_error)
             try:
                 if not route_data['plan']['itineraries']: # check if response is empty
                     route_error = 'Error: Empty response route'
@@ -325,197 +391,43 @@ class OtpRoutes(QgsProcessingAlgorithm):
             except:
                 pass
                 
-            #print(route_data)
             # Reading response
+            attributes[:n_source_fields] = source_feature.attributes() # Copy source attributes from source layer
             if route_error_bool == False:
-                # Get general informations. Note that not all are available in all responses: use try/except
-                try:
-                    route_from_lat = route_data['plan']['from']['lat']
-                    route_from_lon = route_data['plan']['from']['lon']
-                except:
-                    route_from_lat = notavailableint
-                    route_from_lon = notavailableint
-                try:
-                    route_from_stopid = route_data['plan']['from']['stopId']
-                except:
-                    route_from_stopid = notavailablestring
-                try:
-                    route_from_stopcode = route_data['plan']['from']['stopCode']
-                except:
-                    route_from_stopcode = notavailablestring
-                try:
-                    route_from_name = route_data['plan']['from']['name']
-                except:
-                    route_from_name = notavailablestring
-                try:
-                    route_to_lat = route_data['plan']['to']['lat']
-                    route_to_lon = route_data['plan']['to']['lon']
-                except:
-                    route_to_lat = notavailableint
-                    route_to_lon = notavailableint
-                try:
-                    route_to_stopid = route_data['plan']['to']['stopId']
-                except:
-                    route_to_stopid = notavailablestring
-                try:
-                    route_to_stopcode = route_data['plan']['to']['stopCode']
-                except:
-                    route_to_stopcode = notavailablestring
-                try:
-                    route_to_name = route_data['plan']['to']['name']
-                except:
-                    route_to_name = notavailablestring
+                # Get general informations. Note that not all are available in all responses: missing ones become None
+                fill_attributes(route_data, plan_fields, attributes)
                 
                 # loop through iterinaries    
                 for iter in route_data['plan']['itineraries']: 
                     route_routeid += 1
-                    try:
-                        route_from_starttime = iter['startTime']
-                        route_from_starttime = datetime.fromtimestamp(int(route_from_starttime)/1000)
-                        route_from_starttime = QDateTime.fromString(str(route_from_starttime),'yyyy-MM-dd hh:mm:ss')
-                    except:
-                        route_from_starttime = notavailableothers
-                    try:
-                        route_to_endtime = iter['endTime']
-                        route_to_endtime = datetime.fromtimestamp(int(route_to_endtime)/1000)
-                        route_to_endtime = QDateTime.fromString(str(route_to_endtime),'yyyy-MM-dd hh:mm:ss')
-                    except:
-                        route_to_endtime = notavailableothers
-                    try:
-                        route_total_duration = iter['duration']
-                    except:
-                        route_total_duration = notavailableint
+                    fill_attributes(iter, itinerary_fields, attributes)
                     route_total_distance = 0 # set to 0 on start of each new route, well take the sum of all legs of a route
-                    route_total_mode = travelmode
-                    try:
-                        route_total_transittime = iter['transitTime']
-                    except:
-                        route_total_transittime = notavailableint
-                    try:
-                        route_total_waitingtime = iter['waitingTime']
-                    except:
-                        route_total_waitingtime = notavailableint
-                    try:
-                        route_total_walktime = iter['walkTime']
-                    except:
-                        route_total_walktime = notavailableint
-                    try:
-                        route_total_walkdistance = iter['walkDistance']
-                    except:
-                        route_total_walkdistance = notavailableint
-                    try:
-                        route_total_transfers = iter['transfers']
-                    except:
-                        route_total_transfers = notavailableint
-                    #print('From lat: ' + str(route_total_duration))
+                    attributes[fieldindex_position_of_routetotalmode] = travelmode
                     
                     # loop through legs --> they will become the features of our layer
                     route_leg_totaldistcounter = 0 # set to 0 on start of each new route
                     for leg in iter['legs']: 
                         route_legid += 1
                         new_feature = QgsFeature(fields)
-                        
-                        try:
-                            route_leg_starttime = leg['startTime']
-                            route_leg_starttime = datetime.fromtimestamp(int(route_leg_starttime)/1000)
-                            route_leg_starttime = QDateTime.fromString(str(route_leg_starttime),'yyyy-MM-dd hh:mm:ss')
-                        except:
-                            route_leg_starttime = notavailableothers
-                        try:
-                            route_leg_departuredelay = leg['departureDelay']
-                        except:
-                            route_leg_departuredelay = notavailableint
-                        try:
-                            route_leg_endtime = leg['endTime']
-                            route_leg_endtime = datetime.fromtimestamp(int(route_leg_endtime)/1000)
-                            route_leg_endtime = QDateTime.fromString(str(route_leg_endtime),'yyyy-MM-dd hh:mm:ss')
-                        except:
-                            route_leg_endtime = notavailableothers
-                        try:
-                            route_leg_arrivaldelay = leg['arrivalDelay']
-                        except:
-                            route_leg_arrivaldelay = notavailableint
-                        try:
-                            route_leg_duration = leg['duration']
-                        except:
-                            route_leg_duration = notavailableint
-                        try:
-                            route_leg_distance = leg['distance']
-                            #route_total_distance += route_leg_distance # Field does not exist in response. Build sum of all legs
+                        fill_attributes(leg, leg_fields, attributes)
+                        if 'distance' in leg:
+                            #route_total_distance += leg['distance'] # Field does not exist in response. Build sum of all legs
                             route_total_distance = None
-                        except:
-                            route_leg_distance = notavailableint
-                            #route_total_distance += 0 # Field does not exist in response.....
-                        try:
-                            route_leg_mode = leg['mode']
-                        except:
-                            route_leg_mode = notavailablestring
-                        try:
-                            route_leg_from_lat = leg['from']['lat']
-                            route_leg_from_lon = leg['from']['lon']
-                        except:
-                            route_leg_from_lat = notavailableint
-                            route_leg_from_lon = notavailableint
-                        try:
-                            route_leg_from_stopid = leg['from']['stopId']
-                        except:
-                            route_leg_from_stopid = notavailablestring
-                        try:
-                            route_leg_from_stopcode = leg['from']['stopCode']
-                        except:
-                            route_leg_from_stopcode = notavailablestring
-                        try:
-                            route_leg_from_name = leg['from']['name']
-                        except:
-                            route_leg_from_name = notavailablestring
-                        try:
-                            route_leg_from_departure = leg['from']['departure']
-                            route_leg_from_departure = datetime.fromtimestamp(int(route_leg_from_departure)/1000)
-                            route_leg_from_departure = QDateTime.fromString(str(route_leg_from_departure),'yyyy-MM-dd hh:mm:ss')
-                        except:
-                            route_leg_from_departure = notavailableothers
-                        try:
-                            route_leg_to_lat = leg['to']['lat']
-                            route_leg_to_lon = leg['to']['lon']
-                        except:
-                            route_leg_to_lat = notavailableint
-                            route_leg_to_lon = notavailableint
-                        try:
-                            route_leg_to_stopid = leg['to']['stopId']
-                        except:
-                            route_leg_to_stopid = notavailablestring
-                        try:
-                            route_leg_to_stopcode = leg['to']['stopCode']
-                        except:
-                            route_leg_to_stopcode = notavailablestring
-                        try:
-                            route_leg_to_name = leg['to']['name']
-                        except:
-                            route_leg_to_name = notavailablestring
-                        try:
-                            route_leg_to_arrival = leg['to']['arrival']
-                            route_leg_to_arrival = datetime.fromtimestamp(int(route_leg_to_arrival)/1000)
-                            route_leg_to_arrival = QDateTime.fromString(str(route_leg_to_arrival),'yyyy-MM-dd hh:mm:ss')
-                        except:
-                            route_leg_to_arrival = notavailableothers
                         
                         try:
                             route_leg_encodedpolylinestring = leg['legGeometry']['points']
-                            route_leg_decodedpolylinestring_aspointlist = self.decode_polyline(route_leg_encodedpolylinestring)
-                            new_feature.setGeometry(QgsGeometry.fromPolyline(route_leg_decodedpolylinestring_aspointlist))
+                            new_feature.setGeometry(self.decode_polyline(route_leg_encodedpolylinestring, polyline_precision))
                         except:
                             new_feature.setGeometry(QgsGeometry.fromPolyline(errorlinegeom))
                             route_error = 'Error: Decoding route geometry failed'
                         
                         # Adding the attributes to resultlayer
-                        for key, value in fieldindexdict.items(): # keys contain the fieldindex, values the variablename which is the same as the fieldname, just in lowercase
-                            fieldindex = key
-                            if key < n_source_fields: # Copy source attributes from source layer
-                                fieldvalue = source_feature[fieldindex] # source_feature = sourcelayer-feature, new_feature = new feature
-                            else: # Get the leg attributes from variables
-                                fieldvalue = locals()[value] # variables are named exactly as the fieldnames, just lowercase, we adjusted that before
-                            new_feature.setAttribute(fieldindex,fieldvalue)
+                        attributes[fieldindex_position_of_first_alwaysneededfield:fieldindex_position_of_last_alwaysneededfield + 1] = [
+                            route_legid, route_routeid, route_relationid, route_from, route_to, route_error, route_errorid, route_errordescription, route_url]
+                        attributes[fieldindex_position_of_routetotaldistance] = route_total_distance
+                        new_feature.setAttributes(attributes)
                         sink.addFeature(new_feature, QgsFeatureSink.FastInsert) # add feature to the output
+                        relation_features.append(new_feature)
                         route_leg_totaldistcounter += 1 # counting the number of legs of a route
                         # END OF LOOP legs
                         
@@ -523,14 +435,11 @@ class OtpRoutes(QgsProcessingAlgorithm):
                     #attr_totaldistance = { fieldindex_position_of_routetotaldistance : route_total_distance } # only change totaldistance field, we get its position while building the dict
                     #last_featureid_totaldistance = new_feature.id() # the last featureid of a route = current feature
                     #first_featureid_totaldistance = last_featureid_totaldistance - route_leg_totaldistcounter + 1 # the first featureid of a route
-                    #print('last: ' + str(last_featureid_totaldistance))
-                    #print('first: ' + str(first_featureid_totaldistance))
                     #for features_before in range(first_featureid_totaldistance,last_featureid_totaldistance): # loop through all legs of the current route
                         #new_feature.setAttribute(fieldindex_position_of_routetotaldistance,route_total_distance)
                         #dings = new_feature.id(features_before)
                         #dings.setAttribute(fieldindex_position_of_routetotaldistance,route_total_distance)
                         #new_feature.id(features_before)[fieldindex_position_of_routetotaldistance] = route_total_distance
-                        #print(new_feature.id(features_before))
                         #routes_memorylayer_pr.changeAttributeValues({ features_before : attr_totaldistance }) # add the leg-sum of all legs of a route as totaldistance
                     # END OF LOOP iterinaries
                     
@@ -547,39 +456,38 @@ class OtpRoutes(QgsProcessingAlgorithm):
                     route_errordescription = route_data['error']['msg']
                 except:
                     route_errordescription = notavailablestring
-                try:
-                    route_errormessage = route_data['error']['message']
-                except:
-                    route_errormessage = notavailablestring
-                try:
-                    route_errornopath = route_data['error']['noPath']
-                except:
-                    route_errornopath = notavailablestring
                 
                 # Create dummy-geometry
                 new_feature.setGeometry(QgsGeometry.fromPolyline(errorlinegeom))
-                # Adding the attributes to resultlayer
-                for key, value in fieldindexdict.items(): # keys contain the fieldindex, values the variablename which is the same as the fieldname, just in lowercase
-                    fieldindex = key
-                    if fieldindex < n_source_fields: # copy attributes from source layer
-                        fieldvalue = source_feature[fieldindex]
-                        new_feature[fieldindex] = fieldvalue
-                    elif fieldindex <= fieldindex_position_of_last_alwaysneededfield: # Only fill the first fields on error
-                        fieldvalue = locals()[value]
-                        new_feature[fieldindex] = fieldvalue
-                    else: # Leave the others empty as there is no data available
-                        fieldvalue = None
-                        new_feature[fieldindex] = fieldvalue
-                        
+                # Adding the attributes to resultlayer: only fill the first fields on error, leave the others empty as there is no data available
+                attributes[fieldindex_position_of_first_alwaysneededfield:fieldindex_position_of_last_alwaysneededfield + 1] = [
+                    route_legid, route_routeid, route_relationid, route_from, route_to, route_error, route_errorid, route_errordescription, route_url]
+                attributes[fieldindex_position_of_last_alwaysneededfield + 1:] = [None] * (len(attributes) - fieldindex_position_of_last_alwaysneededfield - 1)
+                new_feature.setAttributes(attributes)
                 sink.addFeature(new_feature, QgsFeatureSink.FastInsert) # add feature to the output
+                relation_features.append(new_feature)
                 # END OF errorroutecreation
                 
+            if checkpoint_journal is not None and not request_failed:
+                checkpoint_journal.record(route_relationid, route_url, relation_features, n_source_fields)
+            
             
             if feedback.isCanceled(): # Cancel algorithm if button is pressed
                 break
             
             feedback.setProgress(int(current * total)) # Set Progress in Progressbar
 
+        route_engine.close()
+        if route_engine.scheduler.retry_count:
+            feedback.setProgressText(str(route_engine.scheduler.retry_count) + ' requests retried after temporary failures')
+        if adaptive_concurrency:
+            feedback.setProgressText('Number of parallel requests at the end: ' + str(route_engine.scheduler.limit) + ' (reduced ' + str(route_engine.scheduler.limit_decreases) + ' times)')
+        if route_cache is not None:
+            feedback.setProgressText(str(route_cache.hits) + ' responses taken from cache, ' + str(route_cache.stored) + ' responses stored in cache')
+            route_cache.close()
+        if checkpoint_journal is not None:
+            checkpoint_journal.close()
+        
         return {self.OUTPUT: dest_id} # Return result of algorithm
 
 
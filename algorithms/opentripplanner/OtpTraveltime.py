@@ -22,14 +22,13 @@ License: GNU General Public License v3.0
 from PyQt5.QtCore import QCoreApplication, QVariant, QDate, QTime, QDateTime, Qt
 from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsGeometry, QgsPoint, QgsFields, QgsWkbTypes, QgsCoordinateReferenceSystem, QgsDateTimeFieldFormatter,
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm,
-                       QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterString, QgsProcessingParameterNumber)
+                       QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterString, QgsProcessingParameterNumber, QgsProcessingParameterBoolean)
 from osgeo import ogr
 from datetime import *
 import os.path
 import os
-import urllib.request
-import urllib
-import json
+from .OtpRequestEngine import OtpRequestEngine
+from .OtpResponseCache import OtpResponseCache
 
 class OtpTraveltime(QgsProcessingAlgorithm):
     
@@ -45,6 +44,16 @@ class OtpTraveltime(QgsProcessingAlgorithm):
     OPTIMIZE = 'OPTIMIZE'
     ADDITIONAL_PARAMS = 'ADDITIONAL_PARAMS'
     ITERINARIES = 'ITERINARIES'
+    DEDUPLICATE = 'DEDUPLICATE'
+    MAX_WORKERS = 'MAX_WORKERS'
+    MAX_REQUESTS_PER_SECOND = 'MAX_REQUESTS_PER_SECOND'
+    ADAPTIVE_CONCURRENCY = 'ADAPTIVE_CONCURRENCY'
+    TIMEOUT = 'TIMEOUT'
+    RETRIES = 'RETRIES'
+    GZIP = 'GZIP'
+    CACHE_MODE = 'CACHE_MODE'
+    CACHE_TTL = 'CACHE_TTL'
+    CACHE_MAX_ENTRIES = 'CACHE_MAX_ENTRIES'
     OUTPUT = 'OUTPUT'
 
     def initAlgorithm(self, config=None):
@@ -87,6 +96,37 @@ class OtpTraveltime(QgsProcessingAlgorithm):
         self.addParameter(
             QgsProcessingParameterNumber(
                 self.ITERINARIES, self.tr('Number of Iterinaries'),type=0,defaultValue=1,minValue=1))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.DEDUPLICATE, self.tr('Request identical routes (same start, end, date, time and parameters) only once and copy the result to all their features'),defaultValue=True))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_WORKERS, self.tr('Number of parallel requests (1 means one request after another)'),type=0,defaultValue=1,minValue=1,maxValue=64))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_REQUESTS_PER_SECOND, self.tr('Maximum number of requests per second (0 means no limit)'),type=1,defaultValue=0,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.ADAPTIVE_CONCURRENCY, self.tr('Adapt the number of parallel requests to the server (send fewer requests while its response times rise)'),defaultValue=False))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.TIMEOUT, self.tr('Timeout per request in seconds (0 means no timeout)'),type=1,defaultValue=0,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.RETRIES, self.tr('Number of retries for temporary failures (timeouts, lost connections, server busy), waiting longer before each retry (0 means no retries)'),type=0,defaultValue=0,minValue=0,maxValue=10))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.GZIP, self.tr('Request gzip-compressed responses (less data to transfer, a little more work to unpack)'),defaultValue=False))
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.CACHE_MODE, self.tr('Local response cache (reruns with the same requests do not query the server again)'),
+                ['Do not use cache','Use cache','Bypass cache (query the server and refresh the cached responses)','Purge cache before running, then use it'],defaultValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CACHE_TTL, self.tr('Hours until a cached response expires (0 means never)'),type=1,defaultValue=168,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CACHE_MAX_ENTRIES, self.tr('Maximum number of cached responses (least recently used ones are removed first)'),type=0,defaultValue=100000,minValue=1))
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 self.OUTPUT, self.tr('OTP Traveltime'))) # Output
@@ -112,6 +152,16 @@ class OtpTraveltime(QgsProcessingAlgorithm):
         
         additional_params = self.parameterAsString(parameters, self.ADDITIONAL_PARAMS, context)
         iterinaries = self.parameterAsInt(parameters, self.ITERINARIES, context)
+        deduplicate = self.parameterAsBool(parameters, self.DEDUPLICATE, context)
+        max_workers = self.parameterAsInt(parameters, self.MAX_WORKERS, context)
+        max_requests_per_second = self.parameterAsDouble(parameters, self.MAX_REQUESTS_PER_SECOND, context)
+        adaptive_concurrency = self.parameterAsBool(parameters, self.ADAPTIVE_CONCURRENCY, context)
+        request_timeout = self.parameterAsDouble(parameters, self.TIMEOUT, context)
+        request_retries = self.parameterAsInt(parameters, self.RETRIES, context)
+        use_gzip = self.parameterAsBool(parameters, self.GZIP, context)
+        cache_mode = self.parameterAsInt(parameters, self.CACHE_MODE, context)
+        cache_ttl = self.parameterAsDouble(parameters, self.CACHE_TTL, context)
+        cache_max_entries = self.parameterAsInt(parameters, self.CACHE_MAX_ENTRIES, context)
         
         total = 100.0 / source_layer.featureCount() if source_layer.featureCount() else 0 # Initialize progress for progressbar
         
@@ -168,82 +218,87 @@ class OtpTraveltime(QgsProcessingAlgorithm):
         
         # some general settings
         route_headers = {"accept":"application/json"} # this plugin only works for json responses
+        route_cache = None
+        if cache_mode != 0:
+            route_cache = OtpResponseCache(OtpResponseCache.default_path(), cache_ttl * 3600, cache_max_entries)
+            if cache_mode == 3:
+                feedback.setProgressText('Purging response cache...')
+                route_cache.purge()
+        route_engine = OtpRequestEngine(route_headers, max_workers, route_cache, cache_mode != 2, use_gzip,
+                                        max_requests_per_second, request_timeout, request_retries, adaptive_concurrency)
         
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
                                                fields, source_layer.wkbType(),
                                                source_layer.sourceCrs())
+        
+        def route_requests(): # Create URL for each feature; the requests are sent by the engine, results come back in source order
+            for source_feature in source_layer.getFeatures(): # iterate over source
+                # Making Script compatible with earlier versions than QGIS 3.18: If date or time field is a string, do not convert it to a string...
+                use_date = ''
+                use_time = ''
+                try:
+                    use_date = str(source_feature[date_field].toString('yyyy-MM-dd'))
+                except:
+                    use_date = str(source_feature[date_field])
+                try:
+                    use_time = str(source_feature[time_field].toString('HH:mm:ss'))
+                except:
+                    use_time = str(source_feature[time_field])
+                
+                # Create URL for current feature
+                route_url = (str(server_url) + "plan?" + # Add Plan request to server url
+                    "fromPlace=" + str(source_feature[startlat_field]) + "," + str(source_feature[startlon_field]) +
+                    "&toPlace=" + str(source_feature[endlat_field]) + "," + str(source_feature[endlon_field]) +
+                    "&mode=" + travelmode +
+                    "&date=" + use_date +
+                    "&time=" + use_time +
+                    "&numItineraries=" + str(iterinaries) +
+                    "&optimize=" + traveloptimize +
+                    additional_params # Additional Parameters entered as OTP-Readable string -> User responsibility
+                )
+                yield source_feature, route_url
                                                
-        for current, source_feature in enumerate(source_layer.getFeatures()): # iterate over source
+        route_url_counts = None
+        if deduplicate: # group features by their url, so every distinct route is only requested once
+            feedback.setProgressText('Searching identical requests...')
+            route_url_counts = {}
+            for source_feature, route_url in route_requests():
+                route_url_counts[route_url] = route_url_counts.get(route_url, 0) + 1
+            feedback.setProgressText(str(len(route_url_counts)) + ' distinct requests for ' + str(sum(route_url_counts.values())) + ' features')
+        
+        for current, (source_feature, route_url, route_data, route_error) in enumerate(route_engine.fetch_ordered(route_requests(), feedback, route_url_counts)):
         
             route_relationid += 1
             
-            # Making Script compatible with earlier versions than QGIS 3.18: If date or time field is a string, do not convert it to a string...
-            use_date = ''
-            use_time = ''
-            try:
-                use_date = str(source_feature[date_field].toString('yyyy-MM-dd'))
-            except:
-                use_date = str(source_feature[date_field])
-            try:
-                use_time = str(source_feature[time_field].toString('HH:mm:ss'))
-            except:
-                use_time = str(source_feature[time_field])
-            
-            # Create URL for current feature
-            route_url = (str(server_url) + "plan?" + # Add Plan request to server url
-                "fromPlace=" + str(source_feature[startlat_field]) + "," + str(source_feature[startlon_field]) +
-                "&toPlace=" + str(source_feature[endlat_field]) + "," + str(source_feature[endlon_field]) +
-                "&mode=" + travelmode +
-                "&date=" + use_date +
-                "&time=" + use_time +
-                "&numItineraries=" + str(iterinaries) +
-                "&optimize=" + traveloptimize +
-                additional_params # Additional Parameters entered as OTP-Readable string -> User responsibility
-            )
-            
             #print(route_url)
             
             # Reset Error Indicators
-            route_error = 'Success'
             route_error_bool = False
             route_errorid = None
             route_errordescription = None
             route_errormessage = None
             route_errornopath = None
 
-            try: # Try to request route
-                route_request = urllib.request.Request(route_url, headers=route_headers)
-                try: # Try to receive response
-                    route_response = urllib.request.urlopen(route_request)
-                    try: # Try to read response data
-                        response_data = route_response.read()
-                        encoding = route_response.info().get_content_charset('utf-8')
-                        route_data = json.loads(response_data.decode(encoding))
-                        try: # Check if response says Error
-                            route_error = 'Error: No Route'
-                            route_error_bool = True
-                            route_errorid = route_data['error']['id']
-                            route_errordescription = route_data['error']['msg']
-                            try: # not every error delivers this
-                                route_errormessage = route_data['error']['message']
-                            except:
-                                pass
-                            try: # not every error delivers this
-                                route_errornopath = route_data['error']['noPath']
-                            except:
-                                pass
-                        except:
-                            route_error = 'Success'
-                            route_error_bool = False
+            if route_error is not None: # Requesting or reading the route failed
+                route_error_bool = True
+            else:
+                route_error = 'Success'
+                try: # Check if response says Error
+                    route_error = 'Error: No Route'
+                    route_error_bool = True
+                    route_errorid = route_data['error']['id']
+                    route_errordescription = route_data['error']['msg']
+                    try: # not every error delivers this
+                        route_errormessage = route_data['error']['message']
+                    except:
+                        pass
+                    try: # not every error delivers this
+                        route_errornopath = route_data['error']['noPath']
                     except:
-                        route_error = 'Error: Cannot read response data'
-                        route_error_bool = True
+                        pass
                 except:
-                    route_error = 'Error: No response received'
-                    route_error_bool = True
-            except:
-                route_error = 'Error: Requesting the route failed'
-                route_error_bool = True
+                    route_error = 'Success'
+                    route_error_bool = False
             
             #print(route_error)
             try:
@@ -393,6 +448,17 @@ class OtpTraveltime(QgsProcessingAlgorithm):
             
             feedback.setProgress(int(current * total)) # Set Progress in Progressbar
 
+        route_engine.close()
+        if route_engine.scheduler.retry_count:
+            feedback.setProgressText(str(route_engine.scheduler.retry_count) + ' requests retried after temporary failures')
+        if adaptive_concurrency:
+            feedback.setProgressText('Number of parallel requests at the end: ' + str(route_engine.scheduler.limit) + ' (reduced ' + str(route_engine.scheduler.limit_decreases) + ' times)')
+        if deduplicate:
+            feedback.setProgressText(str(route_engine.requests_saved) + ' requests saved by requesting identical routes only once')
+        if route_cache is not None:
+            feedback.setProgressText(str(route_cache.hits) + ' responses taken from cache, ' + str(route_cache.stored) + ' responses stored in cache')
+            route_cache.close()
+        
         return {self.OUTPUT: dest_id} # Return result of algorithm
 
 
@@ -22,14 +22,13 @@ License: GNU General Public License v3.0
 from PyQt5.QtCore import QCoreApplication, QVariant, QDate, QTime, QDateTime, Qt
 from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsGeometry, QgsPoint, QgsFields, QgsWkbTypes, QgsCoordinateReferenceSystem, QgsDateTimeFieldFormatter,
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm,
-                       QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterString, QgsProcessingParameterNumber)
+                       QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterString, QgsProcessingParameterNumber, QgsProcessingParameterBoolean)
 from osgeo import ogr
 from datetime import *
 import os.path
 import os
-import urllib.request
-import urllib
-import json
+from .OtpRequestEngine import OtpRequestEngine
+from .OtpResponseCache import OtpResponseCache
 
 class OtpTraveltimeComparison(QgsProcessingAlgorithm):
     
@@ -48,6 +47,15 @@ class OtpTraveltimeComparison(QgsProcessingAlgorithm):
     OPTIMIZE_B = 'OPTIMIZE_B'
     ADDITIONAL_PARAMS_B = 'ADDITIONAL_PARAMS_B'
     ITERINARIES = 'ITERINARIES'
+    MAX_WORKERS = 'MAX_WORKERS'
+    MAX_REQUESTS_PER_SECOND = 'MAX_REQUESTS_PER_SECOND'
+    ADAPTIVE_CONCURRENCY = 'ADAPTIVE_CONCURRENCY'
+    TIMEOUT = 'TIMEOUT'
+    RETRIES = 'RETRIES'
+    GZIP = 'GZIP'
+    CACHE_MODE = 'CACHE_MODE'
+    CACHE_TTL = 'CACHE_TTL'
+    CACHE_MAX_ENTRIES = 'CACHE_MAX_ENTRIES'
     OUTPUT = 'OUTPUT'
 
     def initAlgorithm(self, config=None):
@@ -101,6 +109,34 @@ class OtpTraveltimeComparison(QgsProcessingAlgorithm):
         self.addParameter(
             QgsProcessingParameterNumber(
                 self.ITERINARIES, self.tr('Number of Iterinaries (currently only possible with 1)'),type=0,defaultValue=1,minValue=1,maxValue=1))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_WORKERS, self.tr('Number of parallel requests (1 means one request after another, 2 requests route A and B of a feature at the same time)'),type=0,defaultValue=2,minValue=1,maxValue=64))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_REQUESTS_PER_SECOND, self.tr('Maximum number of requests per second (0 means no limit)'),type=1,defaultValue=0,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.ADAPTIVE_CONCURRENCY, self.tr('Adapt the number of parallel requests to the server (send fewer requests while its response times rise)'),defaultValue=False))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.TIMEOUT, self.tr('Timeout per request in seconds (0 means no timeout)'),type=1,defaultValue=0,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.RETRIES, self.tr('Number of retries for temporary failures (timeouts, lost connections, server busy), waiting longer before each retry (0 means no retries)'),type=0,defaultValue=0,minValue=0,maxValue=10))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.GZIP, self.tr('Request gzip-compressed responses (less data to transfer, a little more work to unpack)'),defaultValue=False))
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.CACHE_MODE, self.tr('Local response cache (reruns with the same requests do not query the server again)'),
+                ['Do not use cache','Use cache','Bypass cache (query the server and refresh the cached responses)','Purge cache before running, then use it'],defaultValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CACHE_TTL, self.tr('Hours until a cached response expires (0 means never)'),type=1,defaultValue=168,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CACHE_MAX_ENTRIES, self.tr('Maximum number of cached responses (least recently used ones are removed first)'),type=0,defaultValue=100000,minValue=1))
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 self.OUTPUT, self.tr('OTP TraveltimeComparison'))) # Output
@@ -130,6 +166,15 @@ class OtpTraveltimeComparison(QgsProcessingAlgorithm):
         additional_params_a = self.parameterAsString(parameters, self.ADDITIONAL_PARAMS_A, context)
         additional_params_b = self.parameterAsString(parameters, self.ADDITIONAL_PARAMS_B, context)
         iterinaries = self.parameterAsInt(parameters, self.ITERINARIES, context)
+        max_workers = self.parameterAsInt(parameters, self.MAX_WORKERS, context)
+        max_requests_per_second = self.parameterAsDouble(parameters, self.MAX_REQUESTS_PER_SECOND, context)
+        adaptive_concurrency = self.parameterAsBool(parameters, self.ADAPTIVE_CONCURRENCY, context)
+        request_timeout = self.parameterAsDouble(parameters, self.TIMEOUT, context)
+        request_retries = self.parameterAsInt(parameters, self.RETRIES, context)
+        use_gzip = self.parameterAsBool(parameters, self.GZIP, context)
+        cache_mode = self.parameterAsInt(parameters, self.CACHE_MODE, context)
+        cache_ttl = self.parameterAsDouble(parameters, self.CACHE_TTL, context)
+        cache_max_entries = self.parameterAsInt(parameters, self.CACHE_MAX_ENTRIES, context)
         
         total = 100.0 / source_layer.featureCount() if source_layer.featureCount() else 0 # Initialize progress for progressbar
         
@@ -183,49 +228,74 @@ class OtpTraveltimeComparison(QgsProcessingAlgorithm):
         
         # some general settings
         route_headers = {"accept":"application/json"} # this plugin only works for json responses
+        route_cache = None
+        if cache_mode != 0:
+            route_cache = OtpResponseCache(OtpResponseCache.default_path(), cache_ttl * 3600, cache_max_entries)
+            if cache_mode == 3:
+                feedback.setProgressText('Purging response cache...')
+                route_cache.purge()
+        route_engine = OtpRequestEngine(route_headers, max_workers, route_cache, cache_mode != 2, use_gzip,
+                                        max_requests_per_second, request_timeout, request_retries, adaptive_concurrency)
         
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
                                                fields, source_layer.wkbType(),
                                                source_layer.sourceCrs())
                                                
-        for current, source_feature in enumerate(source_layer.getFeatures()): # iterate over source
-        
-            route_relationid += 1
+        def route_requests(): # Create URLs for each feature, route A and B one after the other; the requests are sent by the engine in parallel, results come back in source order
+            for source_feature in source_layer.getFeatures(): # iterate over source
+                # Making Script compatible with earlier versions than QGIS 3.18: If date or time field is a string, do not convert it to a string...
+                use_date = ''
+                use_time = ''
+                try:
+                    use_date = str(source_feature[date_field].toString('yyyy-MM-dd'))
+                except:
+                    use_date = str(source_feature[date_field])
+                try:
+                    use_time = str(source_feature[time_field].toString('HH:mm:ss'))
+                except:
+                    use_time = str(source_feature[time_field])
             
-            # Making Script compatible with earlier versions than QGIS 3.18: If date or time field is a string, do not convert it to a string...
-            use_date = ''
-            use_time = ''
-            try:
-                use_date = str(source_feature[date_field].toString('yyyy-MM-dd'))
-            except:
-                use_date = str(source_feature[date_field])
-            try:
-                use_time = str(source_feature[time_field].toString('HH:mm:ss'))
-            except:
-                use_time = str(source_feature[time_field])
+                # Create URL for current feature
+                route_a_url = (str(server_url) + "plan?" + # Add Plan request to server url
+                    "fromPlace=" + str(source_feature[startlat_field]) + "," + str(source_feature[startlon_field]) +
+                    "&toPlace=" + str(source_feature[endlat_field]) + "," + str(source_feature[endlon_field]) +
+                    "&mode=" + travelmode_a +
+                    "&date=" + use_date +
+                    "&time=" + use_time +
+                    "&numItineraries=" + str(iterinaries) +
+                    "&optimize=" + traveloptimize_a +
+                    additional_params_a # Additional Parameters entered as OTP-Readable string -> User responsibility
+                )
             
-            # Create URL for current feature
-            route_a_url = (str(server_url) + "plan?" + # Add Plan request to server url
-                "fromPlace=" + str(source_feature[startlat_field]) + "," + str(source_feature[startlon_field]) +
-                "&toPlace=" + str(source_feature[endlat_field]) + "," + str(source_feature[endlon_field]) +
-                "&mode=" + travelmode_a +
-                "&date=" + use_date +
-                "&time=" + use_time +
-                "&numItineraries=" + str(iterinaries) +
-                "&optimize=" + traveloptimize_a +
-                additional_params_a # Additional Parameters entered as OTP-Readable string -> User responsibility
-            )
+                route_b_url = (str(server_url) + "plan?" + # Add Plan request to server url
+                    "fromPlace=" + str(source_feature[startlat_field]) + "," + str(source_feature[startlon_field]) +
+                    "&toPlace=" + str(source_feature[endlat_field]) + "," + str(source_feature[endlon_field]) +
+                    "&mode=" + travelmode_b +
+                    "&date=" + use_date +
+                    "&time=" + use_time +
+                    "&numItineraries=" + str(iterinaries) +
+                    "&optimize=" + traveloptimize_b +
+                    additional_params_b # Additional Parameters entered as OTP-Readable string -> User responsibility
+                )
             
-            route_b_url = (str(server_url) + "plan?" + # Add Plan request to server url
-                "fromPlace=" + str(source_feature[startlat_field]) + "," + str(source_feature[startlon_field]) +
-                "&toPlace=" + str(source_feature[endlat_field]) + "," + str(source_feature[endlon_field]) +
-                "&mode=" + travelmode_b +
-                "&date=" + use_date +
-                "&time=" + use_time +
-                "&numItineraries=" + str(iterinaries) +
-                "&optimize=" + traveloptimize_b +
-                additional_params_b # Additional Parameters entered as OTP-Readable string -> User responsibility
-            )
+                yield source_feature, route_a_url
+                yield source_feature, route_b_url
+        
+        def route_results(): # Pairs the results of route A and B of each feature again
+            ordered_results = route_engine.fetch_ordered(route_requests(), feedback)
+            try:
+                for source_feature, route_a_url, route_a_data, route_a_fetch_error in ordered_results:
+                    try:
+                        source_feature, route_b_url, route_b_data, route_b_fetch_error = next(ordered_results)
+                    except StopIteration: # canceled between route A and B
+                        return
+                    yield source_feature, route_a_url, route_a_data, route_a_fetch_error, route_b_url, route_b_data, route_b_fetch_error
+            finally:
+                ordered_results.close()
+                                               
+        for current, (source_feature, route_a_url, route_a_data, route_a_fetch_error, route_b_url, route_b_data, route_b_fetch_error) in enumerate(route_results()):
+        
+            route_relationid += 1
             
             # Reset Error Indicators
             route_a_error = 'Success'
@@ -241,39 +311,26 @@ class OtpTraveltimeComparison(QgsProcessingAlgorithm):
             route_b_errormessage = None
             route_b_errornopath = None
             
-            try: # Try to request route a
-                route_a_request = urllib.request.Request(route_a_url, headers=route_headers)
-                try: # Try to receive response
-                    route_a_response = urllib.request.urlopen(route_a_request)
-                    try: # Try to read response data
-                        response_a_data = route_a_response.read()
-                        encoding_a = route_a_response.info().get_content_charset('utf-8')
-                        route_a_data = json.loads(response_a_data.decode(encoding_a))
-                        try: # Check if response says Error
-                            route_a_error = 'Error: No Route'
-                            route_a_error_bool = True
-                            route_a_errorid = route_a_data['error']['id']
-                            route_a_errordescription = route_a_data['error']['msg']
-                            try: # not every error delivers this
-                                route_a_errormessage = route_a_data['error']['message']
-                            except:
-                                pass
-                            try: # not every error delivers this
-                                route_a_errornopath = route_a_data['error']['noPath']
-                            except:
-                                pass
-                        except:
-                            route_a_error = 'Success'
-                            route_a_error_bool = False
+            if route_a_fetch_error is not None: # Requesting or reading the route failed
+                route_a_error = route_a_fetch_error
+                route_a_error_bool = True
+            else:
+                try: # Check if response says Error
+                    route_a_error = 'Error: No Route'
+                    route_a_error_bool = True
+                    route_a_errorid = route_a_data['error']['id']
+                    route_a_errordescription = route_a_data['error']['msg']
+                    try: # not every error delivers this
+                        route_a_errormessage = route_a_data['error']['message']
+                    except:
+                        pass
+                    try: # not every error delivers this
+                        route_a_errornopath = route_a_data['error']['noPath']
                     except:
-                        route_a_error = 'Error: Cannot read response data'
-                        route_a_error_bool = True
+                        pass
                 except:
-                    route_a_error = 'Error: No response received'
-                    route_a_error_bool = True
-            except:
-                route_a_error = 'Error: Requesting the route failed'
-                route_a_error_bool = True
+                    route_a_error = 'Success'
+                    route_a_error_bool = False
             
             try:
                 if not route_a_data['plan']['itineraries']: # check if response is empty
@@ -283,39 +340,26 @@ class OtpTraveltimeComparison(QgsProcessingAlgorithm):
                 pass
             
             
-            try: # Try to request route b
-                route_b_request = urllib.request.Request(route_b_url, headers=route_headers)
-                try: # Try to receive response
-                    route_b_response = urllib.request.urlopen(route_b_request)
-                    try: # Try to read response data
-                        response_b_data = route_b_response.read()
-                        encoding_b = route_b_response.info().get_content_charset('utf-8')
-                        route_b_data = json.loads(response_b_data.decode(encoding_b))
-                        try: # Check if response says Error
-                            route_b_error = 'Error: No Route'
-                            route_b_error_bool = True
-                            route_b_errorid = route_b_data['error']['id']
-                            route_b_errordescription = route_b_data['error']['msg']
-                            try: # not every error delivers this
-                                route_b_errormessage = route_b_data['error']['message']
-                            except:
-                                pass
-                            try: # not every error delivers this
-                                route_b_errornopath = route_b_data['error']['noPath']
-                            except:
-                                pass
-                        except:
-                            route_b_error = 'Success'
-                            route_b_error_bool = False
+            if route_b_fetch_error is not None: # Requesting or reading the route failed
+                route_b_error = route_b_fetch_error
+                route_b_error_bool = True
+            else:
+                try: # Check if response says Error
+                    route_b_error = 'Error: No Route'
+                    route_b_error_bool = True
+                    route_b_errorid = route_b_data['error']['id']
+                    route_b_errordescription = route_b_data['error']['msg']
+                    try: # not every error delivers this
+                        route_b_errormessage = route_b_data['error']['message']
+                    except:
+                        pass
+                    try: # not every error delivers this
+                        route_b_errornopath = route_b_data['error']['noPath']
                     except:
-                        route_b_error = 'Error: Cannot read response data'
-                        route_b_error_bool = True
+                        pass
                 except:
-                    route_b_error = 'Error: No response received'
-                    route_b_error_bool = True
-            except:
-                route_b_error = 'Error: Requesting the route failed'
-                route_b_error_bool = True
+                    route_b_error = 'Success'
+                    route_b_error_bool = False
             
             try:
                 if not route_b_data['plan']['itineraries']: # check if response is empty
@@ -427,7 +471,7 @@ class OtpTraveltimeComparison(QgsProcessingAlgorithm):
                     route_faster_modewinner = 'A: ' + travelmode_a
                     route_faster_timegain = route_b_total_duration - route_a_total_duration
                     route_faster_savedtransfers = route_b_total_transfers - route_a_total_transfers
-                elif route_b_total_duration == route_b_total_duration:
+                elif route_a_total_duration == route_b_total_duration:
                     route_faster_modewinner = 'EQUAL'
                     route_faster_timegain = 0
                     if (route_a_total_transfers - route_b_total_transfers) < 0:
@@ -459,6 +503,15 @@ class OtpTraveltimeComparison(QgsProcessingAlgorithm):
             
             feedback.setProgress(int(current * total)) # Set Progress in Progressbar
 
+        route_engine.close()
+        if route_engine.scheduler.retry_count:
+            feedback.setProgressText(str(route_engine.scheduler.retry_count) + ' requests retried after temporary failures')
+        if adaptive_concurrency:
+            feedback.setProgressText('Number of parallel requests at the end: ' + str(route_engine.scheduler.limit) + ' (reduced ' + str(route_engine.scheduler.limit_decreases) + ' times)')
+        if route_cache is not None:
+            feedback.setProgressText(str(route_cache.hits) + ' responses taken from cache, ' + str(route_cache.stored) + ' responses stored in cache')
+            route_cache.close()
+        
         return {self.OUTPUT: dest_id} # Return result of algorithm
 
 
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from PyQt5.QtCore import QCoreApplication, QVariant, QDateTime
+from qgis.core import (QgsField, QgsFields, QgsFeature, QgsProcessing, QgsWkbTypes, QgsCoordinateReferenceSystem, QgsCoordinateTransform,
+                       QgsFeatureSink, QgsProcessingAlgorithm,
+                       QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterString, QgsProcessingParameterNumber, QgsProcessingParameterBoolean, QgsProcessingParameterDateTime)
+import math
+from .OtpRequestEngine import OtpRequestEngine
+from .OtpResponseCache import OtpResponseCache
+
+class OtpTraveltimeMatrix(QgsProcessingAlgorithm):
+
+    SERVER_URL = 'SERVER_URL'
+    ORIGIN_LYR = 'ORIGIN_LYR'
+    ORIGIN_ID_FIELD = 'ORIGIN_ID_FIELD'
+    DESTINATION_LYR = 'DESTINATION_LYR'
+    DESTINATION_ID_FIELD = 'DESTINATION_ID_FIELD'
+    DATETIME = 'DATETIME'
+    MODE = 'MODE'
+    OPTIMIZE = 'OPTIMIZE'
+    ADDITIONAL_PARAMS = 'ADDITIONAL_PARAMS'
+    ITERINARIES = 'ITERINARIES'
+    MAX_TRAVELTIME = 'MAX_TRAVELTIME'
+    MAX_SPEED = 'MAX_SPEED'
+    OUTPUT_FORMAT = 'OUTPUT_FORMAT'
+    MAX_WORKERS = 'MAX_WORKERS'
+    MAX_REQUESTS_PER_SECOND = 'MAX_REQUESTS_PER_SECOND'
+    ADAPTIVE_CONCURRENCY = 'ADAPTIVE_CONCURRENCY'
+    TIMEOUT = 'TIMEOUT'
+    RETRIES = 'RETRIES'
+    GZIP = 'GZIP'
+    CACHE_MODE = 'CACHE_MODE'
+    CACHE_TTL = 'CACHE_TTL'
+    CACHE_MAX_ENTRIES = 'CACHE_MAX_ENTRIES'
+    OUTPUT = 'OUTPUT'
+
+    # Speeds no trip of this mode gets faster than (km/h), used to skip pairs that are too far away for the maximum traveltime
+    MAX_SPEED_BY_MODE = {'WALK': 7, 'CAR': 150, 'BICYCLE': 35, 'TRANSIT': 300, 'WALK,TRANSIT': 300, 'WALK,BICYCLE': 35}
+
+    def initAlgorithm(self, config=None):
+
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.SERVER_URL, self.tr('URL to OTP-Server including port and path to router ending with an /'),'http://localhost:8080/otp/routers/default/'))
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.ORIGIN_LYR, self.tr('Origins (lines and polygons are represented by their centroid)'), [QgsProcessing.TypeVectorAnyGeometry]))
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.ORIGIN_ID_FIELD, self.tr('Origin ID field (if empty the feature id is used)'),parentLayerParameterName='ORIGIN_LYR',optional=True))
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.DESTINATION_LYR, self.tr('Destinations (lines and polygons are represented by their centroid)'), [QgsProcessing.TypeVectorAnyGeometry]))
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.DESTINATION_ID_FIELD, self.tr('Destination ID field (if empty the feature id is used)'),parentLayerParameterName='DESTINATION_LYR',optional=True))
+        self.addParameter(
+            QgsProcessingParameterDateTime(
+                self.DATETIME, self.tr('Date and time of tripstart (or tripend, if arriveBy=true is set in the additional parameters)'),defaultValue=QDateTime.currentDateTime()))
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.MODE, self.tr('Travelmode for Routes'),
+                ['WALK','CAR','BICYCLE','TRANSIT','WALK,TRANSIT','WALK,BICYCLE'],defaultValue=4))
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.OPTIMIZE, self.tr('Preferred Route Optimization'),
+                ['QUICK','TRANSFERS','SAFE','FLAT','GREENWAYS','TRIANGLE'],defaultValue=0))
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.ADDITIONAL_PARAMS, self.tr('Additional Parameters as String, beginning with an & Sign'),'&maxTransfers=6&maxWalkDistance=10000&maxOffroadDistance=500',optional=True))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.ITERINARIES, self.tr('Number of Iterinaries (the fastest one is used)'),type=0,defaultValue=1,minValue=1))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_TRAVELTIME, self.tr('Maximum traveltime in minutes (0 means no limit); pairs taking longer are left out'),type=1,defaultValue=0,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_SPEED, self.tr('Maximum speed in km/h as the crow flies, pairs too far away to be reached within the maximum traveltime are not requested (0 means depending on travelmode)'),type=1,defaultValue=0,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.OUTPUT_FORMAT, self.tr('Output format'),
+                ['Long (one row per origin and destination)','Wide (one row per origin, one traveltime field per destination)'],defaultValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_WORKERS, self.tr('Number of parallel requests (1 means one request after another)'),type=0,defaultValue=4,minValue=1,maxValue=64))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_REQUESTS_PER_SECOND, self.tr('Maximum number of requests per second (0 means no limit)'),type=1,defaultValue=0,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.ADAPTIVE_CONCURRENCY, self.tr('Adapt the number of parallel requests to the server (send fewer requests while its response times rise)'),defaultValue=False))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.TIMEOUT, self.tr('Timeout per request in seconds (0 means no timeout)'),type=1,defaultValue=60,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.RETRIES, self.tr('Number of retries for temporary failures (timeouts, lost connections, server busy), waiting longer before each retry'),type=0,defaultValue=3,minValue=0,maxValue=10))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.GZIP, self.tr('Request gzip-compressed responses (less data to transfer, a little more work to unpack)'),defaultValue=False))
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.CACHE_MODE, self.tr('Local response cache (reruns with the same requests do not query the server again)'),
+                ['Do not use cache','Use cache','Bypass cache (query the server and refresh the cached responses)','Purge cache before running, then use it'],defaultValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CACHE_TTL, self.tr('Hours until a cached response expires (0 means never)'),type=1,defaultValue=168,minValue=0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CACHE_MAX_ENTRIES, self.tr('Maximum number of cached responses (least recently used ones are removed first)'),type=0,defaultValue=100000,minValue=1))
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT, self.tr('OTP Traveltime Matrix'))) # Output
+
+    def matrix_points(self, layer, id_field, transform_context, feedback):
+        # Collects the distinct locations of a layer in WGS84 and the ids of all features at each location,
+        # so every location is only routed once, no matter how many features share it
+        transform = QgsCoordinateTransform(layer.sourceCrs(), QgsCoordinateReferenceSystem('EPSG:4326'), transform_context)
+        point_index = {} # (lat, lon): index in points
+        points = []
+        point_ids = []
+        skipped = 0
+        for feature in layer.getFeatures():
+            if not feature.hasGeometry():
+                skipped += 1
+                continue
+            point = transform.transform(feature.geometry().centroid().asPoint())
+            location = (round(point.y(), 6), round(point.x(), 6)) # about 0.1m, more is not needed for routing
+            feature_id = feature[id_field] if id_field else feature.id()
+            if location not in point_index:
+                point_index[location] = len(points)
+                points.append(location)
+                point_ids.append([])
+            point_ids[point_index[location]].append(feature_id)
+        if skipped:
+            feedback.pushWarning(str(skipped) + ' features of ' + layer.sourceName() + ' without geometry are skipped')
+        return points, point_ids
+
+    def crowfly_distance(self, lat1, lon1, lat2, lon2):
+        # Great circle distance in meters (haversine, spherical earth)
+        lat1, lon1, lat2, lon2 = math.radians(lat1), math.radians(lon1), math.radians(lat2), math.radians(lon2)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        return 2 * 6371008.8 * math.asin(min(1.0, math.sqrt(a)))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        # Get Parameters and assign to variable to work with
+        server_url = self.parameterAsString(parameters, self.SERVER_URL, context)
+        origin_layer = self.parameterAsSource(parameters, self.ORIGIN_LYR, context)
+        origin_id_field = self.parameterAsString(parameters, self.ORIGIN_ID_FIELD, context)
+        destination_layer = self.parameterAsSource(parameters, self.DESTINATION_LYR, context)
+        destination_id_field = self.parameterAsString(parameters, self.DESTINATION_ID_FIELD, context)
+        trip_datetime = self.parameterAsDateTime(parameters, self.DATETIME, context)
+        travelmode = self.parameterAsString(parameters, self.MODE, context)
+        modelist = ['WALK','CAR','BICYCLE','TRANSIT','WALK,TRANSIT','WALK,BICYCLE']
+        travelmode = str(modelist[int(travelmode[0])])
+        traveloptimize = self.parameterAsString(parameters, self.OPTIMIZE, context)
+        optimizelist = ['QUICK','TRANSFERS','SAFE','FLAT','GREENWAYS','TRIANGLE']
+        traveloptimize = str(optimizelist[int(traveloptimize[0])])
+
+        additional_params = self.parameterAsString(parameters, self.ADDITIONAL_PARAMS, context)
+        iterinaries = self.parameterAsInt(parameters, self.ITERINARIES, context)
+        max_traveltime = self.parameterAsDouble(parameters, self.MAX_TRAVELTIME, context) * 60 # seconds, as the durations of OTP
+        max_speed = self.parameterAsDouble(parameters, self.MAX_SPEED, context)
+        if max_speed <= 0:
+            max_speed = self.MAX_SPEED_BY_MODE[travelmode]
+        output_format = self.parameterAsInt(parameters, self.OUTPUT_FORMAT, context)
+        max_workers = self.parameterAsInt(parameters, self.MAX_WORKERS, context)
+        max_requests_per_second = self.parameterAsDouble(parameters, self.MAX_REQUESTS_PER_SECOND, context)
+        adaptive_concurrency = self.parameterAsBool(parameters, self.ADAPTIVE_CONCURRENCY, context)
+        request_timeout = self.parameterAsDouble(parameters, self.TIMEOUT, context)
+        request_retries = self.parameterAsInt(parameters, self.RETRIES, context)
+        use_gzip = self.parameterAsBool(parameters, self.GZIP, context)
+        cache_mode = self.parameterAsInt(parameters, self.CACHE_MODE, context)
+        cache_ttl = self.parameterAsDouble(parameters, self.CACHE_TTL, context)
+        cache_max_entries = self.parameterAsInt(parameters, self.CACHE_MAX_ENTRIES, context)
+
+        use_date = str(trip_datetime.toString('yyyy-MM-dd'))
+        use_time = str(trip_datetime.toString('HH:mm:ss'))
+        max_distance = max_traveltime * max_speed / 3.6 # meters
+
+        feedback.setProgressText('Collecting origins and destinations...')
+        origin_points, origin_ids = self.matrix_points(origin_layer, origin_id_field, context.transformContext(), feedback)
+        destination_points, destination_ids = self.matrix_points(destination_layer, destination_id_field, context.transformContext(), feedback)
+        n_pairs = len(origin_points) * len(destination_points)
+        n_feature_pairs = sum(len(ids) for ids in origin_ids) * sum(len(ids) for ids in destination_ids)
+        feedback.setProgressText(str(n_pairs) + ' distinct origin-destination pairs for ' + str(n_feature_pairs) + ' pairs of features')
+
+        total = 100.0 / n_pairs if n_pairs else 0 # Initialize progress for progressbar
+
+        # Output fields; the id fields keep the type of the chosen id fields
+        if origin_id_field:
+            origin_id_qgsfield = QgsField(origin_layer.fields().field(origin_id_field))
+            origin_id_qgsfield.setName('Origin_ID')
+        else:
+            origin_id_qgsfield = QgsField('Origin_ID', QVariant.Int)
+        if destination_id_field:
+            destination_id_qgsfield = QgsField(destination_layer.fields().field(destination_id_field))
+            destination_id_qgsfield.setName('Destination_ID')
+        else:
+            destination_id_qgsfield = QgsField('Destination_ID', QVariant.Int)
+        fields = QgsFields()
+        fields.append(origin_id_qgsfield)
+        wide_columns = [] # for the wide format: the distinct destination of every traveltime field
+        if output_format == 0:
+            fields.append(destination_id_qgsfield)
+            fields.append(QgsField('Route_Total_Duration', QVariant.Int))
+            fields.append(QgsField('Route_Total_Transfers', QVariant.Int))
+            fields.append(QgsField('Route_Error', QVariant.String))
+        else:
+            for destination_index, ids in enumerate(destination_ids):
+                for destination_id in ids:
+                    fieldname = 'Duration_' + str(destination_id)
+                    if fields.indexOf(fieldname) >= 0: # ids are not unique
+                        fieldname = fieldname + '_' + str(len(wide_columns))
+                    fields.append(QgsField(fieldname, QVariant.Int))
+                    wide_columns.append(destination_index)
+
+        # some general settings
+        route_headers = {"accept":"application/json"} # this plugin only works for json responses
+        route_cache = None
+        if cache_mode != 0:
+            route_cache = OtpResponseCache(OtpResponseCache.default_path(), cache_ttl * 3600, cache_max_entries)
+            if cache_mode == 3:
+                feedback.setProgressText('Purging response cache...')
+                route_cache.purge()
+        route_engine = OtpRequestEngine(route_headers, max_workers, route_cache, cache_mode != 2, use_gzip,
+                                        max_requests_per_second, request_timeout, request_retries, adaptive_concurrency)
+
+        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
+                                               fields, QgsWkbTypes.NoGeometry)
+
+        def matrix_requests(): # Create URL for each distinct pair, origin by origin; pairs that need no request are passed without url
+            for origin_index, (origin_lat, origin_lon) in enumerate(origin_points):
+                for destination_index, (destination_lat, destination_lon) in enumerate(destination_points):
+                    if (origin_lat, origin_lon) == (destination_lat, destination_lon):
+                        yield (origin_index, destination_index, 'same location'), None
+                    elif max_distance > 0 and self.crowfly_distance(origin_lat, origin_lon, destination_lat, destination_lon) > max_distance:
+                        yield (origin_index, destination_index, 'too far away'), None
+                    else:
+                        route_url = (str(server_url) + "plan?" + # Add Plan request to server url
+                            "fromPlace=" + str(origin_lat) + "," + str(origin_lon) +
+                            "&toPlace=" + str(destination_lat) + "," + str(destination_lon) +
+                            "&mode=" + travelmode +
+                            "&date=" + use_date +
+                            "&time=" + use_time +
+                            "&numItineraries=" + str(iterinaries) +
+                            "&optimize=" + traveloptimize +
+                            additional_params # Additional Parameters entered as OTP-Readable string -> User responsibility
+                        )
+                        yield (origin_index, destination_index, None), route_url
+
+        def write_wide_row(origin_index, durations):
+            for origin_id in origin_ids[origin_index]:
+                new_feature = QgsFeature(fields)
+                new_feature.setAttributes([origin_id] + [durations[destination_index] for destination_index in wide_columns])
+                sink.addFeature(new_feature, QgsFeatureSink.FastInsert)
+
+        n_requests = 0
+        n_pruned = 0
+        n_beyond = 0
+        n_errors = 0
+        wide_origin_index = None
+        wide_durations = None
+        for current, ((origin_index, destination_index, skip_reason), route_url, route_data, route_error) in enumerate(route_engine.fetch_ordered(matrix_requests(), feedback)):
+            route_duration = None
+            route_transfers = None
+            beyond_max_traveltime = False
+            if skip_reason == 'same location': # no need to ask the server
+                route_error = 'Success'
+                route_duration = 0
+                route_transfers = 0
+            elif skip_reason == 'too far away':
+                beyond_max_traveltime = True
+                n_pruned += 1
+            else:
+                n_requests += 1
+                if route_error is None: # Requesting and reading the route succeeded
+                    try: # Check if response says Error
+                        route_error = 'Error: No Route' if route_data['error'] else 'Success'
+                    except:
+                        route_error = 'Success'
+                    if route_error == 'Success':
+                        try: # take the fastest itinerary
+                            fastest = min(route_data['plan']['itineraries'], key = lambda itinerary: itinerary['duration'])
+                            route_duration = fastest['duration']
+                            route_transfers = fastest.get('transfers')
+                        except:
+                            route_error = 'Error: Empty response route'
+                if route_error != 'Success':
+                    n_errors += 1
+                elif max_traveltime > 0 and route_duration > max_traveltime:
+                    beyond_max_traveltime = True
+                    n_beyond += 1
+
+            if output_format == 0: # long format: one feature per pair of origin and destination features, pairs beyond the maximum traveltime are left out
+                if not beyond_max_traveltime:
+                    for origin_id in origin_ids[origin_index]:
+                        for destination_id in destination_ids[destination_index]:
+                            new_feature = QgsFeature(fields)
+                            new_feature.setAttributes([origin_id, destination_id, route_duration, route_transfers, route_error])
+                            sink.addFeature(new_feature, QgsFeatureSink.FastInsert)
+            else: # wide format: the requests come origin by origin, so a row is complete as soon as the next origin starts
+                if origin_index != wide_origin_index:
+                    if wide_origin_index is not None:
+                        write_wide_row(wide_origin_index, wide_durations)
+                    wide_origin_index = origin_index
+                    wide_durations = [None] * len(destination_points)
+                if not beyond_max_traveltime:
+                    wide_durations[destination_index] = route_duration
+
+            if feedback.isCanceled(): # Cancel algorithm if button is pressed
+                break
+
+            feedback.setProgress(int(current * total)) # Set Progress in Progressbar
+
+        if output_format == 1 and wide_origin_index is not None and not feedback.isCanceled():
+            write_wide_row(wide_origin_index, wide_durations)
+
+        route_engine.close()
+        feedback.setProgressText(str(n_requests) + ' requests sent, ' + str(n_pruned) + ' pairs not requested as they are too far away for the maximum traveltime, ' +
+                                 str(n_beyond) + ' routes exceeded the maximum traveltime, ' + str(n_errors) + ' requests failed')
+        if route_engine.scheduler.retry_count:
+            feedback.setProgressText(str(route_engine.scheduler.retry_count) + ' requests retried after temporary failures')
+        if route_cache is not None:
+            feedback.setProgressText(str(route_cache.hits) + ' responses taken from cache, ' + str(route_cache.stored) + ' responses stored in cache')
+            route_cache.close()
+
+        return {self.OUTPUT: dest_id} # Return result of algorithm
+
+
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return OtpTraveltimeMatrix()
+
+    def name(self):
+        return 'OtpTraveltimeMatrix'
+
+    def displayName(self):
+        return self.tr('OpenTripPlanner Traveltime Matrix')
+
+    def group(self):
+        return self.tr('OpenTripPlanner')
+
+    def groupId(self):
+        return 'otp'
+
+    def shortHelpString(self):
+        return self.tr('This Tool requests the traveltimes between all origins and all destinations from an OTP instance and creates a table without geometry, '
+                       'either with one row per origin and destination or with one row per origin and one traveltime field per destination. '
+                       'Every distinct location pair is only requested once and requests can be sent in parallel. '
+                       'With a maximum traveltime, pairs that are too far away to be reached in time are not requested at all and pairs taking longer are left out.')
@@ -19,6 +19,7 @@ from PyQt5.QtCore import QCoreApplication, QVariant
 from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsSpatialIndex, QgsGeometryEngine, QgsGeometry,
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm, QgsExpressionContext, QgsExpressionContextUtils,
                        QgsProcessingParameterVectorLayer, QgsProcessingParameterFeatureSink, QgsProcessingParameterBoolean, QgsProcessingParameterField, QgsProcessingParameterDistance, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterExpression, QgsProcessingParameterNumber, QgsProcessingParameterString)
+from ..helpers.ConsumedIdTracker import ConsumedIdTracker
 
 class ConditionalIntersection(QgsProcessingAlgorithm):
     SOURCE_LYR = 'SOURCE_LYR'
@@ -201,15 +202,35 @@ class ConditionalIntersection(QgsProcessingAlgorithm):
             order_by = QgsFeatureRequest.OrderBy([QgsFeatureRequest.OrderByClause(source_orderby_expression)])
             source_orderby_request.setOrderBy(order_by)
         
+        # dictonaries are a lot faster than featurerequests; https://gis.stackexchange.com/q/434768/107424
+        # so every overlay feature is only fetched and evaluated once, not once per intersecting source feature
+        feedback.setProgressText('Evaluating expressions...')
+        overlay_layer_attributes_dict = {}
+        overlay_layer_dict = {}
+        overlay_layer_dict2 = {}
+        overlay_compare_expression_context = QgsExpressionContext()
+        overlay_compare_expression_context.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(overlay_layer_vl))
+        overlay_compare_expression_context2 = QgsExpressionContext()
+        overlay_compare_expression_context2.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(overlay_layer_vl))
+        overlay_request = QgsFeatureRequest()
+        if not comparisons:
+            overlay_request.setFlags(QgsFeatureRequest.NoGeometry) # geometries are already stored in the spatial index
+        for overlay_feat in overlay_layer_vl.getFeatures(overlay_request):
+            if feedback.isCanceled():
+                break
+            overlay_layer_attributes_dict[overlay_feat.id()] = overlay_feat.attributes()
+            if comparisons:
+                overlay_compare_expression_context.setFeature(overlay_feat)
+                overlay_layer_dict[overlay_feat.id()] = overlay_compare_expression.evaluate(overlay_compare_expression_context)
+                overlay_compare_expression_context2.setFeature(overlay_feat)
+                overlay_layer_dict2[overlay_feat.id()] = overlay_compare_expression2.evaluate(overlay_compare_expression_context2)
+        overlay_layer_skip = ConsumedIdTracker()
+
         feedback.setProgressText('Start processing...')
         source_compare_expression_context = QgsExpressionContext()
         source_compare_expression_context.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(source_layer_vl))
         source_compare_expression_context2 = QgsExpressionContext()
         source_compare_expression_context2.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(source_layer_vl))
-        overlay_compare_expression_context = QgsExpressionContext()
-        overlay_compare_expression_context.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(overlay_layer_vl))
-        overlay_compare_expression_context2 = QgsExpressionContext()
-        overlay_compare_expression_context2.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(overlay_layer_vl))
         for current, source_feat in enumerate(source_layer_vl.getFeatures(source_orderby_request)):
             if feedback.isCanceled():
                 break
@@ -229,46 +250,26 @@ class ConditionalIntersection(QgsProcessingAlgorithm):
                 source_compare_expression_context2.setFeature(source_feat)
                 source_compare_expression_result2 = source_compare_expression2.evaluate(source_compare_expression_context2)
             
+            source_feat_attributes = source_feat.attributes()
             for overlay_feat_id in bbox_intersecting:
                 if feedback.isCanceled():
                     break
+                if overlay_feat_id in overlay_layer_skip:
+                    continue
+                
+                if comparisons:
+                    if not concat_op(op(source_compare_expression_result, overlay_layer_dict[overlay_feat_id]),op2(source_compare_expression_result2, overlay_layer_dict2[overlay_feat_id])):
+                        continue
                     
                 overlay_feat_geom = overlay_layer_idx.geometry(overlay_feat_id).constGet()
                 
                 if source_feat_geometryengine.intersects(overlay_feat_geom):
-                    overlay_feat = overlay_layer_vl.getFeature(overlay_feat_id)
-                    
-                    if not comparisons:
-                        new_feat = QgsFeature(output_layer_fields)
-                        new_feat.setGeometry(source_feat_geometryengine.intersection(overlay_feat_geom))
-                        attridx = 0
-                        for attr in source_feat.attributes():
-                            new_feat[attridx] = attr
-                            attridx += 1
-                        for attr in overlay_feat.attributes():
-                            new_feat[attridx] = attr
-                            attridx += 1
-                        sink.addFeature(new_feat, QgsFeatureSink.FastInsert)
-                        if intersect_multiple is False:
-                            overlay_layer_idx.deleteFeature(overlay_feat)
-                    else:
-                        overlay_compare_expression_context.setFeature(overlay_feat)
-                        overlay_compare_expression_result = overlay_compare_expression.evaluate(overlay_compare_expression_context)
-                        overlay_compare_expression_context2.setFeature(overlay_feat)
-                        overlay_compare_expression_result2 = overlay_compare_expression2.evaluate(overlay_compare_expression_context2)
-                        if concat_op(op(source_compare_expression_result, overlay_compare_expression_result),op2(source_compare_expression_result2, overlay_compare_expression_result2)):
-                            new_feat = QgsFeature(output_layer_fields)
-                            new_feat.setGeometry(source_feat_geometryengine.intersection(overlay_feat_geom))
-                            attridx = 0
-                            for attr in source_feat.attributes():
-                                new_feat[attridx] = attr
-                                attridx += 1
-                            for attr in overlay_feat.attributes():
-                                new_feat[attridx] = attr
-                                attridx += 1
-                            sink.addFeature(new_feat, QgsFeatureSink.FastInsert)
-                            if intersect_multiple is False:
-                                overlay_layer_idx.deleteFeature(overlay_feat)
+                    new_feat = QgsFeature(output_layer_fields)
+                    new_feat.setGeometry(source_feat_geometryengine.intersection(overlay_feat_geom))
+                    new_feat.setAttributes(source_feat_attributes + overlay_layer_attributes_dict[overlay_feat_id])
+                    sink.addFeature(new_feat, QgsFeatureSink.FastInsert)
+                    if intersect_multiple is False:
+                        overlay_layer_skip.consume(overlay_feat_id)
             feedback.setProgress(int(current * total))
             
 
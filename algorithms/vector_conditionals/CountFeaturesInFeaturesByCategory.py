@@ -20,6 +20,7 @@ from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsSp
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm, QgsExpressionContext, QgsExpressionContextUtils,
                        QgsProcessingParameterVectorLayer, QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterExpression, 
                        QgsProcessingParameterString, QgsProcessingParameterBoolean)
+from ..helpers.ConsumedIdTracker import ConsumedIdTracker
 
 class CountFeaturesInFeaturesByCategory(QgsProcessingAlgorithm):
     METHOD = 'METHOD'
@@ -141,7 +142,7 @@ class CountFeaturesInFeaturesByCategory(QgsProcessingAlgorithm):
             overlay_category_expression_result = overlay_category_expression.evaluate(overlay_category_expression_context)
             overlay_layer_dict[overlay_feat.id()] = overlay_category_expression_result 
             feedback.setProgress(int(current * total))
-        overlay_layer_skip = []
+        overlay_layer_skip = ConsumedIdTracker()
         
         categories = list(set(overlay_layer_dict.values()))
         categories.sort()
@@ -286,7 +287,7 @@ class CountFeaturesInFeaturesByCategory(QgsProcessingAlgorithm):
                     source_feat_results[overlay_layer_dict[overlay_feat_id]] += 1
                     matching_counter += 1
                     if count_multiple is False:
-                        overlay_layer_skip.append(overlay_feat_id)
+                        overlay_layer_skip.consume(overlay_feat_id)
                         
             
             if output_structure == 0: # Create a feature for each category
@@ -19,6 +19,7 @@ from PyQt5.QtCore import QCoreApplication, QVariant
 from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsSpatialIndex, QgsSpatialIndexKDBush, QgsGeometry, QgsWkbTypes,
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm, QgsExpressionContext, QgsExpressionContextUtils,
                        QgsProcessingParameterVectorLayer, QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterDistance, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterExpression, QgsProcessingParameterNumber, QgsProcessingParameterString, QgsProcessingParameterBoolean)
+from ..helpers.ConsumedIdTracker import ConsumedIdTracker
 
 class CountFeaturesInFeaturesWithCondition(QgsProcessingAlgorithm):
     METHOD = 'METHOD'
@@ -226,23 +227,20 @@ class CountFeaturesInFeaturesWithCondition(QgsProcessingAlgorithm):
                 overlay_compare_expression_result2 = overlay_compare_expression2.evaluate(overlay_compare_expression_context2)
                 overlay_layer_dict2[overlay_feat.id()] = overlay_compare_expression_result2
                 feedback.setProgress(int(current * total))
-        overlay_layer_skip = []
+        overlay_layer_skip = ConsumedIdTracker()
         
         source_orderby_request = QgsFeatureRequest()
         if source_orderby_expression not in (QgsExpression(''),QgsExpression(None)):
             order_by = QgsFeatureRequest.OrderBy([QgsFeatureRequest.OrderByClause(source_orderby_expression)])
             source_orderby_request.setOrderBy(order_by)
         
-        feedback.setProgressText('Start processing...')
         source_compare_expression_context = QgsExpressionContext()
         source_compare_expression_context.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(source_layer_vl))
         source_compare_expression_context2 = QgsExpressionContext()
         source_compare_expression_context2.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(source_layer_vl))
-        for source_feat in source_layer_vl.getFeatures(source_orderby_request):
-            current += 1
-            if feedback.isCanceled():
-                break
-            source_feat_geom = source_feat.geometry()
+        
+        def count_matches(source_feat_id, source_feat_geom, source_compare_expression_result, source_compare_expression_result2):
+            # Number of overlay features matching one source feature
             source_feat_geometryengine = QgsGeometry.createGeometryEngine(source_feat_geom.constGet())
             source_feat_geometryengine.prepareGeometry()
             
@@ -251,19 +249,13 @@ class CountFeaturesInFeaturesWithCondition(QgsProcessingAlgorithm):
                 overlay_feature_ids = all_overlay_feature_ids
             else:
                 overlay_feature_ids = overlay_layer_idx.intersects(source_feat_geom.boundingBox())
-            if sourceoverlayequal is True:
-                overlay_feature_ids.remove(source_feat.id())
             matching_counter = 0
             
-            if comparisons:
-                source_compare_expression_context.setFeature(source_feat)
-                source_compare_expression_result = source_compare_expression.evaluate(source_compare_expression_context)
-                source_compare_expression_context2.setFeature(source_feat)
-                source_compare_expression_result2 = source_compare_expression2.evaluate(source_compare_expression_context2)
-                        
             for overlay_feat_id in overlay_feature_ids:
                 if feedback.isCanceled():
                     break
+                if sourceoverlayequal is True and overlay_feat_id == source_feat_id:
+                    continue
                 if overlay_feat_id in overlay_layer_skip:
                     continue
                     
@@ -323,27 +315,49 @@ class CountFeaturesInFeaturesWithCondition(QgsProcessingAlgorithm):
                     if not comparisons:
                         matching_counter += 1
                         if count_multiple is False:
-                            overlay_layer_skip.append(overlay_feat_id)
+                            overlay_layer_skip.consume(overlay_feat_id)
                     else:
                         overlay_compare_expression_result = overlay_layer_dict[overlay_feat_id]
                         overlay_compare_expression_result2 = overlay_layer_dict2[overlay_feat_id]
                         if concat_op(op(source_compare_expression_result, overlay_compare_expression_result),op2(source_compare_expression_result2, overlay_compare_expression_result2)):
                             matching_counter += 1
                             if count_multiple is False:
-                                overlay_layer_skip.append(overlay_feat_id)
-                        
+                                overlay_layer_skip.consume(overlay_feat_id)
+            return matching_counter
+        
+        def source_jobs():
+            # Source features in processing order, together with their compare expression results
+            for source_feat in source_layer_vl.getFeatures(source_orderby_request):
+                if feedback.isCanceled():
+                    break
+                source_compare_expression_result = None
+                source_compare_expression_result2 = None
+                if comparisons:
+                    source_compare_expression_context.setFeature(source_feat)
+                    source_compare_expression_result = source_compare_expression.evaluate(source_compare_expression_context)
+                    source_compare_expression_context2.setFeature(source_feat)
+                    source_compare_expression_result2 = source_compare_expression2.evaluate(source_compare_expression_context2)
+                yield source_feat, (source_feat.id(), source_feat.geometry(), source_compare_expression_result, source_compare_expression_result2)
+        
+        def write_feature(source_feat, matching_counter):
             new_feat = QgsFeature(output_layer_fields)
-            new_feat.setGeometry(source_feat_geom)
+            new_feat.setGeometry(source_feat.geometry())
             attridx = 0
             for attr in source_feat.attributes():
                 new_feat[attridx] = attr
                 attridx += 1
             new_feat[count_fieldname] = matching_counter
             sink.addFeature(new_feat, QgsFeatureSink.FastInsert)
-            
+        
+        feedback.setProgressText('Start processing...')
+        for source_feat, source_job in source_jobs():
+            current += 1
+            matching_counter = count_matches(*source_job)
+            if feedback.isCanceled():
+                break
+            write_feature(source_feat, matching_counter)
             feedback.setProgress(int(current * total))
             
-
         return {self.OUTPUT: dest_id}
 
 
@@ -20,6 +20,7 @@ from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsSp
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm, QgsExpressionContext, QgsExpressionContextUtils,
                        QgsProcessingParameterVectorLayer, QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterExpression, 
                        QgsProcessingParameterString, QgsProcessingParameterBoolean)
+from ..helpers.ConsumedIdTracker import ConsumedIdTracker
 
 class CountNearestFeaturesByCategory(QgsProcessingAlgorithm):
     MAX_DIST = 'MAX_DIST'
@@ -203,7 +204,7 @@ class CountNearestFeaturesByCategory(QgsProcessingAlgorithm):
         feedback.setProgressText('Start processing...')
         max_dist_expression_context = QgsExpressionContext()
         max_dist_expression_context.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(source_layer_vl))
-        overlay_layer_skip = []
+        overlay_layer_skip = ConsumedIdTracker()
         for source_feat in source_layer_vl.getFeatures(source_orderby_request):
             current += 1
             if feedback.isCanceled():
@@ -235,7 +236,7 @@ class CountNearestFeaturesByCategory(QgsProcessingAlgorithm):
                 source_feat_results[overlay_layer_dict[overlay_feat_id]] += 1
                 matching_counter += 1
                 if count_multiple is False:
-                    overlay_layer_skip.append(overlay_feat_id)
+                    overlay_layer_skip.consume(overlay_feat_id)
             
             if output_structure == 0: # Create a feature for each category
                 for category, count in source_feat_results.items():
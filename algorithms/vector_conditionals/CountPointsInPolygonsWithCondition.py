@@ -19,6 +19,10 @@ from PyQt5.QtCore import QCoreApplication, QVariant
 from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsSpatialIndex, QgsSpatialIndexKDBush, QgsGeometry, QgsWkbTypes,
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm, QgsExpressionContext, QgsExpressionContextUtils, QgsProcessingParameterDefinition,
                        QgsProcessingParameterVectorLayer, QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterDistance, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterExpression, QgsProcessingParameterNumber, QgsProcessingParameterString, QgsProcessingParameterBoolean)
+from ..helpers.ConsumedIdTracker import ConsumedIdTracker
+from .PointInPolygon import numpy, polygon_edges, points_in_polygon, boundary_tolerance
+
+POINT_IN_POLYGON_MIN_POINTS = 64 # below this number of candidate points per polygon testing them one by one with GEOS is fast enough
 
 class CountPointsInPolygonsWithCondition(QgsProcessingAlgorithm):
     METHOD = 'METHOD'
@@ -218,7 +222,7 @@ class CountPointsInPolygonsWithCondition(QgsProcessingAlgorithm):
                 overlay_compare_expression_result2 = overlay_compare_expression2.evaluate(overlay_compare_expression_context2)
                 overlay_layer_dict2[overlay_feat.id()] = overlay_compare_expression_result2
                 feedback.setProgress(int(current * total))
-        overlay_layer_skip = []
+        overlay_layer_skip = ConsumedIdTracker()
         
         source_orderby_request = QgsFeatureRequest()
         if source_orderby_expression not in (QgsExpression(''),QgsExpression(None)):
@@ -247,28 +251,50 @@ class CountPointsInPolygonsWithCondition(QgsProcessingAlgorithm):
                 source_compare_expression_context2.setFeature(source_feat)
                 source_compare_expression_result2 = source_compare_expression2.evaluate(source_compare_expression_context2)
             
-            for overlay_feat in overlay_features:
+            if overlay_layer_skip:
+                overlay_features = [overlay_feat for overlay_feat in overlay_features if overlay_feat.id not in overlay_layer_skip]
+            
+            # Many candidate points are classified at once by ray casting (see PointInPolygon.py); only points on or very close to
+            # the boundary, and polygons the kernel cannot handle (curves, invalid geometries), are tested with GEOS point by point
+            overlay_features_geometrictests = None
+            if numpy is not None and len(overlay_features) >= POINT_IN_POLYGON_MIN_POINTS and \
+                    QgsWkbTypes.flatType(source_feat_geom.wkbType()) in (QgsWkbTypes.Polygon, QgsWkbTypes.MultiPolygon) and source_feat_geom.isGeosValid():
+                if source_feat_geom.isMultipart():
+                    source_feat_polygons = source_feat_geom.asMultiPolygon()
+                else:
+                    source_feat_polygons = [source_feat_geom.asPolygon()]
+                source_feat_edges = polygon_edges([[(point.x(), point.y()) for point in ring] for polygon in source_feat_polygons for ring in polygon])
+                overlay_features_xs = numpy.array([overlay_feat.point().x() for overlay_feat in overlay_features])
+                overlay_features_ys = numpy.array([overlay_feat.point().y() for overlay_feat in overlay_features])
+                overlay_features_inside, overlay_features_onboundary = points_in_polygon(overlay_features_xs, overlay_features_ys, source_feat_edges,
+                                                                                         boundary_tolerance(source_feat_edges, overlay_features_xs, overlay_features_ys))
+                overlay_features_geometrictests = (overlay_features_inside & ~overlay_features_onboundary).tolist()
+                for i in numpy.flatnonzero(overlay_features_onboundary).tolist():
+                    overlay_features_geometrictests[i] = None # decide with GEOS
+            
+            for i, overlay_feat in enumerate(overlay_features):
                 if feedback.isCanceled():
                     break
                 
-                if overlay_feat.id in overlay_layer_skip:
-                    continue
-                
-                overlay_feat_geom = QgsGeometry.fromPointXY(overlay_feat.point()).constGet()
-                
-                geometrictest = False
-                if method == 0:
-                    if source_feat_geometryengine.contains(overlay_feat_geom):
-                        geometrictest = True
-                if method == 1:
-                    if source_feat_geometryengine.intersects(overlay_feat_geom):
-                        geometrictest = True
+                geometrictest = None
+                if overlay_features_geometrictests is not None:
+                    geometrictest = overlay_features_geometrictests[i]
+                if geometrictest is None:
+                    overlay_feat_geom = QgsGeometry.fromPointXY(overlay_feat.point()).constGet()
+                    
+                    geometrictest = False
+                    if method == 0:
+                        if source_feat_geometryengine.contains(overlay_feat_geom):
+                            geometrictest = True
+                    if method == 1:
+                        if source_feat_geometryengine.intersects(overlay_feat_geom):
+                            geometrictest = True
                         
                 if geometrictest:
                     if not comparisons:
                         matching_counter += 1
                         if count_multiple is False:
-                            overlay_layer_skip.append(overlay_feat.id)
+                            overlay_layer_skip.consume(overlay_feat.id)
                     else:
                         #overlay_real_feat = overlay_layer_dict[overlay_feat.id]
                         #overlay_real_feat = overlay_layer_vl.getFeature(overlay_feat.id)
@@ -281,7 +307,7 @@ class CountPointsInPolygonsWithCondition(QgsProcessingAlgorithm):
                         if concat_op(op(source_compare_expression_result, overlay_compare_expression_result),op2(source_compare_expression_result2, overlay_compare_expression_result2)):
                             matching_counter += 1
                             if count_multiple is False:
-                                overlay_layer_skip.append(overlay_feat.id)
+                                overlay_layer_skip.consume(overlay_feat.id)
                         
             new_feat = QgsFeature(output_layer_fields)
             new_feat.setGeometry(source_feat_geom)
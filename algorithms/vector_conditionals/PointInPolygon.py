@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Vectorized point in polygon test of many points against one polygon: even-odd ray casting over all edges of all rings at once.
+# Points lying on a ring or closer to it than the tolerance are reported separately, because rounding could put them on either side;
+# they have to be decided by an exact test (GEOS).
+
+try:
+    import numpy
+except ImportError: # numpy is shipped with QGIS, but the algorithms fall back to GEOS just in case
+    numpy = None
+
+MAX_BLOCK_SIZE = 1 << 20 # number of point-edge pairs computed at once, limits the memory of the intermediate arrays
+
+def polygon_edges(rings):
+    """
+    Returns the edges of a polygon as an array of shape (n, 4) with x1, y1, x2, y2 per edge.
+    rings is a list of rings (exterior rings and holes of all parts), every ring a sequence of (x, y) with the first point repeated at the end.
+    """
+    edges = []
+    for ring in rings:
+        ring = numpy.asarray(ring, dtype = float).reshape(-1, 2)
+        if len(ring) < 2:
+            continue
+        edges.append(numpy.hstack((ring[:-1], ring[1:])))
+    if not edges:
+        return numpy.empty((0, 4))
+    return numpy.vstack(edges)
+
+def points_in_polygon(xs, ys, edges, tolerance = 0.0):
+    """
+    Classifies the points (xs, ys) against the polygon given by its edges (see polygon_edges).
+    Returns two boolean arrays: inside (by ray casting) and on_boundary (closer to an edge than tolerance, inside is unreliable there).
+    """
+    xs = numpy.asarray(xs, dtype = float)
+    ys = numpy.asarray(ys, dtype = float)
+    n_points = len(xs)
+    inside = numpy.zeros(n_points, dtype = bool)
+    on_boundary = numpy.zeros(n_points, dtype = bool)
+    if len(edges) == 0 or n_points == 0:
+        return inside, on_boundary
+    # Only pairs of a point and an edge whose y-range (plus tolerance) contains the point are tested: with the points sorted by y,
+    # these are a contiguous range of points per edge. For usual polygons only a few edges cross any horizontal line.
+    order = numpy.argsort(ys, kind = 'stable')
+    sorted_ys = ys[order]
+    edge_ymin = numpy.minimum(edges[:, 1], edges[:, 3])
+    edge_ymax = numpy.maximum(edges[:, 1], edges[:, 3])
+    lows = numpy.searchsorted(sorted_ys, edge_ymin - tolerance, 'left')
+    counts = numpy.searchsorted(sorted_ys, edge_ymax + tolerance, 'right') - lows
+    cumulative_counts = numpy.cumsum(counts)
+    crossings = numpy.zeros(n_points, dtype = numpy.int64)
+    tolerance2 = tolerance * tolerance
+    start_edge = 0
+    while start_edge < len(edges):
+        offset = cumulative_counts[start_edge - 1] if start_edge else 0
+        end_edge = max(start_edge + 1, int(numpy.searchsorted(cumulative_counts, offset + MAX_BLOCK_SIZE, 'right')))
+        block_counts = counts[start_edge:end_edge]
+        n_pairs = int(block_counts.sum())
+        if n_pairs:
+            block_starts = numpy.cumsum(block_counts) - block_counts
+            pair_edges = numpy.repeat(numpy.arange(start_edge, end_edge), block_counts)
+            pair_points = order[numpy.repeat(lows[start_edge:end_edge] - block_starts, block_counts) + numpy.arange(n_pairs)]
+            px = xs[pair_points]
+            py = ys[pair_points]
+            x1, y1, x2, y2 = edges[pair_edges, 0], edges[pair_edges, 1], edges[pair_edges, 2], edges[pair_edges, 3]
+            dx = x2 - x1
+            dy = y2 - y1
+            # Ray from the point to the right: count the edges crossing the horizontal line through the point right of it
+            spans = (y1 > py) != (y2 > py)
+            with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+                crossing = spans & (px < x1 + (py - y1) * dx / dy)
+            crossings += numpy.bincount(pair_points[crossing], minlength = n_points)
+            # Squared distance to the nearest point of the edge; degenerated edges have the distance to their start point
+            length2 = dx * dx + dy * dy
+            length2[length2 == 0] = 1
+            t = numpy.clip(((px - x1) * dx + (py - y1) * dy) / length2, 0, 1)
+            distance2 = (px - x1 - t * dx) ** 2 + (py - y1 - t * dy) ** 2
+            on_boundary[pair_points[distance2 <= tolerance2]] = True
+        start_edge = end_edge
+    inside = (crossings % 2) == 1
+    return inside, on_boundary
+
+def boundary_tolerance(edges, xs, ys):
+    """A distance to the rings below which ray casting is not trusted, relative to the magnitude of the coordinates."""
+    magnitude = max(numpy.abs(edges).max() if len(edges) else 0, numpy.abs(xs).max() if len(xs) else 0, numpy.abs(ys).max() if len(ys) else 0, 1.0)
+    return magnitude * 1e-10
@@ -158,6 +158,10 @@ class RemoveSelfOverlappingPortionsByCondition(QgsProcessingAlgorithm):
         feedback.setProgressText('Building spatial index...')
         overlay_layer_idx = QgsSpatialIndex(source_layer_vl.getFeatures(), flags=QgsSpatialIndex.FlagStoreFeatureGeometries)
         
+        # working geometries are kept in a dictionary instead of editing and committing the layer for every overlapping pair;
+        # a feature is only changed while it is the current source feature, later source features see its remaining geometry as overlay
+        source_layer_dict = {feat.id():feat for feat in source_layer_vl.getFeatures()}
+        
         source_orderby_request = QgsFeatureRequest()
         if source_orderby_expression not in (QgsExpression(''),QgsExpression(None)):
             order_by = QgsFeatureRequest.OrderBy([QgsFeatureRequest.OrderByClause(source_orderby_expression, orderby_asc)])
@@ -185,6 +189,7 @@ class RemoveSelfOverlappingPortionsByCondition(QgsProcessingAlgorithm):
                 source_compare_expression_result2 = source_compare_expression2.evaluate(source_compare_expression_context2)
                 
             source_feat_geom = source_feat.geometry()
+            source_feat_newgeom = source_feat_geom
             source_feat_geometryengine = QgsGeometry.createGeometryEngine(source_feat_geom.constGet())
             source_feat_geometryengine.prepareGeometry()
             
@@ -197,7 +202,9 @@ class RemoveSelfOverlappingPortionsByCondition(QgsProcessingAlgorithm):
             for overlay_feat_id in overlay_features:
                 if feedback.isCanceled():
                     break
-                overlay_feat = source_layer_vl.getFeature(overlay_feat_id) # need to get it from the edited layer because the index is based on the original input
+                overlay_feat = source_layer_dict.get(overlay_feat_id) # need to get the edited geometry because the index is based on the original input
+                if overlay_feat is None:
+                    continue
                 overlay_feat_geom = overlay_feat.geometry()
                 if source_feat_geometryengine.overlaps(overlay_feat_geom.constGet()):
                     doit = False
@@ -211,11 +218,9 @@ class RemoveSelfOverlappingPortionsByCondition(QgsProcessingAlgorithm):
                     else:
                         doit = True
                     if doit:
-                        source_layer_vl.startEditing()
-                        source_feat.geometry().convertToMultiType()
-                        source_feat.setGeometry(source_feat.geometry().difference(overlay_feat.geometry()))
-                        source_layer_vl.updateFeature(source_feat)
-                        source_layer_vl.commitChanges()
+                        source_feat_newgeom = source_feat_newgeom.difference(overlay_feat_geom)
+            source_feat.setGeometry(source_feat_newgeom)
+            source_layer_dict[source_feat.id()].setGeometry(source_feat_newgeom)
             if source_feat.geometry().isNull():
                 feedback.pushWarning('No geometry remaining for feature ' + str(source_feat.id()) + '. Skipping feature...')
                 continue
@@ -15,8 +15,10 @@ License: GNU General Public License v3.0
 """
 
 from PyQt5.QtCore import QCoreApplication, QVariant
-from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsGeometry, QgsPoint, QgsFields, QgsWkbTypes, QgsStringUtils,
+import math
+from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsGeometry, QgsPoint, QgsFields, QgsWkbTypes, QgsStringUtils, QgsSpatialIndex, QgsRectangle, QgsFeatureRequest,
                        QgsProcessingAlgorithm, QgsProcessingParameterField, QgsProcessingParameterVectorLayer, QgsProcessingOutputVectorLayer, QgsProcessingParameterEnum, QgsProcessingParameterString, QgsProcessingParameterNumber)
+from .StringSimilarity import SimilarityEngine
 
 class SelectDuplicatesBySimilarity(QgsProcessingAlgorithm):
     SOURCE_LYR = 'SOURCE_LYR'
@@ -82,70 +84,60 @@ class SelectDuplicatesBySimilarity(QgsProcessingAlgorithm):
         layer.removeSelection() # clear selection before every run
         #totalfeatcount = layer.featureCount()
         
-        feedback.setProgressText('Start processing...')
-        for current, feat in enumerate(layer.getFeatures()): # iterate over source 
-            s = None # reset selection indicator
-            s0 = None
-            s1 = None
-            s2 = None
-            s3 = None
-            s4 = None
-            th_levenshtein_new = th_levenshtein
-            th_substring_new  = th_substring
-            th_hamming_new = th_hamming
+        # All chosen algorithms (or at least one of them) need to match; soundex codes, lengths and q-grams of every value are computed once,
+        # pairs that can not reach the thresholds are sorted out before the expensive metrics run, see StringSimilarity.py
+        similarity_engine = SimilarityEngine(alg, ao == 0, th_levenshtein, th_substring, th_hamming, QgsStringUtils.soundex,
+                                             QgsStringUtils.levenshteinDistance, QgsStringUtils.longestCommonSubstring, QgsStringUtils.hammingDistance)
+        
+        # Spatial blocking: centroids and attribute values are read once, a spatial index over the centroids delivers only the
+        # features within the maximum distance as candidates instead of fetching every previous feature for every feature
+        feedback.setProgressText('Building spatial index...')
+        centroid_idx = QgsSpatialIndex()
+        centroids = {}
+        values = {}
+        nogeometry_ids = [] # features without geometry have the distance -1 to every other feature, so they are always within maxdist
+        for feat in layer.getFeatures():
+            if feedback.isCanceled():
+                break
             if feat[field] is not None and len(str(feat[field])) > 0: # only compare if field is not empty
-                # recalc thresholds based on current attribute values
-                th_levenshtein_new = th_levenshtein_new
-                if th_levenshtein_new < 0: # set to 0 if it would be negative
-                    th_levenshtein_new = 0
-                th_substring_new = len(str(feat[field])) - th_substring
-                if th_substring_new < 0: # set to 0 if it would be negative
-                    th_substring_new = 0
-                th_hamming_new = len(str(feat[field])) - th_hamming
-                if th_hamming_new < 0: # set to 0 if it would be negative
-                    th_hamming_new = 0            
-                for lookupnr in range(1,feat.id(),1): # only compare to previous features, because we do not want to select the first feature of each duplicate group
-                    lookup = layer.getFeature(lookupnr) # get the lookup-feature
-                    if lookup[field] is not None and len(str(lookup[field])) > 0: # only compare if field is not empty
-                        if feat.geometry().centroid().distance(lookup.geometry().centroid()) <= maxdist: # only select if within given maxdistance
-                            if 0 in alg: # Exact Duplicates
-                                if feat[field] == lookup[field]:
-                                    s0 = 1
-                                else: s0 = 0
-                            if 1 in alg: # Soundex
-                                if QgsStringUtils.soundex(str(feat[field])) == QgsStringUtils.soundex(str(lookup[field])):
-                                    s1 = 1
-                                else: s1 = 0
-                            if 2 in alg: # Levenshtein
-                                if QgsStringUtils.levenshteinDistance(str(feat[field]),str(lookup[field])) < th_levenshtein_new:
-                                    s2 = 1
-                                else: s2 = 0
-                            if 3 in alg: # Longest Common Substring
-                                if len(QgsStringUtils.longestCommonSubstring(str(feat[field]),str(lookup[field]))) > th_substring_new:
-                                    s3 = 1
-                                else: s3 = 0
-                            if 4 in alg: # Hamming Distance:
-                                if QgsStringUtils.hammingDistance(str(feat[field]),str(lookup[field])) > th_hamming_new:
-                                    s4 = 1  
-                                else: s4 = 0
-                                
-                            if ao == 0: # All chosen algorithms need to match
-                                if 0 in (s0, s1, s2, s3, s4): # Dont select current feature if at least one used algorithm returned 0
-                                    s = 0
-                                else: # Select current feature if all algorithms returned 1 or None
-                                    s = 1
-                            elif ao == 1: # Only at least one algorithm needs to match
-                                if 1 in (s0, s1, s2, s3, s4): # Select current feature if at least one used algorithm returned 1
-                                    s = 1
-                                else: # Dont select current feature if no used algorithm returned 1
-                                    s = 0
-                                    
-                            if s == 1: # select the current feature if indicator is true
-                                layer.select(feat.id())
-                            
-                if feedback.isCanceled(): # Cancel algorithm if button is pressed
-                    break
+                values[feat.id()] = similarity_engine.keys(feat[field])
+            centroid = feat.geometry().centroid()
+            if centroid.isNull() or centroid.isEmpty():
+                nogeometry_ids.append(feat.id())
+                continue
+            centroid = centroid.asPoint()
+            centroids[feat.id()] = centroid
+            centroid_idx.addFeature(feat.id(), QgsRectangle(centroid, centroid))
+        
+        feedback.setProgressText('Start processing...')
+        selected_ids = []
+        for current, feat in enumerate(layer.getFeatures(QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setNoAttributes())): # iterate over source, values and centroids are already read
+            if feedback.isCanceled(): # Cancel algorithm if button is pressed
+                break
+            if feat.id() in values: # only compare if field is not empty
+                feat_keys = values[feat.id()]
+                feat_centroid = centroids.get(feat.id())
+                if feat_centroid is None:
+                    lookup_ids = list(values.keys())
+                else:
+                    lookup_ids = centroid_idx.intersects(QgsRectangle(feat_centroid.x() - maxdist, feat_centroid.y() - maxdist, feat_centroid.x() + maxdist, feat_centroid.y() + maxdist))
+                    lookup_ids += nogeometry_ids
+                for lookupnr in sorted(lookup_ids): # only compare to previous features, because we do not want to select the first feature of each duplicate group
+                    if lookupnr >= feat.id():
+                        break
+                    if lookupnr not in values: # only compare if field is not empty
+                        continue
+                    lookup_centroid = centroids.get(lookupnr)
+                    if feat_centroid is not None and lookup_centroid is not None: # only select if within given maxdistance
+                        if math.sqrt((feat_centroid.x() - lookup_centroid.x()) ** 2 + (feat_centroid.y() - lookup_centroid.y()) ** 2) > maxdist:
+                            continue
+                    if similarity_engine.similar(feat_keys, values[lookupnr]): # select the current feature if similar; no need to compare it to further features
+                        selected_ids.append(feat.id())
+                        break
+                    
             feedback.setProgress(int(current * total)) # Set Progress in Progressbar
+        
+        layer.select(selected_ids)
 
         return {self.OUTPUT: parameters[self.SOURCE_LYR]} # Return result of algorithm
 
@@ -19,6 +19,7 @@ from PyQt5.QtCore import QCoreApplication, QVariant
 from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsSpatialIndex, QgsGeometry, QgsPointXY, QgsWkbTypes,
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm, QgsExpressionContext, QgsExpressionContextUtils, QgsProcessingParameterDefinition,
                        QgsProcessingParameterVectorLayer, QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterDistance, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterExpression, QgsProcessingParameterNumber, QgsProcessingParameterString, QgsProcessingParameterBoolean)
+from ..helpers.ConsumedIdTracker import ConsumedIdTracker
 
 class SnapVerticesToNearestPointsByCondition(QgsProcessingAlgorithm):
     SOURCE_LYR = 'SOURCE_LYR'
@@ -226,7 +227,7 @@ class SnapVerticesToNearestPointsByCondition(QgsProcessingAlgorithm):
                 points_layer_dict2[points_feat.id()] = points_compare_expression_result2
                 feedback.setProgress(int(current * total))
         if snap_multiple == 1: # clear skip list for layer
-            points_skip = []
+            points_skip = ConsumedIdTracker()
             
         source_orderby_request = QgsFeatureRequest()
         if source_orderby_expression not in (QgsExpression(''),QgsExpression(None)):
@@ -244,7 +245,7 @@ class SnapVerticesToNearestPointsByCondition(QgsProcessingAlgorithm):
             if feedback.isCanceled():
                 break
             if snap_multiple == 2: # clear skip list for feature
-                points_skip = []    
+                points_skip = ConsumedIdTracker()    
             current += 1
             line_geom = line_feat.geometry()
             new_geom = line_geom # to be modified
@@ -259,7 +260,7 @@ class SnapVerticesToNearestPointsByCondition(QgsProcessingAlgorithm):
                 if feedback.isCanceled():
                     break
                 if snap_multiple == 3: # clear skip list for part
-                    points_skip = []
+                    points_skip = ConsumedIdTracker()
                 n_vertices_line_part = len([v for i, v in enumerate(line_part.vertices())])
                 for line_part_vertex_id, line_vertex in enumerate(line_part.vertices()):
                     if feedback.isCanceled():
@@ -289,7 +290,7 @@ class SnapVerticesToNearestPointsByCondition(QgsProcessingAlgorithm):
                     if doit:
                         nearest_neighbors = points_layer_idx.nearestNeighbor(QgsPointXY(line_vertex), neighbors=n_neighbors, maxDistance=snap_dist)
                         if not snap_multiple == 0:
-                            nearest_neighbors = [x for x in nearest_neighbors if x not in points_skip]
+                            nearest_neighbors = points_skip.filter(nearest_neighbors)
                         for nearest_neighbor_id in nearest_neighbors:
                             if feedback.isCanceled():
                                 break
@@ -300,7 +301,7 @@ class SnapVerticesToNearestPointsByCondition(QgsProcessingAlgorithm):
                                     nearest_neighbor_geom = points_layer_idx.geometry(nearest_neighbor_id)
                                     new_geom.moveVertex(nearest_neighbor_geom.asPoint().x(),nearest_neighbor_geom.asPoint().y(), line_vertex_id)
                                     if not snap_multiple == 0:
-                                        points_skip.append(nearest_neighbor_id)
+                                        points_skip.consume(nearest_neighbor_id)
                                     break # stop testing after first match
                                 else:
                                     continue
@@ -308,7 +309,7 @@ class SnapVerticesToNearestPointsByCondition(QgsProcessingAlgorithm):
                                 nearest_neighbor_geom = points_layer_idx.geometry(nearest_neighbor_id)
                                 new_geom.moveVertex(nearest_neighbor_geom.asPoint().x(),nearest_neighbor_geom.asPoint().y(), line_vertex_id)
                                 if not snap_multiple == 0:
-                                    points_skip.append(nearest_neighbor_id)
+                                    points_skip.consume(nearest_neighbor_id)
                                 break # should actually be only one in list, but just to be sure :)
                     line_vertex_id += 1 # line_part_vertex_id is not the same!
                     
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Similarity tests of SelectDuplicatesBySimilarity for many pairs of attribute values. Everything that only depends on one value
+# (text, case folded text, length, soundex code, q-grams) is computed once per value. Before an expensive metric runs, pairs are
+# pruned by cheap bounds: the length difference and the number of common q-grams bound the Levenshtein distance, the length and
+# common q-grams bound the longest common substring. Levenshtein is computed in a band around the diagonal and stops as soon as the
+# threshold can not be reached anymore. The results are the same as the ones of the metric functions passed in (QgsStringUtils,
+# case insensitive like its defaults).
+
+from collections import Counter
+
+QGRAM_SIZE = 2
+
+class SimilarityKeys():
+    __slots__ = ('value', 'text', 'folded', 'length', 'soundex', 'qgrams', 'prunable')
+
+def levenshtein_below(a, b, limit):
+    """Returns True if the Levenshtein distance of a and b is lower than limit; only the band of cells that can stay below limit is computed."""
+    if limit <= 0:
+        return False
+    k = limit - 1 # maximum distance
+    len_a, len_b = len(a), len(b)
+    if abs(len_a - len_b) > k:
+        return False
+    if len_a > len_b:
+        a, b, len_a, len_b = b, a, len_b, len_a
+    out = k + 1 # every value above k is stored as k + 1
+    previous = [j if j <= k else out for j in range(len_b + 1)]
+    for i in range(1, len_a + 1):
+        char_a = a[i - 1]
+        low = max(1, i - k)
+        high = min(len_b, i + k)
+        current = [out] * (len_b + 1)
+        if low == 1:
+            current[0] = i if i <= k else out
+        row_min = current[0]
+        for j in range(low, high + 1):
+            cost = previous[j - 1] + (char_a != b[j - 1])
+            deletion = previous[j] + 1
+            if deletion < cost:
+                cost = deletion
+            insertion = current[j - 1] + 1
+            if insertion < cost:
+                cost = insertion
+            if cost > out:
+                cost = out
+            current[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > k: # the distance can only grow from here
+            return False
+        previous = current
+    return previous[len_b] <= k
+
+def common_qgrams(qgrams_a, qgrams_b):
+    if len(qgrams_a) > len(qgrams_b):
+        qgrams_a, qgrams_b = qgrams_b, qgrams_a
+    return sum(min(count, qgrams_b[qgram]) for qgram, count in qgrams_a.items() if qgram in qgrams_b)
+
+class SimilarityEngine():
+    """
+    algorithms are the indexes of the ALGORITHM parameter (0 exact, 1 soundex, 2 levenshtein, 3 longest common substring, 4 hamming),
+    all_must_match is True for "All" and False for "Only at least one". The metric functions are the ones of QgsStringUtils (or equivalents).
+    """
+    def __init__(self, algorithms, all_must_match, threshold_levenshtein, threshold_substring, threshold_hamming,
+                 soundex, levenshtein_distance, longest_common_substring, hamming_distance, qgram_size = QGRAM_SIZE):
+        # cheapest tests first, so a pair is decided as early as possible
+        self.tests = [test for index, test in ((0, self.exact), (1, self.soundex), (4, self.hamming), (2, self.levenshtein), (3, self.substring)) if index in algorithms]
+        self.all_must_match = all_must_match
+        self.threshold_levenshtein = max(0, threshold_levenshtein)
+        self.threshold_substring = threshold_substring
+        self.threshold_hamming = threshold_hamming
+        self.soundex_function = soundex
+        self.levenshtein_distance = levenshtein_distance
+        self.longest_common_substring = longest_common_substring
+        self.hamming_distance = hamming_distance
+        self.qgram_size = qgram_size
+        self.needs_soundex = 1 in algorithms
+        self.needs_qgrams = 2 in algorithms or 3 in algorithms
+
+    def keys(self, value):
+        """Precomputes everything the tests need of one (non-empty) attribute value."""
+        keys = SimilarityKeys()
+        keys.value = value
+        keys.text = str(value)
+        keys.folded = ''.join([char.lower() for char in keys.text]) # per character, like QString::toLower (no context dependent mappings)
+        keys.length = len(keys.text)
+        # The bounds and own metrics work on characters, QString on UTF-16 units; values where these differ (characters outside the
+        # basic multilingual plane, lower case mappings to more than one character) are always tested with the given metric functions
+        keys.prunable = len(keys.folded) == keys.length and all(ord(char) <= 0xFFFF for char in keys.text)
+        keys.soundex = self.soundex_function(keys.text) if self.needs_soundex else None
+        keys.qgrams = None
+        if self.needs_qgrams and keys.prunable:
+            q = self.qgram_size
+            keys.qgrams = Counter(keys.folded[i:i + q] for i in range(len(keys.folded) - q + 1))
+        return keys
+
+    def exact(self, current, lookup):
+        return current.value == lookup.value
+
+    def soundex(self, current, lookup):
+        return current.soundex == lookup.soundex
+
+    def hamming(self, current, lookup):
+        threshold = max(0, current.length - self.threshold_hamming)
+        if not (current.prunable and lookup.prunable):
+            return self.hamming_distance(current.text, lookup.text) > threshold
+        if current.length != lookup.length or current.length <= threshold: # -1 for different lengths, never more than the length
+            return False
+        return sum(1 for char_a, char_b in zip(current.folded, lookup.folded) if char_a != char_b) > threshold
+
+    def levenshtein(self, current, lookup):
+        limit = self.threshold_levenshtein
+        if not (current.prunable and lookup.prunable):
+            return self.levenshtein_distance(current.text, lookup.text) < limit
+        if limit <= 0 or abs(current.length - lookup.length) >= limit:
+            return False
+        # Every edit destroys at most q q-grams, so a distance below limit leaves at least this many q-grams in common
+        q = self.qgram_size
+        needed = max(current.length, lookup.length) - q + 1 - (limit - 1) * q
+        if needed > 0 and common_qgrams(current.qgrams, lookup.qgrams) < needed:
+            return False
+        return levenshtein_below(current.folded, lookup.folded, limit)
+
+    def substring(self, current, lookup):
+        threshold = max(0, current.length - self.threshold_substring)
+        if current.prunable and lookup.prunable:
+            if min(current.length, lookup.length) <= threshold:
+                return False
+            # A common substring longer than the threshold contains at least one common q-gram
+            if threshold + 1 >= self.qgram_size and common_qgrams(current.qgrams, lookup.qgrams) == 0:
+                return False
+        return len(self.longest_common_substring(current.text, lookup.text)) > threshold
+
+    def similar(self, current, lookup):
+        """Returns True if the feature with the keys current is a possible duplicate of the feature with the keys lookup."""
+        if self.all_must_match:
+            for test in self.tests:
+                if not test(current, lookup):
+                    return False
+            return True
+        for test in self.tests:
+            if test(current, lookup):
+                return True
+        return False
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+from collections import Counter
+from PyQt5.QtCore import QCoreApplication, QVariant
+from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsGeometry, QgsWkbTypes,
+                       QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm, QgsExpressionContext, QgsExpressionContextUtils,
+                       QgsProcessingParameterVectorLayer, QgsProcessingParameterFeatureSink, QgsProcessingParameterBoolean, QgsProcessingParameterExtent,
+                       QgsProcessingParameterEnum, QgsProcessingParameterExpression, QgsProcessingParameterNumber, QgsProcessingParameterString)
+from .NestedGrid import nested_grid_fields, rectangle_cell, RectangleBinning, HexagonSubgrid
+from ..helpers.BufferedFeatureWriter import BufferedFeatureWriter
+from ..helpers.ThrottledProgress import ThrottledProgress
+
+class CountPointsInNestedGrid(QgsProcessingAlgorithm):
+    POINT_LYR = 'POINT_LYR'
+    POINT_FILTER_EXPRESSION = 'POINT_FILTER_EXPRESSION'
+    POINT_CATEGORY_EXPRESSION = 'POINT_CATEGORY_EXPRESSION'
+    EXTENT = 'EXTENT'
+    GRIDTYPE = 'GRIDTYPE'
+    XSPACING = 'XSPACING'
+    YSPACING = 'YSPACING'
+    SUBGRIDS = 'SUBGRIDS'
+    LETTERS = 'LETTERS'
+    XFACTOR = 'XFACTOR'
+    YFACTOR = 'YFACTOR'
+    STARTWITHPARENT = 'STARTWITHPARENT'
+    COUNT_FIELDNAME = 'COUNT_FIELDNAME'
+    OUTPUT = 'OUTPUT'
+
+    def initAlgorithm(self, config=None):
+
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.POINT_LYR, self.tr('Point Layer (Points to count; every part of a MultiPoint is counted)'), [QgsProcessing.TypeVectorPoint]))
+        self.addParameter(
+            QgsProcessingParameterExpression(
+                self.POINT_FILTER_EXPRESSION, self.tr('Filter-Expression for Point-Layer'), parentLayerParameterName = 'POINT_LYR', optional = True))
+        self.addParameter(
+            QgsProcessingParameterExpression(
+                self.POINT_CATEGORY_EXPRESSION, self.tr('Category-Expression or Field for Point-Layer (optional; adds a count field for each category)'), parentLayerParameterName = 'POINT_LYR', optional = True))
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.GRIDTYPE, self.tr('Gridtype'), ['Rectangle','Hexagon'], defaultValue = 0, allowMultiple = False))
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.LETTERS, self.tr('Use Latin Grid-Letters instead of Grid-Numbers on Axis'), ['X','Y'], defaultValue = 0, allowMultiple = True, optional = True))
+        self.addParameter(
+            QgsProcessingParameterExtent(
+                self.EXTENT, self.tr('Extent of the Grid (if not set, the extent of the Point-Layer)'), optional = True))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.STARTWITHPARENT, self.tr('Start with Parentgrid, so larger grids lie behind their childs (if unchecked, the largest grid lies on top and childs are not initially visible)'), defaultValue = 0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SUBGRIDS, self.tr('Number of Subgrids incl. Parentgrid (1 means only Parentgrid)'), minValue = 1, maxValue = 999, defaultValue = 3, type = 0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.XSPACING, self.tr('X-Spacing of Parentgrid in Point-Layer-CRS-Units'), minValue = 0.000001, defaultValue = 1000, type = 1))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.XFACTOR, self.tr('X-Factor: Number of childcells per parentcell in X direction'), minValue = 1, maxValue = 9999, defaultValue = 2, type = 0))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.YSPACING, self.tr('Y-Spacing of Parentgrid in Point-Layer-CRS-Units'), minValue = 0.000001, defaultValue = 1000, type = 1))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.YFACTOR, self.tr('Y-Factor: Number of childcells per parentcell in Y direction'), minValue = 1, maxValue = 9999, defaultValue = 2, type = 0))
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.COUNT_FIELDNAME, self.tr('Count Fieldname (also prefix of the category count fields)'), defaultValue = 'pointcount', optional = False))
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT, self.tr('Grid with Pointcount')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        feedback.setProgressText('Prepare processing...')
+        point_layer_vl = self.parameterAsLayer(parameters, self.POINT_LYR, context)
+        point_filter_expression = self.parameterAsExpression(parameters, self.POINT_FILTER_EXPRESSION, context)
+        point_filter_expression = QgsExpression(point_filter_expression)
+        point_category_expression = self.parameterAsExpression(parameters, self.POINT_CATEGORY_EXPRESSION, context)
+        point_category_expression = QgsExpression(point_category_expression)
+        gridtype = self.parameterAsInt(parameters, self.GRIDTYPE, context)
+        extent_rect = self.parameterAsExtent(parameters, self.EXTENT, context, point_layer_vl.sourceCrs())
+        xspacing = self.parameterAsDouble(parameters, self.XSPACING, context)
+        yspacing = self.parameterAsDouble(parameters, self.YSPACING, context)
+        subgrids = self.parameterAsInt(parameters, self.SUBGRIDS, context)
+        xfactor = self.parameterAsInt(parameters, self.XFACTOR, context)
+        yfactor = self.parameterAsInt(parameters, self.YFACTOR, context)
+        startwithparent = self.parameterAsBool(parameters, self.STARTWITHPARENT, context)
+        letters = self.parameterAsEnums(parameters, self.LETTERS, context)
+        count_fieldname = self.parameterAsString(parameters, self.COUNT_FIELDNAME, context)
+
+        if extent_rect.isNull():
+            extent_rect = point_layer_vl.extent()
+        if not extent_rect.isFinite():
+            feedback.reportError('The chosen extent is not finite!', fatalError = True)
+
+        use_categories = point_category_expression not in (QgsExpression(''),QgsExpression(None))
+        if point_filter_expression not in (QgsExpression(''),QgsExpression(None)):
+            point_layer_vl = point_layer_vl.materialize(QgsFeatureRequest(point_filter_expression)) # so featureCount() is the number of filtered points
+        request = QgsFeatureRequest()
+        if not use_categories:
+            request.setSubsetOfAttributes([]) # only the geometries are needed
+
+        # The grid is the same CreateNestedGrid creates for this extent, but the cells containing a point are computed by arithmetic
+        # (see NestedGrid.py) instead of creating all cells and counting the points in them; only cells containing points are created
+        if gridtype == 0:
+            n_parentgrids_x = max(1, int(math.ceil(extent_rect.width() / xspacing)))
+            n_parentgrids_y = max(1, int(math.ceil(extent_rect.height() / yspacing)))
+            binning = RectangleBinning(extent_rect.xMinimum(), extent_rect.yMaximum(), xspacing, yspacing, n_parentgrids_x, n_parentgrids_y, xfactor, yfactor, subgrids)
+        elif gridtype == 1:
+            n_parentgrids_x = int(math.ceil(extent_rect.width() / xspacing)) + 1
+            n_parentgrids_y = int(math.ceil(extent_rect.height() / yspacing)) + 1
+            hexagon_subgrids = {}
+            for i in range(1,subgrids+1):
+                hexagon_subgrids[i] = HexagonSubgrid(extent_rect.xMinimum(), extent_rect.yMaximum(), xspacing, yspacing, n_parentgrids_x, n_parentgrids_y,
+                                                     xspacing / xfactor**(i-1), yspacing / yfactor**(i-1))
+
+        total = 50.0 / point_layer_vl.featureCount() if point_layer_vl.featureCount() else 0
+        current = 0
+        progress = ThrottledProgress(feedback)
+
+        feedback.setProgressText('Counting points in cells...')
+        point_category_expression_context = QgsExpressionContext()
+        point_category_expression_context.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(point_layer_vl))
+        counts = Counter() # (subgrid, row, column): number of points
+        category_counts = Counter() # (subgrid, row, column, category): number of points
+        n_outside = 0
+        for point_feat in point_layer_vl.getFeatures(request):
+            current += 1
+            if feedback.isCanceled():
+                break
+            progress.setProgress(int(current * total))
+            point_geom = point_feat.geometry()
+            if point_geom.isEmpty():
+                continue
+            if use_categories:
+                point_category_expression_context.setFeature(point_feat)
+                category = point_category_expression.evaluate(point_category_expression_context)
+            if point_geom.isMultipart():
+                points = point_geom.asMultiPoint()
+            else:
+                points = [point_geom.asPoint()]
+            for point in points:
+                if gridtype == 0:
+                    cells = [(subgrid, row, column) for subgrid, column, row in binning.cells(point.x(), point.y())]
+                else:
+                    cells = []
+                    for subgrid, hexagon_subgrid in hexagon_subgrids.items():
+                        row_column = hexagon_subgrid.locate(point.x(), point.y())
+                        if row_column is not None:
+                            cells.append((subgrid,) + row_column)
+                if not cells:
+                    n_outside += 1
+                for cell in cells:
+                    counts[cell] += 1
+                    if use_categories:
+                        category_counts[cell + (category,)] += 1
+        if n_outside > 0:
+            feedback.pushWarning(str(n_outside) + ' points lie outside of the grid and are not counted')
+
+        output_layer_fields = nested_grid_fields(letters)
+        whilecounter = 0
+        while count_fieldname in output_layer_fields.names():
+            whilecounter += 1
+            count_fieldname = count_fieldname + '_2'
+            if whilecounter > 9:
+                feedback.setProgressText('You should clean up your fieldnames!')
+                break
+        output_layer_fields.append(QgsField(count_fieldname, QVariant.Int))
+        categories = []
+        if use_categories:
+            categories = list(set(cell[3] for cell in category_counts.keys()))
+            categories.sort(key = str)
+            if len(categories) > 250:
+                feedback.pushWarning('WARNING: Output layer will have more than ' + str(len(categories)) + ' category fields. Expect QGIS to crash when you open the attribute table of the result!')
+            for category in categories:
+                output_layer_fields.append(QgsField(count_fieldname + '_' + str(category), QVariant.Int))
+
+        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context, output_layer_fields, QgsWkbTypes.Polygon, point_layer_vl.sourceCrs())
+
+        if startwithparent:
+            iterationrange = range(1,subgrids+1,1)
+        else:
+            iterationrange = range(subgrids,0,-1)
+        cells_per_subgrid = {}
+        for cell in counts.keys():
+            cells_per_subgrid.setdefault(cell[0], []).append(cell)
+
+        feedback.setProgressText('Creating ' + str(len(counts)) + ' cells containing points...')
+        total = 50.0 / len(counts) if len(counts) > 0 else 0
+        current = 0
+        writer = BufferedFeatureWriter(sink, QgsFeatureSink.FastInsert)
+
+        fid = 1
+        for subgrid in iterationrange:
+            if feedback.isCanceled():
+                break
+            step_x = xspacing / xfactor**(subgrid-1)
+            step_y = yspacing / yfactor**(subgrid-1)
+            uid_prefix = str(subgrid).zfill(len(str(subgrids)))
+            for cell in sorted(cells_per_subgrid.get(subgrid, [])): # row by row, like the cells of CreateNestedGrid
+                current += 1
+                if feedback.isCanceled():
+                    break
+                subgrid, row, column = cell
+                if gridtype == 0:
+                    grid_wkb, grid_attributes = rectangle_cell(extent_rect.xMinimum(), extent_rect.yMaximum(), step_x, step_y, column, row,
+                                                               xfactor**(subgrid-1), yfactor**(subgrid-1), subgrid, uid_prefix, 0 in letters, 1 in letters)
+                else:
+                    grid_wkb, grid_attributes = hexagon_subgrids[subgrid].cell(row, column, subgrid, uid_prefix, 0 in letters, 1 in letters)
+                grid_geom = QgsGeometry()
+                grid_geom.fromWkb(grid_wkb)
+                new_feat = QgsFeature(output_layer_fields)
+                new_feat.setGeometry(grid_geom)
+                new_feat.setAttributes([fid] + grid_attributes + [counts[cell]] + [category_counts[cell + (category,)] for category in categories])
+                writer.addFeature(new_feat)
+                fid += 1
+                progress.setProgress(50 + int(current * total))
+        writer.flush()
+        progress.finish()
+
+        return {self.OUTPUT: dest_id}
+
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return CountPointsInNestedGrid()
+
+    def name(self):
+        return 'CountPointsInNestedGrid'
+
+    def displayName(self):
+        return self.tr('Count Points in Nested Grid')
+
+    def group(self):
+        return self.tr(self.groupId())
+
+    def groupId(self):
+        return 'Vector - Creation'
+
+    def shortHelpString(self):
+        return self.tr('This Algorithm counts points in the cells of a nested grid without creating the whole grid first. '
+                       'The grid is the same the algorithm Create Nested Grid creates with the same parameters (extent, gridtype, spacings, factors, number of subgrids), '
+                       'but only cells containing at least one point are created, with the number of points in them.'
+                       '\n The cells containing a point are computed by arithmetic: for rectangles, the column and row of the smallest cell are the distance to the top left corner '
+                       'of the grid divided by its spacing, the cells of the larger subgrids follow by integer division by the x- and y-factor. '
+                       'For hexagons, the cell of every subgrid is found from the axial coordinates of the point. This is much faster than creating all cells and counting the points in polygons.'
+                       '\n Points on the border of two rectangles are counted in the right or lower one. Points outside of the grid are not counted. '
+                       'If no extent is given, the extent of the point layer is used; the grid is created in the CRS of the point layer.'
+                       '\n Optionally a category expression can be given; then a field with the count of every category is added (count fieldname + _ + category).'
+                       '\n The fields of the cells are the same as in Create Nested Grid, see its help for their meaning.'
+                       )
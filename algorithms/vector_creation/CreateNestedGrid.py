@@ -20,6 +20,9 @@ from qgis.core import (QgsField, QgsFields, QgsFeature, QgsProcessing, QgsExpres
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm, QgsExpressionContext, QgsExpressionContextUtils,
                        QgsProcessingParameterFeatureSink, QgsProcessingParameterBoolean, QgsProcessingParameterField, QgsProcessingParameterExtent, QgsProcessingParameterDistance, QgsProcessingParameterFeatureSource, 
                        QgsProcessingParameterEnum, QgsProcessingParameterExpression, QgsProcessingParameterNumber, QgsProcessingParameterString)
+from .NestedGrid import nested_grid_fields, rectangle_subgrid_rows, HexagonSubgrid
+from ..helpers.BufferedFeatureWriter import BufferedFeatureWriter
+from ..helpers.ThrottledProgress import ThrottledProgress
 
 class CreateNestedGrid(QgsProcessingAlgorithm):
     EXTENT = 'EXTENT'
@@ -44,25 +47,13 @@ class CreateNestedGrid(QgsProcessingAlgorithm):
         if endpoint is False:
             del result[-1]
         return result
-    
-    # Source: https://stackoverflow.com/a/42176641/8947209
-    def num_to_char(self, n):
-        if n < 1:
-            raise ValueError("Number must be positive")
-        result = ""
-        while True:
-            if n > 26:
-                n, r = divmod(n - 1, 26)
-                result = chr(r + ord('A')) + result
-            else:
-                return chr(n + ord('A') - 1) + result
         
         
     def initAlgorithm(self, config=None):
         
         self.addParameter(
             QgsProcessingParameterEnum(
-                self.GRIDTYPE, self.tr('Gridtype'), ['Rectangle'], defaultValue = 0, allowMultiple = False))
+                self.GRIDTYPE, self.tr('Gridtype'), ['Rectangle','Hexagon'], defaultValue = 0, allowMultiple = False))
         self.addParameter(
             QgsProcessingParameterEnum(
                 self.LETTERS, self.tr('Use Latin Grid-Letters instead of Grid-Numbers on Axis'), ['X','Y'], defaultValue = 0, allowMultiple = True, optional = True))
@@ -113,45 +104,17 @@ class CreateNestedGrid(QgsProcessingAlgorithm):
         if not extent_rect.isFinite():
             feedback.reportError('The chosen extent is not finite!', fatalError = True)
         
-        output_layer_fields = QgsFields()
-        output_layer_fields.append(QgsField('fid', QVariant.Int))
-        output_layer_fields.append(QgsField('uid', QVariant.String))
-        output_layer_fields.append(QgsField('s_id', QVariant.Int))
-        if 0 in letters:
-            output_layer_fields.append(QgsField('p_x_id', QVariant.String))
-        else:
-            output_layer_fields.append(QgsField('p_x_id', QVariant.Int))
-        if 1 in letters:
-            output_layer_fields.append(QgsField('p_y_id', QVariant.String))
-        else:
-            output_layer_fields.append(QgsField('p_y_id', QVariant.Int))
-        if 0 in letters:
-            output_layer_fields.append(QgsField('c_x_id', QVariant.String))
-        else:
-            output_layer_fields.append(QgsField('c_x_id', QVariant.Int))
-        if 1 in letters:
-            output_layer_fields.append(QgsField('c_y_id', QVariant.String))
-        else:
-            output_layer_fields.append(QgsField('c_y_id', QVariant.Int))
-        output_layer_fields.append(QgsField('x_cent', QVariant.Double))
-        output_layer_fields.append(QgsField('y_cent', QVariant.Double))
-        output_layer_fields.append(QgsField('v_coords', QVariant.String))
-        output_layer_fields.append(QgsField('x_space', QVariant.Double))
-        output_layer_fields.append(QgsField('y_space', QVariant.Double))
+        output_layer_fields = nested_grid_fields(letters)
         
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context, output_layer_fields, QgsWkbTypes.Polygon, extent_crs)
         
         feedback.setProgressText('Start processing...')
+        if startwithparent:
+            iterationrange = range(1,subgrids+1,1)
+        else:
+            iterationrange = range(subgrids,0,-1)
+        
         if gridtype == 0:
-            if startwithparent:
-                iterationrange = range(1,subgrids+1,1)
-                step_x = xspacing
-                step_y = yspacing
-            else:
-                iterationrange = range(subgrids,0,-1)
-                step_x = xfactor**((subgrids-1)*-1)*xspacing
-                step_y = yfactor**((subgrids-1)*-1)*yspacing
-            
             n_parentgrids_x = int(math.ceil(extent_rect.width() / xspacing))
             n_parentgrids_y = int(math.ceil(extent_rect.height() / yspacing))
             n_parentgrids_t = (n_parentgrids_x * n_parentgrids_y)
@@ -168,118 +131,68 @@ class CreateNestedGrid(QgsProcessingAlgorithm):
                 cells_per_subgrid[i] = childcells_per_parentcell * n_parentgrids_t
                 xcells_per_subgrid[i] = int(xfactor**(i-1) * n_parentgrids_x)
                 ycells_per_subgrid[i] = int(yfactor**(i-1) * n_parentgrids_y)
-            if n_totalcells > 1000000:
-                feedback.pushWarning('Settings will create ' + str(n_parentgrids_t) + ' parent-gridcells and ' + str(n_totalcells-n_parentgrids_t) + ' child-gridcells for ' + str(subgrids-1) + ' childgrids (= ' + str(n_totalcells) + ' gridcells in total)')
-                feedback.pushWarning('This may take a while!')
-                feedback.pushWarning('Consider choosing a smaller extent, fewer subgrids, a greater spacing or a lower x/y factor')
+        elif gridtype == 1:
+            # The center of the top left parent cell lies on the top left corner of the extent; every other row is shifted by half a cell,
+            # so one more column and row than with rectangles are needed to cover the extent
+            n_parentgrids_x = int(math.ceil(extent_rect.width() / xspacing)) + 1
+            n_parentgrids_y = int(math.ceil(extent_rect.height() / yspacing)) + 1
+            n_parentgrids_t = (n_parentgrids_x * n_parentgrids_y)
+            hexagon_subgrids = {}
+            cells_per_subgrid = {}
+            for i in range(1,subgrids+1):
+                hexagon_subgrids[i] = HexagonSubgrid(extent_rect.xMinimum(), extent_rect.yMaximum(), xspacing, yspacing, n_parentgrids_x, n_parentgrids_y,
+                                                     xspacing / xfactor**(i-1), yspacing / yfactor**(i-1))
+                cells_per_subgrid[i] = hexagon_subgrids[i].n_cells
+            n_totalcells = sum(cells_per_subgrid.values())
+            
+        if n_totalcells > 1000000:
+            feedback.pushWarning('Settings will create ' + str(n_parentgrids_t) + ' parent-gridcells and ' + str(n_totalcells-n_parentgrids_t) + ' child-gridcells for ' + str(subgrids-1) + ' childgrids (= ' + str(n_totalcells) + ' gridcells in total)')
+            feedback.pushWarning('This may take a while!')
+            feedback.pushWarning('Consider choosing a smaller extent, fewer subgrids, a greater spacing or a lower x/y factor')
+        else:
+            feedback.setProgressText('Settings will create ' + str(n_parentgrids_t) + ' parent-gridcells and ' + str(n_totalcells-n_parentgrids_t) + ' child-gridcells for ' + str(subgrids-1) + ' childgrids (= ' + str(n_totalcells) + ' gridcells in total)')
+            
+        total = 100.0 / n_totalcells if n_totalcells > 0 else 0
+        current = 0
+        writer = BufferedFeatureWriter(sink, QgsFeatureSink.FastInsert)
+        progress = ThrottledProgress(feedback)
+        
+        fid = 1
+        for subgrid in iterationrange:
+            if feedback.isCanceled():
+                break
+            if subgrid == 1:
+                feedback.setProgressText('Creating ' + str(cells_per_subgrid[subgrid]) + ' cells for Parentgrid #' + str(subgrid) + '...')
             else:
-                feedback.setProgressText('Settings will create ' + str(n_parentgrids_t) + ' parent-gridcells and ' + str(n_totalcells-n_parentgrids_t) + ' child-gridcells for ' + str(subgrids-1) + ' childgrids (= ' + str(n_totalcells) + ' gridcells in total)')
-                
-            total = 100.0 / n_totalcells if n_totalcells > 0 else 0
-            current = 0
+                feedback.setProgressText('Creating ' + str(cells_per_subgrid[subgrid]) + ' cells for Subgrid #' + str(subgrid) + '...')
+            step_x = xspacing / xfactor**(subgrid-1)
+            step_y = yspacing / yfactor**(subgrid-1)
+            uid_prefix = str(subgrid).zfill(len(str(subgrids)))
             
-            fid = 1
-            for subgrid in iterationrange:
+            # The cells are computed row by row (see NestedGrid.py), the polygons of a row come as WKB
+            if gridtype == 0:
+                grid_rows = rectangle_subgrid_rows(extent_rect.xMinimum(), extent_rect.yMaximum(), step_x, step_y,
+                                                   xcells_per_subgrid[subgrid], ycells_per_subgrid[subgrid],
+                                                   int(xfactor**(subgrid-1)), int(yfactor**(subgrid-1)),
+                                                   subgrid, uid_prefix, 0 in letters, 1 in letters)
+            else:
+                grid_rows = hexagon_subgrids[subgrid].rows(subgrid, uid_prefix, 0 in letters, 1 in letters)
+            for grid_row in grid_rows:
                 if feedback.isCanceled():
                     break
-                if subgrid == 1:
-                    feedback.setProgressText('Creating ' + str(cells_per_subgrid[subgrid]) + ' cells for Parentgrid #' + str(subgrid) + '...')
-                else:
-                    feedback.setProgressText('Creating ' + str(cells_per_subgrid[subgrid]) + ' cells for Subgrid #' + str(subgrid) + '...')
-                p_x_id = 1
-                p_y_id = 1
-                c_x_id = 1
-                c_y_id = 1
-                parentcellindicator_x = 1
-                parentcellindicator_y = 1
-                
-                start_pointxy = QgsPointXY(extent_rect.xMinimum(),extent_rect.yMaximum())
-                point_topleft_pxy = start_pointxy
+                for grid_wkb, grid_attributes in grid_row:
+                    grid_geom = QgsGeometry()
+                    grid_geom.fromWkb(grid_wkb)
+                    new_feat = QgsFeature(output_layer_fields)
+                    new_feat.setGeometry(grid_geom)
+                    new_feat.setAttributes([fid] + grid_attributes)
+                    writer.addFeature(new_feat)
+                    fid += 1
                 
-                for currenty in range(1,ycells_per_subgrid[subgrid]+1):
-                    if feedback.isCanceled():
-                        break
-                    # reset x on start of each y row:
-                    point_topleft_pxy = QgsPointXY(start_pointxy.x(),point_topleft_pxy.y())
-                    
-                    for currentx in range(1,xcells_per_subgrid[subgrid]+1):
-                        if feedback.isCanceled():
-                            break
-                        point_topright_pxy = point_topleft_pxy.project(step_x,90)
-                        point_lowerright_pxy = point_topright_pxy.project(step_y,180)
-                        point_lowerleft_pxy = point_lowerright_pxy.project(step_x,270)
-                        grid_geom = [point_topleft_pxy,
-                                     point_topright_pxy,
-                                     point_lowerright_pxy,
-                                     point_lowerleft_pxy,
-                                     point_topleft_pxy]
-                        grid_geom = QgsGeometry.fromPolygonXY([grid_geom])
-                        new_feat = QgsFeature(output_layer_fields)
-                        new_feat.setGeometry(grid_geom)
-                        new_feat['x_cent'] = grid_geom.centroid().asPoint().x()
-                        new_feat['y_cent'] = grid_geom.centroid().asPoint().y()
-                        new_feat['v_coords'] = ';'.join([str(vert.x())+','+str(vert.y()) for vert in grid_geom.vertices()])
-                        new_feat['x_space'] = step_x
-                        new_feat['y_space'] = step_y
-                        new_feat['fid'] = fid
-                        uid = str(subgrid).zfill(len(str(subgrids)))
-                        if 0 in letters:
-                            new_feat['p_x_id'] = self.num_to_char(p_x_id)
-                            new_feat['c_x_id'] = self.num_to_char(c_x_id)
-                            uid = uid + '_' + self.num_to_char(p_x_id) + '_' + self.num_to_char(c_x_id)
-                        else:
-                            new_feat['p_x_id'] = p_x_id
-                            new_feat['c_x_id'] = c_x_id
-                            uid = uid + '_' + str(p_x_id) + '_' + str(c_x_id)
-                        if 1 in letters:
-                            new_feat['p_y_id'] = self.num_to_char(p_y_id)
-                            new_feat['c_y_id'] = self.num_to_char(c_y_id)
-                            uid = uid + '_' + self.num_to_char(p_y_id) + '_' + self.num_to_char(c_y_id)
-                        else:
-                            new_feat['p_y_id'] = p_y_id
-                            new_feat['c_y_id'] = c_y_id
-                            uid = uid + '_' + str(p_y_id) + '_' + str(c_y_id)
-                        new_feat['s_id'] = subgrid
-                        new_feat['uid'] = uid
-                    
-                        sink.addFeature(new_feat, QgsFeatureSink.FastInsert)
-                        fid += 1
-                    
-                        current += 1
-                        feedback.setProgress(int(current * total))
-                    
-                        #next x:
-                        point_topleft_pxy = QgsPointXY(point_topleft_pxy.x()+step_x,point_topleft_pxy.y())
-                        if xfactor**(subgrid-1) == parentcellindicator_x:
-                            p_x_id += 1
-                            parentcellindicator_x = 0
-                        parentcellindicator_x += 1
-                        c_x_id += 1
-                    
-                    #next y (reset x):
-                    point_topleft_pxy = QgsPointXY(start_pointxy.x(),point_topleft_pxy.y() - step_y)
-                    parentcellindicator_x = 1
-                    p_x_id = 1
-                    c_x_id = 1
-                    if yfactor**(subgrid-1) == parentcellindicator_y:
-                        p_y_id += 1
-                        parentcellindicator_y = 0
-                    parentcellindicator_y += 1
-                    c_y_id += 1
-                        
-                #next subgrid:
-                if startwithparent:
-                    step_x = step_x / xfactor
-                    step_y = step_y / yfactor
-                else:
-                    step_x = step_x * xfactor
-                    step_y = step_y * yfactor
-                
-        """
-        elif gridtype == 1:
-            grid_geom = [QgsPointXY(parent_x_coord+math.sin(angle)*(xspacing), parent_y_coord+math.cos(angle)*(yspacing)) for angle in self.linspace(0,(2*math.pi),polygonsides,False)]
-            grid_geom = QgsGeometry.fromPolygonXY([parent_geom])
-        """
+                current += len(grid_row)
+                progress.setProgress(int(current * total))
+        writer.flush()
+        progress.finish()
             
         return {self.OUTPUT: dest_id}
 
@@ -319,4 +232,8 @@ class CreateNestedGrid(QgsProcessingAlgorithm):
                        '\n - v_coords: coordinates of all vertices of this gridcell as string array. Coordinatepairs are separated by comma and vertices separated by semicolon, e.g.: [v1.x,v1.y;v2.x,v2.y;v3.x,v3.y;v1.x,v1.y]'
                        '\n - x_space: width of the gridcell in x-axis'
                        '\n - y_space: height of the gridcell in y-axis'
+                       '\n Hexagons are pointy topped and lie in rows, every other row is shifted by half a cell. The X-Spacing is the distance of two cells in a row, '
+                       'the Y-Spacing the distance of two rows (for regular hexagons use Y-Spacing = X-Spacing * 0.8660254). The center of the top left parentcell lies on the top left corner of the extent. '
+                       'As hexagons can not be divided into smaller hexagons, a childcell belongs to the parentcell its center lies in (computed from the axial coordinates of the cells; a center on the edge of two parentcells belongs to the right one); with equal X- and Y-Factor every parentcell has the same number of childcells; '
+                       'the ids of a hexagon are its column and row in its subgrid.'
                        )
\ No newline at end of file
@@ -19,6 +19,7 @@ from PyQt5.QtCore import QCoreApplication, QVariant
 from qgis.core import (QgsProject, QgsField, QgsFields, QgsFeature, QgsProcessing, QgsExpression, QgsSpatialIndex, QgsGeometry, QgsPoint, QgsPointXY, QgsWkbTypes, QgsCoordinateReferenceSystem, QgsCoordinateTransform,
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm, QgsExpressionContext, QgsExpressionContextUtils, QgsProcessingParameterDefinition,
                        QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource, QgsProcessingParameterExpression, QgsProcessingParameterEnum, QgsProcessingParameterBoolean)
+from ..helpers.ConsumedIdTracker import ConsumedIdTracker
 
 class CreatePerpendicularLinesFromNearestPointsByCondition(QgsProcessingAlgorithm):
     SOURCE_LYR = 'SOURCE_LYR'
@@ -222,7 +223,7 @@ class CreatePerpendicularLinesFromNearestPointsByCondition(QgsProcessingAlgorith
             source_orderby_request.setOrderBy(order_by)
         
         feedback.setProgressText('Start processing...')
-        overlay_skip = []
+        overlay_skip = ConsumedIdTracker()
         max_dist_expression_context = QgsExpressionContext()
         max_dist_expression_context.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(source_layer_vl))
         max_neighbors_expression_context = QgsExpressionContext()
@@ -299,7 +300,7 @@ class CreatePerpendicularLinesFromNearestPointsByCondition(QgsProcessingAlgorith
                     continue
                 
                 if first_match_only:
-                    overlay_skip.append(nearest_line_id)
+                    overlay_skip.consume(nearest_line_id)
                     
                 nearest_line_geom = overlay_layer_idx.geometry(nearest_line_id)
                 if source_layer_vl.sourceCrs() != overlay_layer_vl.sourceCrs():
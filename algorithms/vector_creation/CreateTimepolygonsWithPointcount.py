@@ -21,6 +21,9 @@ from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression, QgsGe
 import processing
 from datetime import *
 import math
+from collections import Counter
+from ..helpers.BufferedFeatureWriter import BufferedFeatureWriter
+from ..helpers.ThrottledProgress import ThrottledProgress
 
 
 class CreateTimepolygonsWithPointcount(QgsProcessingAlgorithm):
@@ -55,7 +58,7 @@ class CreateTimepolygonsWithPointcount(QgsProcessingAlgorithm):
                 self.INTERVALSEC, self.tr('Interval in Seconds (Expects a valid Integer)'), optional = False, defaultValue = 86400))
         self.addParameter(
             QgsProcessingParameterBoolean(
-                self.COUNT_POINT_MULTIPLE_TIMES, self.tr('Check if a point may be counted more than once (slowing down processing around 25%)')))
+                self.COUNT_POINT_MULTIPLE_TIMES, self.tr('Check if a point may be counted more than once (if unchecked, a point lying in several polygons is only counted in the first one)')))
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 self.OUTPUT, self.tr('TimePolygons with Pointcount')))
@@ -89,48 +92,76 @@ class CreateTimepolygonsWithPointcount(QgsProcessingAlgorithm):
         end_date = QDateTime.toPyDateTime(end_date)
         total_seconds = int((end_date - start_date).total_seconds())
         
+        # Single pass: every point is read and its datetime evaluated once, its interval follows by arithmetic and its polygon(s) from one
+        # spatial join; the counts go into a sparse matrix of intervals x polygons (only cells with points are stored), which is written out
+        # interval by interval afterwards
+        polygon_feats = list(lyr_polygons.getFeatures())
+        required_iterations = math.ceil(total_seconds / intervalsec) if total_seconds > 0 else 0
+        counts = Counter() # (interval index, polygon index): number of points
+        
         feedback.setProgressText('Building spatial index...')
-        idx_points = QgsSpatialIndex(lyr_points.getFeatures())
+        idx_polygons = QgsSpatialIndex()
+        polygon_index = {} # feature id: position of the polygon, a point not counted more than once goes to the first polygon
+        polygon_engines = []
+        for index, polygon in enumerate(polygon_feats):
+            idx_polygons.addFeature(polygon)
+            polygon_index[polygon.id()] = index
+            polygon_geometryengine = QgsGeometry.createGeometryEngine(polygon.geometry().constGet())
+            polygon_geometryengine.prepareGeometry()
+            polygon_engines.append(polygon_geometryengine)
         
-        required_iterations = math.ceil(total_seconds / intervalsec) 
-        total = 100.0 / (lyr_polygons.featureCount() * required_iterations) if lyr_polygons.featureCount() else 0
+        n_points = lyr_points.featureCount()
+        total = 100.0 / (n_points + len(polygon_feats) * required_iterations) if n_points + len(polygon_feats) * required_iterations > 0 else 0
         current = 0
+        writer = BufferedFeatureWriter(sink, QgsFeatureSink.FastInsert)
+        progress = ThrottledProgress(feedback)
         
-        feedback.setProgressText('Start processing...')
+        feedback.setProgressText('Counting points...')
         point_time_expression_context = QgsExpressionContext()
         point_time_expression_context.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(lyr_points))
-        for current_interval in range(0,total_seconds,intervalsec): 
+        for point in lyr_points.getFeatures():
+            current += 1
+            if feedback.isCanceled():
+                break
+            progress.setProgress(int(current * total))
+            point_time_expression_context.setFeature(point)
+            point_time_expression_result = point_time_expression.evaluate(point_time_expression_context)
+            if isinstance(point_time_expression_result, QDateTime):
+                point_time_expression_result = point_time_expression_result.toPyDateTime()
+            if not isinstance(point_time_expression_result, datetime):
+                continue
+            # Interval i reaches from start + i * interval (exclusive) to start + (i + 1) * interval - 1 second (inclusive)
+            point_seconds = (point_time_expression_result - start_date).total_seconds()
+            interval_index = math.ceil(point_seconds / intervalsec) - 1
+            if interval_index < 0 or interval_index >= required_iterations or point_seconds > interval_index * intervalsec + intervalsec - 1:
+                continue
+            point_geom = point.geometry()
+            if point_geom.isEmpty():
+                continue
+            polygon_indices = sorted(polygon_index[polygonid] for polygonid in idx_polygons.intersects(point_geom.boundingBox()))
+            for index in polygon_indices:
+                if polygon_engines[index].intersects(point_geom.constGet()):
+                    counts[(interval_index, index)] += 1
+                    if not count_point_multiple_times:
+                        break # dont count a point twice
+        
+        feedback.setProgressText('Creating timepolygons...')
+        for current_interval in range(0,required_iterations): 
             if feedback.isCanceled():
                 break
-            current_start_datetime = start_date + timedelta(seconds = current_interval)
-            current_end_datetime = (start_date + timedelta(seconds = current_interval+intervalsec) - timedelta(seconds = 1))
-            for polygon in lyr_polygons.getFeatures():
+            current_start_datetime = start_date + timedelta(seconds = current_interval * intervalsec)
+            current_end_datetime = (start_date + timedelta(seconds = current_interval * intervalsec + intervalsec) - timedelta(seconds = 1))
+            current_start_datetime = current_start_datetime.strftime('%Y-%m-%d %H:%M:%S')
+            current_end_datetime = current_end_datetime.strftime('%Y-%m-%d %H:%M:%S')
+            for index, polygon in enumerate(polygon_feats):
                 current += 1
-                if feedback.isCanceled():
-                    break
                 new_feat = QgsFeature(fields)
                 new_feat.setGeometry(polygon.geometry())
-                attridx = 0
-                for attr in polygon.attributes():
-                    new_feat[attridx] = attr
-                    attridx += 1
-                new_feat['from_datetime'] = current_start_datetime.strftime('%Y-%m-%d %H:%M:%S')
-                new_feat['to_datetime'] = current_end_datetime.strftime('%Y-%m-%d %H:%M:%S')
-                new_feat['pointcount'] = 0
-                for pointid in idx_points.intersects(polygon.geometry().boundingBox()):
-                    point = lyr_points.getFeature(pointid)
-                    if feedback.isCanceled():
-                        break
-                    point_time_expression_context.setFeature(point)
-                    point_time_expression_result = point_time_expression.evaluate(point_time_expression_context)
-                    if point_time_expression_result > current_start_datetime and point_time_expression_result <= current_end_datetime:
-                        if point.geometry().intersects(polygon.geometry()):
-                            new_feat['pointcount'] += 1
-                            if not count_point_multiple_times:
-                                idx_points.deleteFeature(point) # dont count a point twice, removing it from the index speeds up the code around 25%
-                        
-                sink.addFeature(new_feat, QgsFeatureSink.FastInsert)
-                feedback.setProgress(int(current * total))
+                new_feat.setAttributes(polygon.attributes() + [current_start_datetime, current_end_datetime, counts[(current_interval, index)]])
+                writer.addFeature(new_feat)
+            progress.setProgress(int(current * total))
+        writer.flush()
+        progress.finish()
                 
         return {self.OUTPUT: dest_id} # Return result of algorithm
         
@@ -157,4 +188,6 @@ class CreateTimepolygonsWithPointcount(QgsProcessingAlgorithm):
                        'adds a from_datetime and to_datetime field to them '
                        'and counts the points intersecting with the polygon as '
                        'if they are inbetween the timerange (greater than starttime and smaller or equal endtime)'
+                       '\n All points are read and their datetime is evaluated only once: the interval of a point is computed from its datetime, '
+                       'the polygons it lies in are found with one spatial join, and the counts of all intervals and polygons are collected before the timepolygons are written.'
                        )
\ No newline at end of file
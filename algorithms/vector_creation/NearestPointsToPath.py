@@ -19,6 +19,7 @@ from PyQt5.QtCore import QCoreApplication, QVariant
 from qgis.core import (QgsField, QgsFields, QgsFeature, QgsProcessing, QgsExpression, QgsSpatialIndex, QgsSpatialIndexKDBush, QgsGeometry, QgsPoint, QgsPointXY, QgsWkbTypes,
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm, QgsExpressionContext, QgsExpressionContextUtils, QgsProcessingParameterDefinition,
                        QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterDistance, QgsProcessingParameterFeatureSource, QgsProcessingParameterEnum, QgsProcessingParameterExpression, QgsProcessingParameterNumber, QgsProcessingParameterString, QgsProcessingParameterBoolean)
+from ..helpers.ConsumedIdTracker import ConsumedIdTracker
 
 class NearestPointsToPath(QgsProcessingAlgorithm):
     SOURCE_LYR = 'SOURCE_LYR'
@@ -162,7 +163,7 @@ class NearestPointsToPath(QgsProcessingAlgorithm):
                 source_custom_id_result = source_custom_id.evaluate(source_custom_id_context)
                 source_layer_custom_ids[source_feat.id()] = str(source_custom_id_result)
                 feedback.setProgress(int(current * total))
-        points_skip = []
+        points_skip = ConsumedIdTracker()
         path_group_id = 1
         
         source_orderby_request = QgsFeatureRequest()
@@ -196,7 +197,7 @@ class NearestPointsToPath(QgsProcessingAlgorithm):
             search_from_point_geom = source_feat.geometry().centroid()
             search_from_point_id = source_feat.id()
             no_further_matches = False
-            points_skip.append(source_feat.id())
+            points_skip.consume(source_feat.id())
             
             for i in range(0,source_layer_feature_count + 1):
                 if feedback.isCanceled():
@@ -234,7 +235,7 @@ class NearestPointsToPath(QgsProcessingAlgorithm):
                     new_geom.append(neighbor_geom.asPoint())
                     search_from_point_geom = neighbor_geom
                     search_from_point_id = neighbor_id
-                    points_skip.append(neighbor_id)
+                    points_skip.consume(neighbor_id)
                     current += 1
                     feedback.setProgress(int(current * total))
                     break
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2022 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Cells of the subgrids of CreateNestedGrid, row by row. Everything that is the same for all cells of a column (x coordinates,
+# centroid x, x ids and their part of the uid) is computed once per subgrid, everything of a row once per row; the polygons of a
+# row are written as WKB into one array at once. Coordinates are computed as origin + index * spacing, so they do not drift over
+# long rows. Single cells and the cells containing a point (by arithmetic, for CountPointsInNestedGrid) are computed the same way.
+
+import math, struct
+
+try:
+    import numpy
+except ImportError: # numpy is shipped with QGIS, but the polygons are packed one by one just in case
+    numpy = None
+
+WKB_POLYGON_HEADER = struct.pack('<BIII', 1, 3, 1, 5) # little endian, polygon, one ring, five points
+WKB_RECTANGLE_SIZE = len(WKB_POLYGON_HEADER) + 10 * 8
+
+def nested_grid_fields(letters):
+    """
+    Returns the QgsFields of the cells of CreateNestedGrid, also used by CountPointsInNestedGrid so both have the same fields.
+    letters are the axes (0: x, 1: y) with letters instead of numbers as ids.
+    """
+    from PyQt5.QtCore import QVariant # imported here, the benchmarks use the rest of this module without QGIS
+    from qgis.core import QgsField, QgsFields
+    output_layer_fields = QgsFields()
+    output_layer_fields.append(QgsField('fid', QVariant.Int))
+    output_layer_fields.append(QgsField('uid', QVariant.String))
+    output_layer_fields.append(QgsField('s_id', QVariant.Int))
+    if 0 in letters:
+        output_layer_fields.append(QgsField('p_x_id', QVariant.String))
+    else:
+        output_layer_fields.append(QgsField('p_x_id', QVariant.Int))
+    if 1 in letters:
+        output_layer_fields.append(QgsField('p_y_id', QVariant.String))
+    else:
+        output_layer_fields.append(QgsField('p_y_id', QVariant.Int))
+    if 0 in letters:
+        output_layer_fields.append(QgsField('c_x_id', QVariant.String))
+    else:
+        output_layer_fields.append(QgsField('c_x_id', QVariant.Int))
+    if 1 in letters:
+        output_layer_fields.append(QgsField('c_y_id', QVariant.String))
+    else:
+        output_layer_fields.append(QgsField('c_y_id', QVariant.Int))
+    output_layer_fields.append(QgsField('x_cent', QVariant.Double))
+    output_layer_fields.append(QgsField('y_cent', QVariant.Double))
+    output_layer_fields.append(QgsField('v_coords', QVariant.String))
+    output_layer_fields.append(QgsField('x_space', QVariant.Double))
+    output_layer_fields.append(QgsField('y_space', QVariant.Double))
+    return output_layer_fields
+
+# Source: https://stackoverflow.com/a/42176641/8947209
+def num_to_char(n):
+    if n < 1:
+        raise ValueError("Number must be positive")
+    result = ""
+    while True:
+        if n > 26:
+            n, r = divmod(n - 1, 26)
+            result = chr(r + ord('A')) + result
+        else:
+            return chr(n + ord('A') - 1) + result
+
+def axis_ids(n_cells, cells_per_parentcell, letters):
+    """Returns the parent ids and child ids (numbers starting at 1 or letters) of n_cells cells along one axis."""
+    parent_ids = [cell // cells_per_parentcell + 1 for cell in range(n_cells)]
+    child_ids = list(range(1, n_cells + 1))
+    if letters:
+        parent_ids = [num_to_char(parent_id) for parent_id in parent_ids]
+        child_ids = [num_to_char(child_id) for child_id in child_ids]
+    return parent_ids, child_ids
+
+def rectangle_rows_wkb(x_edges):
+    """Returns a function creating the WKB polygons of one row of rectangles between the x_edges, given the top and bottom y."""
+    n_cells = len(x_edges) - 1
+    if numpy is not None:
+        records = numpy.zeros(n_cells, dtype = [('header', 'V' + str(len(WKB_POLYGON_HEADER))), ('coords', '<f8', (10,))])
+        records['header'] = numpy.frombuffer(WKB_POLYGON_HEADER, dtype = 'V' + str(len(WKB_POLYGON_HEADER)))
+        x_edges = numpy.asarray(x_edges, dtype = float)
+        # top left, top right, bottom right, bottom left, top left; clockwise like the former QgsPointXY.project() steps
+        records['coords'][:, [0, 6, 8]] = x_edges[:-1, None]
+        records['coords'][:, [2, 4]] = x_edges[1:, None]
+        def row_wkb(y_top, y_bottom):
+            records['coords'][:, [1, 3, 9]] = y_top
+            records['coords'][:, [5, 7]] = y_bottom
+            row = records.tobytes()
+            return [row[offset:offset + WKB_RECTANGLE_SIZE] for offset in range(0, len(row), WKB_RECTANGLE_SIZE)]
+    else:
+        def row_wkb(y_top, y_bottom):
+            return [WKB_POLYGON_HEADER + struct.pack('<10d', x_left, y_top, x_right, y_top, x_right, y_bottom, x_left, y_bottom, x_left, y_top)
+                    for x_left, x_right in zip(x_edges[:-1], x_edges[1:])]
+    return row_wkb
+
+def rectangle_subgrid_rows(x_origin, y_origin, step_x, step_y, n_cells_x, n_cells_y, cells_per_parentcell_x, cells_per_parentcell_y,
+                           subgrid, uid_prefix, x_letters, y_letters):
+    """
+    Yields the rows of one rectangular subgrid from top to bottom, starting at the top left corner x_origin, y_origin.
+    Every row is a list of (wkb, attributes) from left to right, attributes being the values of the fields
+    uid, s_id, p_x_id, p_y_id, c_x_id, c_y_id, x_cent, y_cent, v_coords, x_space, y_space of CreateNestedGrid.
+    """
+    x_edges = [x_origin + column * step_x for column in range(n_cells_x + 1)]
+    x_edges_str = [str(x) for x in x_edges]
+    x_cents = [(x_left + x_right) / 2 for x_left, x_right in zip(x_edges[:-1], x_edges[1:])]
+    p_x_ids, c_x_ids = axis_ids(n_cells_x, cells_per_parentcell_x, x_letters)
+    p_y_ids, c_y_ids = axis_ids(n_cells_y, cells_per_parentcell_y, y_letters)
+    x_uids = [uid_prefix + '_' + str(p_x_id) + '_' + str(c_x_id) for p_x_id, c_x_id in zip(p_x_ids, c_x_ids)]
+    columns = list(zip(x_edges_str[:-1], x_edges_str[1:], x_cents, p_x_ids, c_x_ids, x_uids))
+    row_wkb = rectangle_rows_wkb(x_edges)
+    for row in range(n_cells_y):
+        y_top = y_origin - row * step_y
+        y_bottom = y_origin - (row + 1) * step_y
+        y_top_str = ',' + str(y_top)
+        y_bottom_str = ',' + str(y_bottom)
+        y_cent = (y_top + y_bottom) / 2
+        p_y_id = p_y_ids[row]
+        c_y_id = c_y_ids[row]
+        y_uid = '_' + str(p_y_id) + '_' + str(c_y_id)
+        yield list(zip(row_wkb(y_top, y_bottom),
+                       [[x_uid + y_uid, subgrid, p_x_id, p_y_id, c_x_id, c_y_id, x_cent, y_cent,
+                         x_left + y_top_str + ';' + x_right + y_top_str + ';' + x_right + y_bottom_str + ';' + x_left + y_bottom_str + ';' + x_left + y_top_str,
+                         step_x, step_y]
+                        for x_left, x_right, x_cent, p_x_id, c_x_id, x_uid in columns]))
+
+def rectangle_cell(x_origin, y_origin, step_x, step_y, column, row, cells_per_parentcell_x, cells_per_parentcell_y,
+                   subgrid, uid_prefix, x_letters, y_letters):
+    """Returns (wkb, attributes) of the single cell in column, row (starting at 0) of a rectangular subgrid, like rectangle_subgrid_rows()."""
+    to_x_id = num_to_char if x_letters else int
+    to_y_id = num_to_char if y_letters else int
+    x_left = x_origin + column * step_x
+    x_right = x_origin + (column + 1) * step_x
+    y_top = y_origin - row * step_y
+    y_bottom = y_origin - (row + 1) * step_y
+    x_left_str, x_right_str = str(x_left), str(x_right)
+    y_top_str, y_bottom_str = ',' + str(y_top), ',' + str(y_bottom)
+    p_x_id = to_x_id(column // cells_per_parentcell_x + 1)
+    p_y_id = to_y_id(row // cells_per_parentcell_y + 1)
+    c_x_id = to_x_id(column + 1)
+    c_y_id = to_y_id(row + 1)
+    wkb = WKB_POLYGON_HEADER + struct.pack('<10d', x_left, y_top, x_right, y_top, x_right, y_bottom, x_left, y_bottom, x_left, y_top)
+    v_coords = x_left_str + y_top_str + ';' + x_right_str + y_top_str + ';' + x_right_str + y_bottom_str + ';' + x_left_str + y_bottom_str + ';' + x_left_str + y_top_str
+    return wkb, [uid_prefix + '_' + str(p_x_id) + '_' + str(c_x_id) + '_' + str(p_y_id) + '_' + str(c_y_id), subgrid, p_x_id, p_y_id, c_x_id, c_y_id,
+                 (x_left + x_right) / 2, (y_top + y_bottom) / 2, v_coords, step_x, step_y]
+
+class RectangleBinning():
+    """
+    Finds the cells of all subgrids of a rectangular nested grid containing a point by arithmetic instead of a spatial lookup. Column and
+    row in the finest subgrid are the offset of the point to the top left corner x_origin, y_origin divided by its spacings; those of the
+    coarser subgrids follow by integer division by the number of childcells per parentcell, so a point always lies in the parent of its
+    childcell. Points on the border of two cells belong to the right or lower one, points on the right or bottom border of the grid to its
+    last column or row.
+    """
+    def __init__(self, x_origin, y_origin, parent_step_x, parent_step_y, n_parentcells_x, n_parentcells_y, xfactor, yfactor, subgrids):
+        self.x_origin = x_origin
+        self.y_origin = y_origin
+        self.x_end = x_origin + n_parentcells_x * parent_step_x
+        self.y_end = y_origin - n_parentcells_y * parent_step_y
+        self.step_x = parent_step_x / xfactor ** (subgrids - 1)
+        self.step_y = parent_step_y / yfactor ** (subgrids - 1)
+        self.n_cells_x = n_parentcells_x * xfactor ** (subgrids - 1)
+        self.n_cells_y = n_parentcells_y * yfactor ** (subgrids - 1)
+        self.divisors = [(subgrid, xfactor ** (subgrids - subgrid), yfactor ** (subgrids - subgrid)) for subgrid in range(1, subgrids + 1)]
+
+    def cells(self, x, y):
+        """Returns (subgrid, column, row) of the cells containing x, y in all subgrids, an empty list if it is outside of the grid."""
+        if not (self.x_origin <= x <= self.x_end and self.y_end <= y <= self.y_origin):
+            return []
+        column = min(int((x - self.x_origin) / self.step_x), self.n_cells_x - 1)
+        row = min(int((self.y_origin - y) / self.step_y), self.n_cells_y - 1)
+        return [(subgrid, column // divisor_x, row // divisor_y) for subgrid, divisor_x, divisor_y in self.divisors]
+
+# Hexagons are pointy topped and lie in rows, every odd row (counted from the top) is shifted half a cell to the right. x spacing is
+# the distance of two cells in a row, y spacing the distance of two rows; regular hexagons need y spacing = x spacing * sqrt(3) / 2.
+# Vertices clockwise from the top, in units of the spacings relative to the center:
+HEXAGON_VERTICES = ((0.0, 2.0 / 3.0), (0.5, 1.0 / 3.0), (0.5, -1.0 / 3.0), (0.0, -2.0 / 3.0), (-0.5, -1.0 / 3.0), (-0.5, 1.0 / 3.0), (0.0, 2.0 / 3.0))
+WKB_HEXAGON_HEADER = struct.pack('<BIII', 1, 3, 1, 7) # little endian, polygon, one ring, seven points
+WKB_HEXAGON_COORDS = struct.Struct('<14d')
+
+# Points exactly on an edge or vertex between hexagons are ties for the rounding; with the default factor 2 most childcell centers lie on
+# an edge of a parentcell. They are moved by this fraction of a cell in x direction (+q) before rounding, so a tie always goes to the hexagon
+# on its right (no edge of a pointy topped hexagon is horizontal) and every parentcell gets the same number of childcells.
+# It is far larger than the float noise of coordinates computed from cell indices, and far smaller than any spacing that makes sense.
+TIE_BIAS = 1e-9
+
+def axial_round(q, r):
+    """
+    Returns the axial coordinates of the hexagon containing the fractional axial coordinates q, r (cube rounding).
+    Ties are decided by moving the point by TIE_BIAS in +q direction and rounding halves up (math.floor(v + 0.5)),
+    not by the round half to even of round().
+    """
+    q = q + TIE_BIAS
+    s = -q - r
+    rounded_q, rounded_r, rounded_s = math.floor(q + 0.5), math.floor(r + 0.5), math.floor(s + 0.5)
+    diff_q, diff_r, diff_s = abs(rounded_q - q), abs(rounded_r - r), abs(rounded_s - s)
+    if diff_q > diff_r and diff_q > diff_s:
+        rounded_q = -rounded_r - rounded_s
+    elif diff_r > diff_s:
+        rounded_r = -rounded_q - rounded_s
+    return int(rounded_q), int(rounded_r)
+
+def axial_to_offset(q, r):
+    """Column and row of the axial coordinates q, r (odd rows shifted to the right)."""
+    return q + (r - (r & 1)) // 2, r
+
+class HexagonSubgrid():
+    """
+    Cells of one subgrid of a hexagonal nested grid. x_origin, y_origin is the center of the top left cell of the parentgrid, which has
+    n_parentcells_x * n_parentcells_y cells with the spacings parent_step_x, parent_step_y; it also is the center of a cell in every subgrid.
+    A cell belongs to the parent cell its center lies in, found by rounding its axial coordinates in the parentgrid, not by a spatial
+    lookup; cells without a parent cell are not part of the subgrid. The ids of a subgrid are its columns and rows starting at 1.
+    """
+    def __init__(self, x_origin, y_origin, parent_step_x, parent_step_y, n_parentcells_x, n_parentcells_y, step_x, step_y):
+        self.x_origin = x_origin
+        self.y_origin = y_origin
+        self.parent_step_x = parent_step_x
+        self.parent_step_y = parent_step_y
+        self.n_parentcells_x = n_parentcells_x
+        self.n_parentcells_y = n_parentcells_y
+        self.step_x = step_x
+        self.step_y = step_y
+        # Between the upper third of the first and the lower third of the last parent row the parent cells tile their area without gaps,
+        # so the cells of a row there are a contiguous range of columns and only its ends are searched, starting a bit outside of the
+        # parentgrid. Rows above or below cross the pointed tops or bottoms of the outer parent cells and have gaps; they are counted cell by cell.
+        interior_top = y_origin + parent_step_y * (1.0 / 3.0 - 1e-9)
+        interior_bottom = y_origin - parent_step_y * (n_parentcells_y - 1 + 1.0 / 3.0 - 1e-9)
+        first_row = int(math.floor(-(2.0 / 3.0) * parent_step_y / step_y)) - 1
+        last_row = int(math.ceil((n_parentcells_y - 1 + 2.0 / 3.0) * parent_step_y / step_y)) + 1
+        first_column = int(math.floor(-parent_step_x / step_x)) - 1
+        last_column = int(math.ceil((n_parentcells_x + 1) * parent_step_x / step_x)) + 1
+        self.row_columns = [] # (row, first column, last column) of the rows with cells
+        self.n_cells = 0
+        for row in range(first_row, last_row + 1):
+            left = first_column
+            while left <= last_column and self.parent(row, left) is None:
+                left += 1
+            if left > last_column:
+                continue
+            right = last_column
+            while self.parent(row, right) is None:
+                right -= 1
+            self.row_columns.append((row, left, right))
+            y = self.center(row, left)[1]
+            if interior_bottom <= y <= interior_top:
+                self.n_cells += right - left + 1
+            else:
+                self.n_cells += sum(1 for column in range(left, right + 1) if self.parent(row, column) is not None)
+        self.min_row = self.row_columns[0][0] if self.row_columns else 0
+        self.min_column = min([left for row, left, right in self.row_columns], default = 0)
+
+    def center(self, row, column):
+        return self.x_origin + self.step_x * (column + (row & 1) / 2), self.y_origin - self.step_y * row
+
+    def parent(self, row, column):
+        """Returns column and row (starting at 0) of the parent cell of a cell of this subgrid, None if it is outside of the parentgrid."""
+        # From the indices instead of the center coordinates, which lose precision with large coordinates of the origin
+        parent_r = row * self.step_y / self.parent_step_y
+        parent_q = (column + (row & 1) / 2) * self.step_x / self.parent_step_x - parent_r / 2
+        parent_column, parent_row = axial_to_offset(*axial_round(parent_q, parent_r))
+        if 0 <= parent_column < self.n_parentcells_x and 0 <= parent_row < self.n_parentcells_y:
+            return parent_column, parent_row
+        return None
+
+    def locate(self, x, y):
+        """Returns row and column of the cell of this subgrid containing x, y (rounding its axial coordinates), None if that cell is not part of the subgrid."""
+        r = (self.y_origin - y) / self.step_y
+        q = (x - self.x_origin) / self.step_x - r / 2
+        column, row = axial_to_offset(*axial_round(q, r))
+        if self.parent(row, column) is None:
+            return None
+        return row, column
+
+    def cell(self, row, column, subgrid, uid_prefix, x_letters, y_letters):
+        """Returns (wkb, attributes) of a single cell of the subgrid, like rows()."""
+        to_x_id = num_to_char if x_letters else int
+        to_y_id = num_to_char if y_letters else int
+        half_step_x = self.step_x / 2
+        x_left, x_cent, x_right = [self.x_origin + half_step_x * (2 * column + (row & 1) + offset) for offset in (-1, 0, 1)]
+        x_left_str, x_cent_str, x_right_str = str(x_left), str(x_cent), str(x_right)
+        y_cent = self.y_origin - self.step_y * row
+        vertex_ys = [y_cent + self.step_y * offset_y for offset_x, offset_y in HEXAGON_VERTICES[:4]]
+        y_top, y_upper, y_lower, y_bottom = vertex_ys
+        y_top_str, y_upper_str, y_lower_str, y_bottom_str = [',' + str(y) for y in vertex_ys]
+        parent_column, parent_row = self.parent(row, column)
+        p_x_id = to_x_id(parent_column + 1)
+        p_y_id = to_y_id(parent_row + 1)
+        c_x_id = to_x_id(column - self.min_column + 1)
+        c_y_id = to_y_id(row - self.min_row + 1)
+        wkb = WKB_HEXAGON_HEADER + WKB_HEXAGON_COORDS.pack(x_cent, y_top, x_right, y_upper, x_right, y_lower, x_cent, y_bottom,
+                                                           x_left, y_lower, x_left, y_upper, x_cent, y_top)
+        v_coords = (x_cent_str + y_top_str + ';' + x_right_str + y_upper_str + ';' + x_right_str + y_lower_str + ';' + x_cent_str + y_bottom_str + ';' +
+                    x_left_str + y_lower_str + ';' + x_left_str + y_upper_str + ';' + x_cent_str + y_top_str)
+        return wkb, [uid_prefix + '_' + str(p_x_id) + '_' + str(c_x_id) + '_' + str(p_y_id) + '_' + str(c_y_id), subgrid,
+                     p_x_id, p_y_id, c_x_id, c_y_id, x_cent, y_cent, v_coords, self.step_x, self.step_y]
+
+    def rows(self, subgrid, uid_prefix, x_letters, y_letters):
+        """Yields the rows of the subgrid from top to bottom like rectangle_subgrid_rows()."""
+        to_x_id = num_to_char if x_letters else int
+        to_y_id = num_to_char if y_letters else int
+        half_step_x = self.step_x / 2
+        for row, left, right in self.row_columns:
+            # x of the centers and left/right vertices of the row are multiples of half a cell, y of the vertices four values per row
+            shift = row & 1
+            half_xs = [self.x_origin + half_step_x * (2 * column + shift + offset) for column in range(left, right + 1) for offset in (-1, 0)]
+            half_xs.append(self.x_origin + half_step_x * (2 * right + shift + 1))
+            half_xs_str = [str(x) for x in half_xs]
+            y_cent = self.y_origin - self.step_y * row
+            vertex_ys = [y_cent + self.step_y * offset_y for offset_x, offset_y in HEXAGON_VERTICES[:4]]
+            y_top, y_upper, y_lower, y_bottom = vertex_ys
+            y_top_str, y_upper_str, y_lower_str, y_bottom_str = [',' + str(y) for y in vertex_ys]
+            c_y_id = to_y_id(row - self.min_row + 1)
+            cells = []
+            for i, column in enumerate(range(left, right + 1)):
+                parent = self.parent(row, column)
+                if parent is None: # gap between the pointed tops or bottoms of the outer parent cells
+                    continue
+                parent_column, parent_row = parent
+                x_left, x_cent, x_right = half_xs[2 * i], half_xs[2 * i + 1], half_xs[2 * i + 2]
+                x_left_str, x_cent_str, x_right_str = half_xs_str[2 * i], half_xs_str[2 * i + 1], half_xs_str[2 * i + 2]
+                p_x_id = to_x_id(parent_column + 1)
+                p_y_id = to_y_id(parent_row + 1)
+                c_x_id = to_x_id(column - self.min_column + 1)
+                wkb = WKB_HEXAGON_HEADER + WKB_HEXAGON_COORDS.pack(x_cent, y_top, x_right, y_upper, x_right, y_lower, x_cent, y_bottom,
+                                                                   x_left, y_lower, x_left, y_upper, x_cent, y_top)
+                v_coords = (x_cent_str + y_top_str + ';' + x_right_str + y_upper_str + ';' + x_right_str + y_lower_str + ';' + x_cent_str + y_bottom_str + ';' +
+                            x_left_str + y_lower_str + ';' + x_left_str + y_upper_str + ';' + x_cent_str + y_top_str)
+                cells.append((wkb, [uid_prefix + '_' + str(p_x_id) + '_' + str(c_x_id) + '_' + str(p_y_id) + '_' + str(c_y_id), subgrid,
+                                    p_x_id, p_y_id, c_x_id, c_y_id, x_cent, y_cent, v_coords, self.step_x, self.step_y]))
+            yield cells
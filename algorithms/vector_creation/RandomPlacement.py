@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Author: Mario Königbauer (mkoenigb@gmx.de)
+(C) 2023 - today by Mario Koenigbauer
+License: GNU General Public License v3.0
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 3 of the License, or     *
+ *   any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+# Batched random placement of one geometry inside a polygon for RandomlyRedistributeFeaturesInsidePolygon. Many candidate placements
+# (a random rotation around a center, then a random translation) are drawn at once. The translation is only drawn from the range in
+# which the bounding box of the rotated geometry stays inside the bounding box of the polygon. The vertices of all candidates are
+# tested at once by ray casting (see PointInPolygon.py); a candidate with a vertex outside of the polygon can not be inside, so only
+# the remaining ones have to be tested with GEOS.
+
+import random
+from ..vector_conditionals.PointInPolygon import numpy, points_in_polygon, boundary_tolerance
+
+FIRST_BATCH_SIZE = 32 # candidate placements drawn at once, doubled with every batch up to SAMPLE_BATCH_SIZE
+SAMPLE_BATCH_SIZE = 4096
+MAX_SAMPLE_VERTICES = 1 << 18 # vertices of all candidates of one batch, limits the memory of the intermediate arrays
+
+def feature_random_generators(seed, feature_id):
+    """
+    Returns a random.Random and a numpy random generator (None without numpy) for one feature, derived from seed and feature_id only,
+    so every feature gets the same random numbers no matter in which order or thread the features are processed.
+    Without a seed (None) both are seeded by the operating system.
+    """
+    if seed is None:
+        return random.Random(), numpy.random.default_rng() if numpy is not None else None
+    feature_id = feature_id % (1 << 64) # SeedSequence only takes non-negative integers
+    python_rng = random.Random(str(seed) + ':' + str(feature_id)) # string seeds are hashed with sha512, independent of PYTHONHASHSEED
+    numpy_rng = numpy.random.default_rng(numpy.random.SeedSequence([seed, feature_id])) if numpy is not None else None
+    return python_rng, numpy_rng
+
+class RandomPlacement():
+    """
+    Random placements of a geometry given by its vertices xs, ys, rotated around cx, cy, inside a polygon given by its edges
+    (see PointInPolygon.polygon_edges) and its bounding box (xmin, ymin, xmax, ymax).
+    """
+    def __init__(self, xs, ys, cx, cy, edges, bbox, rotate):
+        self.relative_xs = numpy.asarray(xs, dtype = float) - cx
+        self.relative_ys = numpy.asarray(ys, dtype = float) - cy
+        self.cx = cx
+        self.cy = cy
+        self.edges = edges
+        self.bbox = bbox
+        self.rotate = rotate
+        self.tolerance = boundary_tolerance(edges, numpy.asarray(xs, dtype = float), numpy.asarray(ys, dtype = float))
+        self.max_batch_size = max(1, min(SAMPLE_BATCH_SIZE, MAX_SAMPLE_VERTICES // max(1, len(self.relative_xs))))
+        self.batch_size = min(FIRST_BATCH_SIZE, self.max_batch_size) # size of the next batch
+
+    def candidates(self, rng, n):
+        """
+        Draws n candidate placements with the numpy random generator rng. Returns the arrays angles (degrees clockwise, like
+        QgsGeometry.rotate()), dxs, dys (translation after the rotation) and possible (False if the candidate is certainly not inside).
+        """
+        self.batch_size = min(self.batch_size * 2, self.max_batch_size)
+        xmin, ymin, xmax, ymax = self.bbox
+        if self.rotate:
+            angles = rng.uniform(0, 360, n)
+            radians = numpy.radians(angles)[:, None]
+            cos = numpy.cos(radians)
+            sin = numpy.sin(radians)
+            xs = self.cx + self.relative_xs * cos + self.relative_ys * sin
+            ys = self.cy - self.relative_xs * sin + self.relative_ys * cos
+        else:
+            angles = numpy.zeros(n)
+            xs = numpy.broadcast_to(self.cx + self.relative_xs, (n, len(self.relative_xs)))
+            ys = numpy.broadcast_to(self.cy + self.relative_ys, (n, len(self.relative_ys)))
+        dx_low = xmin - xs.min(axis = 1)
+        dx_high = xmax - xs.max(axis = 1)
+        dy_low = ymin - ys.min(axis = 1)
+        dy_high = ymax - ys.max(axis = 1)
+        dxs = dx_low + rng.random(n) * (dx_high - dx_low)
+        dys = dy_low + rng.random(n) * (dy_high - dy_low)
+        possible = (dx_low <= dx_high) & (dy_low <= dy_high) # otherwise the geometry is wider or higher than the polygon at this angle
+        if possible.any():
+            candidate_xs = xs[possible] + dxs[possible, None]
+            candidate_ys = ys[possible] + dys[possible, None]
+            inside, on_boundary = points_in_polygon(candidate_xs.ravel(), candidate_ys.ravel(), self.edges, self.tolerance)
+            possible[possible] = (inside | on_boundary).reshape(candidate_xs.shape).all(axis = 1)
+        return angles, dxs, dys, possible
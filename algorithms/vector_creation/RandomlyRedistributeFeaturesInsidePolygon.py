@@ -14,11 +14,15 @@ License: GNU General Public License v3.0
  ***************************************************************************/
 """
 
-import processing, random, math
+import processing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtCore import QCoreApplication, QVariant
 from qgis.core import (QgsField, QgsFields, QgsFeature, QgsProcessing, QgsExpression, QgsSpatialIndex, QgsGeometry, QgsPoint, QgsPointXY, QgsWkbTypes,
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm,
                        QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource, QgsProcessingParameterExpression, QgsProcessingParameterNumber, QgsProcessingParameterEnum, QgsProcessingParameterBoolean)
+from ..vector_conditionals.PointInPolygon import numpy, polygon_edges
+from .RandomPlacement import RandomPlacement, feature_random_generators
 
 class RandomlyRedistributeFeaturesInsidePolygon(QgsProcessingAlgorithm):
     SOURCE_LYR = 'SOURCE_LYR'
@@ -28,6 +32,8 @@ class RandomlyRedistributeFeaturesInsidePolygon(QgsProcessingAlgorithm):
     ROTATE = 'ROTATE'
     MAX_TRY = 'MAX_TRY'
     HANDLE_MULTIPLE_OVERLAYS = 'HANDLE_MULTIPLE_OVERLAYS'
+    SEED = 'SEED'
+    MAX_WORKERS = 'MAX_WORKERS'
     OUTPUT = 'OUTPUT'
     OUTPUT_POLYGONS = 'OUTPUT_POLYGONS'
     
@@ -58,6 +64,12 @@ class RandomlyRedistributeFeaturesInsidePolygon(QgsProcessingAlgorithm):
                                                                                      'Build a uniary union polygon of all overlays',
                                                                                      'Build an intersection polygon of all overlays that intersect with the centroid'
                                                                                      ], defaultValue = 1, allowMultiple = False))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.SEED, self.tr('Random seed (-1 means a different result on every run)'), defaultValue = -1, minValue = -1, type = 0)) # type 0 = Int
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_WORKERS, self.tr('Number of parallel threads (1 means one feature after another)'),type=0,defaultValue=1,minValue=1,maxValue=64))
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 self.OUTPUT, self.tr('Redistributed')))
@@ -78,6 +90,10 @@ class RandomlyRedistributeFeaturesInsidePolygon(QgsProcessingAlgorithm):
         rotate = self.parameterAsBool(parameters, self.ROTATE, context)
         max_try = self.parameterAsInt(parameters, self.MAX_TRY, context)
         handle_multiple_overlays = self.parameterAsInt(parameters, self.HANDLE_MULTIPLE_OVERLAYS, context)
+        seed = self.parameterAsInt(parameters, self.SEED, context)
+        if seed < 0:
+            seed = None
+        max_workers = self.parameterAsInt(parameters, self.MAX_WORKERS, context)
         
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
                                                source_layer.fields(), source_layer.wkbType(),
@@ -99,12 +115,11 @@ class RandomlyRedistributeFeaturesInsidePolygon(QgsProcessingAlgorithm):
         overlay_layer_idx = QgsSpatialIndex(overlay_layer.getFeatures(), flags=QgsSpatialIndex.FlagStoreFeatureGeometries)
         
         
-        feedback.setProgressText('Start processing...')
-        for current, source_feat in enumerate(source_layer.getFeatures()):
-            if feedback.isCanceled():
-                break
-                
-            new_feat = source_feat
+        def redistribute(source_feat, push_warning):
+            # Every feature has its own random generators, derived from the seed and its feature id, so the result
+            # does not depend on the order or thread in which the features are processed.
+            # Warnings go to push_warning: feedback.pushWarning when processing one feature after another, a list in worker threads
+            rng, numpy_rng = feature_random_generators(seed, source_feat.id())
             new_geom = source_feat.geometry()
             overlays = overlay_layer_idx.intersects(source_feat.geometry().boundingBox())
             intersecting_geoms = []
@@ -130,7 +145,7 @@ class RandomlyRedistributeFeaturesInsidePolygon(QgsProcessingAlgorithm):
                     
                 if handle_multiple_overlays != 0 and intersecting_geoms:
                     if handle_multiple_overlays == 1:
-                        overlay_geom = random.choice(intersecting_geoms)
+                        overlay_geom = rng.choice(intersecting_geoms)
                     if handle_multiple_overlays == 2:
                         overlay_geom = QgsGeometry().unaryUnion(intersecting_geoms)
                     if handle_multiple_overlays == 3:
@@ -145,31 +160,78 @@ class RandomlyRedistributeFeaturesInsidePolygon(QgsProcessingAlgorithm):
                         
                 if (not overlay_geom.isNull() or not overlay_geom.isEmpty()) and overlay_geom.isGeosValid():
                     overlay_geom_bbox = overlay_geom.boundingBox()
-                    overlay_width = overlay_geom_bbox.width()
-                    overlay_height = overlay_geom_bbox.height()
-                    overlay_max = math.sqrt((overlay_width**2) + (overlay_height**2))
                     overlay_geometryengine = QgsGeometry.createGeometryEngine(overlay_geom.constGet())
                     overlay_geometryengine.prepareGeometry()
+                    source_geom = source_feat.geometry()
+                    source_center = QgsPointXY(source_geom.centroid().asPoint())
+                    
+                    # Candidate placements are drawn in batches and their vertices tested at once (see RandomPlacement.py), only the ones
+                    # that can be inside the overlay are tested with GEOS. Curved overlays or collections are sampled one candidate after another.
+                    placement = None
+                    if numpy is not None and QgsWkbTypes.flatType(overlay_geom.wkbType()) in (QgsWkbTypes.Polygon, QgsWkbTypes.MultiPolygon):
+                        if overlay_geom.isMultipart():
+                            overlay_polygons = overlay_geom.asMultiPolygon()
+                        else:
+                            overlay_polygons = [overlay_geom.asPolygon()]
+                        overlay_edges = polygon_edges([[(point.x(), point.y()) for point in ring] for polygon in overlay_polygons for ring in polygon])
+                        source_vertices = [(vertex.x(), vertex.y()) for vertex in source_geom.vertices()]
+                        if source_vertices:
+                            placement = RandomPlacement([vertex[0] for vertex in source_vertices], [vertex[1] for vertex in source_vertices],
+                                                        source_center.x(), source_center.y(), overlay_edges,
+                                                        (overlay_geom_bbox.xMinimum(), overlay_geom_bbox.yMinimum(), overlay_geom_bbox.xMaximum(), overlay_geom_bbox.yMaximum()),
+                                                        rotate)
+                    
                     inside = False
                     whilecount = 0
                     while inside is False:
                         if feedback.isCanceled():
                             break
-                        if whilecount > max_try and max_try > 0:
+                        if whilecount > max_try and max_try > 0: # max_try + 1 attempts
                             aborted = True
                             break
-                        whilecount += 1
-                        if whilecount % 10000 == 0:
-                            feedback.pushWarning('Trying to redistribute feature ' + str(source_feat.id()) + ' in attempt #' + str(whilecount) + ' now with still no match. Consider cancelling the process or keep waiting.')
-                        new_geom = source_feat.geometry()
-                        new_geom.translate(dx=random.uniform(overlay_max*-1,overlay_max),dy=random.uniform(overlay_max*-1,overlay_max))
-                        if rotate:
-                            new_geom.rotate(rotation=random.uniform(0,360),center=QgsPointXY(source_feat.geometry().centroid().asPoint()))
-                        if overlay_geometryengine.contains(new_geom.constGet()):
-                            inside = True
+                        if placement is not None:
+                            batch_size = placement.batch_size if max_try == 0 else min(placement.batch_size, max_try - whilecount + 1)
+                            angles, dxs, dys, possible = placement.candidates(numpy_rng, batch_size)
+                            candidates = [(angles[i], dxs[i], dys[i]) for i in numpy.flatnonzero(possible).tolist()]
+                        else:
+                            batch_size = 1
+                            # Only translate as far as the rotated geometry stays inside the bounding box of the overlay
+                            angle = rng.uniform(0,360) if rotate else 0
+                            rotated_geom = QgsGeometry(source_geom)
+                            if rotate:
+                                rotated_geom.rotate(rotation=angle,center=source_center)
+                            rotated_geom_bbox = rotated_geom.boundingBox()
+                            candidates = []
+                            if rotated_geom_bbox.width() <= overlay_geom_bbox.width() and rotated_geom_bbox.height() <= overlay_geom_bbox.height():
+                                candidates.append((angle,
+                                                   rng.uniform(overlay_geom_bbox.xMinimum() - rotated_geom_bbox.xMinimum(), overlay_geom_bbox.xMaximum() - rotated_geom_bbox.xMaximum()),
+                                                   rng.uniform(overlay_geom_bbox.yMinimum() - rotated_geom_bbox.yMinimum(), overlay_geom_bbox.yMaximum() - rotated_geom_bbox.yMaximum())))
+                        if (whilecount + batch_size) // 10000 > whilecount // 10000:
+                            push_warning('Trying to redistribute feature ' + str(source_feat.id()) + ' in attempt #' + str((whilecount + batch_size) // 10000 * 10000) + ' now with still no match. Consider cancelling the process or keep waiting.')
+                        whilecount += batch_size
+                        for angle, dx, dy in candidates:
+                            new_geom = QgsGeometry(source_geom)
+                            if rotate:
+                                new_geom.rotate(rotation=angle,center=source_center)
+                            new_geom.translate(dx=dx,dy=dy)
+                            if overlay_geometryengine.contains(new_geom.constGet()):
+                                inside = True
+                                break
                             
             if aborted:
                 new_geom = source_feat.geometry()
+            return new_geom, overlay_geom
+        
+        def redistribute_collecting_warnings(source_feat):
+            # Runs in a worker thread, which must not send signals to the GUI: its warnings are returned and pushed when the feature is written
+            warnings = []
+            new_geom, overlay_geom = redistribute(source_feat, warnings.append)
+            return new_geom, overlay_geom, warnings
+        
+        def write_feature(source_feat, new_geom, overlay_geom, warnings = ()):
+            for warning in warnings:
+                feedback.pushWarning(warning)
+            new_feat = source_feat
             new_feat.setGeometry(new_geom)
             sink.addFeature(new_feat, QgsFeatureSink.FastInsert)
             
@@ -180,8 +242,34 @@ class RandomlyRedistributeFeaturesInsidePolygon(QgsProcessingAlgorithm):
                 sink2.addFeature(new_polygon_feat, QgsFeatureSink.FastInsert)
             except:
                 pass
-            
-            feedback.setProgress(int(current * total))
+        
+        if max_workers <= 1:
+            feedback.setProgressText('Start processing...')
+            for current, source_feat in enumerate(source_layer.getFeatures()):
+                if feedback.isCanceled():
+                    break
+                write_feature(source_feat, *redistribute(source_feat, feedback.pushWarning))
+                feedback.setProgress(int(current * total))
+        else:
+            # Features are redistributed in parallel while the next ones are read, results are written in the order of the source layer
+            feedback.setProgressText('Start processing with ' + str(max_workers) + ' threads...')
+            with ThreadPoolExecutor(max_workers = max_workers) as executor:
+                pending_features = deque()
+                written = 0
+                for source_feat in source_layer.getFeatures():
+                    if feedback.isCanceled():
+                        break
+                    pending_features.append((source_feat, executor.submit(redistribute_collecting_warnings, source_feat)))
+                    if len(pending_features) > max_workers * 4:
+                        pending_feat, redistributed = pending_features.popleft()
+                        write_feature(pending_feat, *redistributed.result())
+                        written += 1
+                        feedback.setProgress(int(written * total))
+                while pending_features and not feedback.isCanceled():
+                    pending_feat, redistributed = pending_features.popleft()
+                    write_feature(pending_feat, *redistributed.result())
+                    written += 1
+                    feedback.setProgress(int(written * total))
             
         return {self.OUTPUT: dest_id}
 
@@ -212,4 +300,5 @@ class RandomlyRedistributeFeaturesInsidePolygon(QgsProcessingAlgorithm):
         'You can also add these polygons used for redistributing the source features as an optional output. This output is set to skip by default.\n'
         'If a feature is not within at least one polygon, its geometry will not be modified.\n'
         'You can also set a limit for the maximum tries of randomly translating the source feature. If no match is found before this limit is exceeded, the source features geometry remain unchanged.\n'
+        'The features are only translated as far as they stay inside the bounding box of the polygon, and many random placements are tested at once. Set a random seed to get the same result on every run, also when processing in parallel threads.\n'
         )
\ No newline at end of file
@@ -19,6 +19,8 @@ from PyQt5.QtCore import QCoreApplication, QVariant, QDateTime
 from qgis.core import (QgsField, QgsFeature, QgsProcessing, QgsExpression,
                        QgsFeatureSink, QgsFeatureRequest, QgsProcessingAlgorithm, QgsExpressionContext, QgsExpressionContextUtils, QgsGeometry, QgsPointXY,
                        QgsProcessingParameterVectorLayer, QgsProcessingParameterFeatureSink, QgsProcessingParameterFeatureSource, QgsProcessingParameterExpression)
+from ..helpers.BufferedFeatureWriter import BufferedFeatureWriter
+from ..helpers.ThrottledProgress import ThrottledProgress
 
 class InterpolateDateTimeAlongLine(QgsProcessingAlgorithm):
     METHOD = 'METHOD'
@@ -98,6 +100,8 @@ class InterpolateDateTimeAlongLine(QgsProcessingAlgorithm):
                                                source_layer.sourceCrs())
         
         total = 100.0 / source_layer_vl.featureCount() if source_layer_vl.featureCount() else 0
+        writer = BufferedFeatureWriter(sink, QgsFeatureSink.FastInsert)
+        progress = ThrottledProgress(feedback)
         
         feedback.setProgressText('Start processing...')
         source_start_time_expr_context = QgsExpressionContext()
@@ -177,9 +181,11 @@ class InterpolateDateTimeAlongLine(QgsProcessingAlgorithm):
                     segment_startdistance += source_interpolation_density_expr_result
                     segment_enddistance += source_interpolation_density_expr_result
                     
-                    sink.addFeature(new_feat, QgsFeatureSink.FastInsert)
+                    writer.addFeature(new_feat)
                     
-            feedback.setProgress(int(current * total))
+            progress.setProgress(int(current * total))
+        writer.flush()
+        progress.finish()
             
 
         return {self.OUTPUT: dest_id}
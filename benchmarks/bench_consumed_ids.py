@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: "count/snap a feature only once" bookkeeping of the conditional algorithms.
+
+Every point is tested against the already consumed ids and then consumed, as the algorithms do with count multiple disabled.
+Compares the former skip lists with algorithms/helpers/ConsumedIdTracker.py for growing numbers of points. The list takes
+quadratic time, so it is only measured up to --max-list-points and extrapolated beyond.
+
+Usage: python benchmarks/bench_consumed_ids.py [--points 1000000] [--max-list-points 40000]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import importlib.util
+
+here = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location('ConsumedIdTracker', os.path.join(here, '..', 'algorithms', 'helpers', 'ConsumedIdTracker.py'))
+ConsumedIdTracker = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ConsumedIdTracker)
+
+
+def consume_all(skip, fids, consume):
+    counted = 0
+    for fid in fids:
+        if fid in skip:
+            continue
+        counted += 1
+        consume(fid)
+    return counted
+
+
+def run_list(fids):
+    skip = []
+    return consume_all(skip, fids, skip.append)
+
+
+def run_tracker(fids):
+    skip = ConsumedIdTracker.ConsumedIdTracker()
+    return consume_all(skip, fids, skip.consume)
+
+
+def measure(function, fids):
+    start = time.perf_counter()
+    function(fids)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Skip list vs. consumed id tracker')
+    parser.add_argument('--points', type = int, default = 1000000)
+    parser.add_argument('--max-list-points', type = int, default = 40000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    sizes = [n for n in (10000, 20000, 40000, 100000) if n < args.points]
+    n = 1000000
+    while n < args.points:
+        sizes.append(n)
+        n *= 10
+    sizes.append(args.points)
+
+    print('{:>10} {:>14} {:>14} {:>10}'.format('points', 'list s', 'tracker s', 'speedup'))
+    list_reference = None # (points, seconds) of the largest measured list run, for the extrapolation
+    for n in sizes:
+        fids = list(range(n))
+        random.shuffle(fids)
+        fids += fids[:n // 10] # some points are candidates of more than one polygon
+        tracker_seconds = measure(run_tracker, fids)
+        if n <= args.max_list_points:
+            list_seconds = measure(run_list, fids)
+            list_reference = (n, list_seconds)
+            list_text = '{:.3f}'.format(list_seconds)
+        else:
+            if list_reference is None:
+                list_reference = (args.max_list_points, measure(run_list, list(range(args.max_list_points))))
+            list_seconds = list_reference[1] * (n / list_reference[0]) ** 2
+            list_text = '~{:.0f} (est.)'.format(list_seconds)
+        print('{:>10} {:>14} {:>14.3f} {:>9.0f}x'.format(n, list_text, tracker_seconds, list_seconds / tracker_seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: counting points in the cells of a nested grid, as CountPointsInNestedGrid does.
+
+Compares creating every cell of every subgrid (row generator of algorithms/vector_creation/NestedGrid.py, as Create Nested Grid) and
+counting the points in each of them (candidates from the points sorted by x, then tested against the cell; a stand-in for the spatial
+index and the point in polygon test of Count Points in Polygons with Condition, without QGIS) with finding the cells of every point by
+arithmetic (NestedGrid.RectangleBinning). Creating QgsFeatures and writing them is not included. Both have to give the same counts for
+the cells containing points.
+
+Usage: python benchmarks/bench_count_points_in_nested_grid.py [--points 100000] [--parent-cells 50] [--subgrids 3] [--factor 2]
+"""
+
+import os
+import sys
+import time
+import bisect
+import random
+import argparse
+from collections import Counter
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+from algorithms.vector_creation import NestedGrid
+
+
+def polygon_counts(points, x_origin, y_origin, spacing, n_parent, subgrids, factor):
+    points = sorted(points)
+    xs = [x for x, y in points]
+    counts = {}
+    for subgrid in range(1, subgrids + 1):
+        cells_per_parentcell = factor ** (subgrid - 1)
+        step = spacing / cells_per_parentcell
+        for row in NestedGrid.rectangle_subgrid_rows(x_origin, y_origin, step, step, n_parent * cells_per_parentcell, n_parent * cells_per_parentcell,
+                                                     cells_per_parentcell, cells_per_parentcell, subgrid, str(subgrid), False, False):
+            for wkb, attributes in row:
+                x_left, x_right = attributes[6] - step / 2, attributes[6] + step / 2
+                y_bottom, y_top = attributes[7] - step / 2, attributes[7] + step / 2
+                count = 0
+                for i in range(bisect.bisect_left(xs, x_left), bisect.bisect_left(xs, x_right)):
+                    if y_bottom < points[i][1] <= y_top:
+                        count += 1
+                if count:
+                    counts[attributes[0]] = count
+    return counts
+
+
+def binning_counts(points, x_origin, y_origin, spacing, n_parent, subgrids, factor):
+    binning = NestedGrid.RectangleBinning(x_origin, y_origin, spacing, spacing, n_parent, n_parent, factor, factor, subgrids)
+    counts = Counter()
+    for x, y in points:
+        for cell in binning.cells(x, y):
+            counts[cell] += 1
+    # uids of the non-empty cells only
+    result = {}
+    for (subgrid, column, row), count in counts.items():
+        cells_per_parentcell = factor ** (subgrid - 1)
+        step = spacing / cells_per_parentcell
+        wkb, attributes = NestedGrid.rectangle_cell(x_origin, y_origin, step, step, column, row, cells_per_parentcell, cells_per_parentcell,
+                                                    subgrid, str(subgrid), False, False)
+        result[attributes[0]] = count
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Counting in all cells vs. binning by arithmetic')
+    parser.add_argument('--points', type = int, default = 100000)
+    parser.add_argument('--parent-cells', type = int, default = 50, help = 'parent cells per axis')
+    parser.add_argument('--subgrids', type = int, default = 3)
+    parser.add_argument('--factor', type = int, default = 2)
+    args = parser.parse_args()
+    spacing = 1000.0
+    x_origin, y_origin = 4468000.0, 5334000.0
+    size = spacing * args.parent_cells
+    rng = random.Random(42)
+    # clustered points, like addresses or events in a few towns
+    towns = [(rng.uniform(0, size), rng.uniform(0, size)) for i in range(20)]
+    points = []
+    while len(points) < args.points:
+        town_x, town_y = rng.choice(towns)
+        x, y = rng.gauss(town_x, size / 40), rng.gauss(town_y, size / 40)
+        if 0 < x < size and 0 < y < size:
+            points.append((x_origin + x, y_origin - y))
+    arguments = (points, x_origin, y_origin, spacing, args.parent_cells, args.subgrids, args.factor)
+
+    results = []
+    for name, function in (('all cells, count in cells', polygon_counts), ('binning by arithmetic', binning_counts)):
+        start = time.perf_counter()
+        counts = function(*arguments)
+        seconds = time.perf_counter() - start
+        results.append(counts)
+        print('{:<30} {:>9.3f} s {:>10} non-empty cells'.format(name, seconds, len(counts)))
+    assert results[0] == results[1], 'both have to give the same counts'
+
+
+if __name__ == '__main__':
+    main()
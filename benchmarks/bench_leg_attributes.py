@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: filling the attributes of OTP Routes from a plan response.
+
+Compares the former per-leg extraction of OtpRoutes (one try/except per value and one locals() lookup per field)
+with the compiled field tables in algorithms/opentripplanner/OtpFieldTable.py filling a preallocated attribute list.
+Parsing the response with json.loads is measured as well for comparison.
+
+Usage: python benchmarks/bench_leg_attributes.py [captured plan response .json] [repetitions]
+Without a captured response a synthetic one is used (5 itineraries with 40 legs each).
+"""
+
+import os
+import sys
+import json
+import random
+import timeit
+import importlib.util
+from datetime import datetime
+
+here = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location('OtpFieldTable', os.path.join(here, '..', 'algorithms', 'opentripplanner', 'OtpFieldTable.py'))
+OtpFieldTable = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(OtpFieldTable)
+
+N_SOURCE_FIELDS = 8
+ALWAYS_NEEDED_FIELDS = ['Route_LegID', 'Route_RouteID', 'Route_RelationID', 'Route_From', 'Route_To', 'Route_Error', 'Route_ErrorID', 'Route_ErrorDescription', 'Route_URL']
+FIELDNAMES = (ALWAYS_NEEDED_FIELDS + [f[0] for f in OtpFieldTable.PLAN_FIELDS] + [f[0] for f in OtpFieldTable.ITINERARY_FIELDS] +
+              ['Route_Total_Mode', 'Route_Total_Distance'] + [f[0] for f in OtpFieldTable.LEG_FIELDS])
+
+
+def to_datetime(timestamp): # stands in for the QDateTime conversion, which is the same for both variants
+    return datetime.fromtimestamp(int(timestamp)/1000)
+
+
+def synthetic_plan(n_itineraries = 5, n_legs = 40):
+    random.seed(42)
+    place = lambda: {'name': 'Stop ' + str(random.randint(1, 9999)), 'stopId': '1:' + str(random.randint(1, 99999)), 'stopCode': str(random.randint(1, 999)),
+                     'lat': random.uniform(48, 49), 'lon': random.uniform(11, 12), 'departure': 1650000000000, 'arrival': 1650000060000, 'vertexType': 'TRANSIT'}
+    itineraries = []
+    for i in range(n_itineraries):
+        legs = []
+        for j in range(n_legs):
+            leg = {'startTime': 1650000000000 + j * 60000, 'endTime': 1650000060000 + j * 60000, 'departureDelay': 0, 'arrivalDelay': 0,
+                   'duration': 60.0, 'distance': random.uniform(10, 5000), 'mode': random.choice(['WALK', 'BUS', 'TRAM']),
+                   'from': place(), 'to': place(), 'realTime': False, 'agencyTimeZoneOffset': 7200000, 'route': '', 'interlineWithPreviousLeg': False,
+                   'legGeometry': {'points': '_p~iF~ps|U_ulLnnqC_mqNvxq`@', 'length': 3}, 'steps': [{'distance': 10.0, 'relativeDirection': 'LEFT', 'streetName': 'Street'}] * 5}
+            if j % 7 == 0: # some values are not in every leg
+                del leg['departureDelay']
+                del leg['to']['stopCode']
+            legs.append(leg)
+        itineraries.append({'duration': 2400, 'startTime': 1650000000000, 'endTime': 1650002400000, 'walkTime': 600, 'transitTime': 1500, 'waitingTime': 300,
+                            'walkDistance': 800.0, 'walkLimitExceeded': False, 'transfers': 3, 'legs': legs, 'fare': {}})
+    return {'requestParameters': {}, 'plan': {'date': 1650000000000, 'from': place(), 'to': place(), 'itineraries': itineraries}, 'debugOutput': {}}
+
+
+def legacy_fill(route_data, source_attributes, fieldindexdict):
+    # The extraction OtpRoutes used before (shortened to the same fields), variables named like the lowercase fieldnames
+    route_legid = 0
+    route_routeid = 0
+    route_relationid = 1
+    route_from = ''
+    route_to = ''
+    route_error = 'Success'
+    route_errorid = None
+    route_errordescription = None
+    route_url = 'http://localhost:8080/otp/routers/default/plan?...'
+    features = []
+    try:
+        route_from_lat = route_data['plan']['from']['lat']
+        route_from_lon = route_data['plan']['from']['lon']
+    except:
+        route_from_lat = None
+        route_from_lon = None
+    try:
+        route_from_stopid = route_data['plan']['from']['stopId']
+    except:
+        route_from_stopid = None
+    try:
+        route_from_stopcode = route_data['plan']['from']['stopCode']
+    except:
+        route_from_stopcode = None
+    try:
+        route_from_name = route_data['plan']['from']['name']
+    except:
+        route_from_name = None
+    try:
+        route_to_lat = route_data['plan']['to']['lat']
+        route_to_lon = route_data['plan']['to']['lon']
+    except:
+        route_to_lat = None
+        route_to_lon = None
+    try:
+        route_to_stopid = route_data['plan']['to']['stopId']
+    except:
+        route_to_stopid = None
+    try:
+        route_to_stopcode = route_data['plan']['to']['stopCode']
+    except:
+        route_to_stopcode = None
+    try:
+        route_to_name = route_data['plan']['to']['name']
+    except:
+        route_to_name = None
+    for iter in route_data['plan']['itineraries']:
+        route_routeid += 1
+        try:
+            route_from_starttime = to_datetime(iter['startTime'])
+        except:
+            route_from_starttime = None
+        try:
+            route_to_endtime = to_datetime(iter['endTime'])
+        except:
+            route_to_endtime = None
+        try:
+            route_total_duration = iter['duration']
+        except:
+            route_total_duration = None
+        route_total_distance = 0
+        route_total_mode = 'WALK,TRANSIT'
+        try:
+            route_total_transittime = iter['transitTime']
+        except:
+            route_total_transittime = None
+        try:
+            route_total_waitingtime = iter['waitingTime']
+        except:
+            route_total_waitingtime = None
+        try:
+            route_total_walktime = iter['walkTime']
+        except:
+            route_total_walktime = None
+        try:
+            route_total_walkdistance = iter['walkDistance']
+        except:
+            route_total_walkdistance = None
+        try:
+            route_total_transfers = iter['transfers']
+        except:
+            route_total_transfers = None
+        for leg in iter['legs']:
+            route_legid += 1
+            try:
+                route_leg_starttime = to_datetime(leg['startTime'])
+            except:
+                route_leg_starttime = None
+            try:
+                route_leg_departuredelay = leg['departureDelay']
+            except:
+                route_leg_departuredelay = None
+            try:
+                route_leg_endtime = to_datetime(leg['endTime'])
+            except:
+                route_leg_endtime = None
+            try:
+                route_leg_arrivaldelay = leg['arrivalDelay']
+            except:
+                route_leg_arrivaldelay = None
+            try:
+                route_leg_duration = leg['duration']
+            except:
+                route_leg_duration = None
+            try:
+                route_leg_distance = leg['distance']
+                route_total_distance = None
+            except:
+                route_leg_distance = None
+            try:
+                route_leg_mode = leg['mode']
+            except:
+                route_leg_mode = None
+            try:
+                route_leg_from_lat = leg['from']['lat']
+                route_leg_from_lon = leg['from']['lon']
+            except:
+                route_leg_from_lat = None
+                route_leg_from_lon = None
+            try:
+                route_leg_from_stopid = leg['from']['stopId']
+            except:
+                route_leg_from_stopid = None
+            try:
+                route_leg_from_stopcode = leg['from']['stopCode']
+            except:
+                route_leg_from_stopcode = None
+            try:
+                route_leg_from_name = leg['from']['name']
+            except:
+                route_leg_from_name = None
+            try:
+                route_leg_from_departure = to_datetime(leg['from']['departure'])
+            except:
+                route_leg_from_departure = None
+            try:
+                route_leg_to_lat = leg['to']['lat']
+                route_leg_to_lon = leg['to']['lon']
+            except:
+                route_leg_to_lat = None
+                route_leg_to_lon = None
+            try:
+                route_leg_to_stopid = leg['to']['stopId']
+            except:
+                route_leg_to_stopid = None
+            try:
+                route_leg_to_stopcode = leg['to']['stopCode']
+            except:
+                route_leg_to_stopcode = None
+            try:
+                route_leg_to_name = leg['to']['name']
+            except:
+                route_leg_to_name = None
+            try:
+                route_leg_to_arrival = to_datetime(leg['to']['arrival'])
+            except:
+                route_leg_to_arrival = None
+            attributes = [None] * len(fieldindexdict)
+            for key, value in fieldindexdict.items():
+                if key < N_SOURCE_FIELDS:
+                    attributes[key] = source_attributes[key]
+                else:
+                    attributes[key] = locals()[value]
+            features.append(attributes)
+    return features
+
+
+def compiled_fill(route_data, source_attributes, fieldindexdict, plan_fields, itinerary_fields, leg_fields):
+    fieldindex_of = {fieldname: fieldindex for fieldindex, fieldname in fieldindexdict.items()}
+    first_alwaysneeded = fieldindex_of['route_legid']
+    last_alwaysneeded = fieldindex_of['route_url']
+    totaldistance = fieldindex_of['route_total_distance']
+    totalmode = fieldindex_of['route_total_mode']
+    route_legid = 0
+    route_routeid = 0
+    features = []
+    attributes = [None] * len(fieldindexdict)
+    attributes[:N_SOURCE_FIELDS] = source_attributes
+    OtpFieldTable.fill_attributes(route_data, plan_fields, attributes)
+    for iter in route_data['plan']['itineraries']:
+        route_routeid += 1
+        OtpFieldTable.fill_attributes(iter, itinerary_fields, attributes)
+        route_total_distance = 0
+        attributes[totalmode] = 'WALK,TRANSIT'
+        for leg in iter['legs']:
+            route_legid += 1
+            OtpFieldTable.fill_attributes(leg, leg_fields, attributes)
+            if 'distance' in leg:
+                route_total_distance = None
+            attributes[first_alwaysneeded:last_alwaysneeded + 1] = [route_legid, route_routeid, 1, '', '', 'Success', None, None, 'http://localhost:8080/otp/routers/default/plan?...']
+            attributes[totaldistance] = route_total_distance
+            features.append(list(attributes)) # setAttributes copies the list as well
+    return features
+
+
+def main():
+    response_path = sys.argv[1] if len(sys.argv) > 1 else None
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    if response_path:
+        with open(response_path, 'r', encoding = 'utf-8') as response_file:
+            response_text = response_file.read()
+    else:
+        response_text = json.dumps(synthetic_plan())
+    route_data = json.loads(response_text)
+    n_legs = sum(len(iter['legs']) for iter in route_data['plan']['itineraries'])
+
+    fieldindexdict = {} # fieldindex: lowercase fieldname, as in OtpRoutes
+    for i in range(N_SOURCE_FIELDS):
+        fieldindexdict[i] = 'source_' + str(i)
+    for i, fieldname in enumerate(FIELDNAMES):
+        fieldindexdict[N_SOURCE_FIELDS + i] = fieldname.lower()
+    source_attributes = list(range(N_SOURCE_FIELDS))
+    index_of = lambda fieldname: N_SOURCE_FIELDS + FIELDNAMES.index(fieldname) if fieldname in FIELDNAMES else -1
+    converters = {'datetime': to_datetime}
+    plan_fields = OtpFieldTable.compile_fields(OtpFieldTable.PLAN_FIELDS, index_of, converters)
+    itinerary_fields = OtpFieldTable.compile_fields(OtpFieldTable.ITINERARY_FIELDS, index_of, converters)
+    leg_fields = OtpFieldTable.compile_fields(OtpFieldTable.LEG_FIELDS, index_of, converters)
+
+    # Both variants have to return exactly the same attributes
+    assert legacy_fill(route_data, source_attributes, fieldindexdict) == compiled_fill(route_data, source_attributes, fieldindexdict, plan_fields, itinerary_fields, leg_fields)
+
+    print('Plan response with ' + str(n_legs) + ' legs (' + str(len(response_text)) + ' characters), ' + str(repetitions) + ' repetitions')
+    candidates = [('json.loads of the response', lambda: json.loads(response_text)),
+                  ('legacy extraction (try/except + locals())', lambda: legacy_fill(route_data, source_attributes, fieldindexdict)),
+                  ('compiled field tables', lambda: compiled_fill(route_data, source_attributes, fieldindexdict, plan_fields, itinerary_fields, leg_fields))]
+    baseline = None
+    for name, function in candidates:
+        seconds = min(timeit.repeat(function, number = repetitions, repeat = 3)) / repetitions
+        if name.startswith('legacy'):
+            baseline = seconds
+        print('{:<48} {:>10.3f} ms{}'.format(name, seconds * 1000, '   x{:.1f}'.format(baseline / seconds) if baseline else ''))
+
+
+if __name__ == '__main__':
+    main()
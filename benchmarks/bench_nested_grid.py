@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: computing the cells of CreateNestedGrid.
+
+Compares the former cell by cell computation (three projected corner points, centroid, v_coords joined over the vertices, uid
+rebuilt per cell; emulated in python, QgsPointXY.project() uses the same sin/cos formula) with the row generator in
+algorithms/vector_creation/NestedGrid.py. Creating QgsFeatures and writing them is not included. Both have to give the same
+attributes (coordinates within rounding) and the same polygon vertices. Also times the hexagon subgrids (regular hexagons, same
+number of parent cells) and checks that their uids are unique and that every parent cell gets the same number of childcells
+(factor x factor) for the factors 2 and 3, where many childcell centers lie exactly on an edge of their parent cell.
+
+Usage: python benchmarks/bench_nested_grid.py [--parent-cells 100] [--subgrids 3] [--factor 2] [--letters 0]
+"""
+
+import os
+import gc
+import sys
+import math
+import time
+import struct
+import argparse
+from collections import Counter
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+from algorithms.vector_creation import NestedGrid
+
+
+def project(x, y, distance, bearing):
+    # QgsPointXY.project()
+    radians = math.radians(bearing)
+    return x + distance * math.sin(radians), y + distance * math.cos(radians)
+
+
+def former_cells(x_origin, y_origin, xspacing, yspacing, n_parent_x, n_parent_y, subgrids, factor, letters):
+    cells = []
+    step_x, step_y = xspacing, yspacing
+    for subgrid in range(1, subgrids + 1):
+        p_y_id, c_y_id, indicator_y = 1, 1, 1
+        top_left = (x_origin, y_origin)
+        for currenty in range(n_parent_y * factor ** (subgrid - 1)):
+            top_left = (x_origin, top_left[1])
+            p_x_id, c_x_id, indicator_x = 1, 1, 1
+            for currentx in range(n_parent_x * factor ** (subgrid - 1)):
+                top_right = project(top_left[0], top_left[1], step_x, 90)
+                lower_right = project(top_right[0], top_right[1], step_y, 180)
+                lower_left = project(lower_right[0], lower_right[1], step_x, 270)
+                ring = [top_left, top_right, lower_right, lower_left, top_left]
+                x_cent = sum(x for x, y in ring[:4]) / 4
+                y_cent = sum(y for x, y in ring[:4]) / 4
+                v_coords = ';'.join([str(x) + ',' + str(y) for x, y in ring])
+                to_id = NestedGrid.num_to_char if letters else (lambda n: n)
+                uid = str(subgrid).zfill(len(str(subgrids))) + '_' + str(to_id(p_x_id)) + '_' + str(to_id(c_x_id)) + '_' + str(to_id(p_y_id)) + '_' + str(to_id(c_y_id))
+                cells.append((ring, [uid, subgrid, to_id(p_x_id), to_id(p_y_id), to_id(c_x_id), to_id(c_y_id), x_cent, y_cent, v_coords, step_x, step_y]))
+                top_left = (top_left[0] + step_x, top_left[1])
+                if factor ** (subgrid - 1) == indicator_x:
+                    p_x_id += 1
+                    indicator_x = 0
+                indicator_x += 1
+                c_x_id += 1
+            top_left = (x_origin, top_left[1] - step_y)
+            if factor ** (subgrid - 1) == indicator_y:
+                p_y_id += 1
+                indicator_y = 0
+            indicator_y += 1
+            c_y_id += 1
+        step_x, step_y = step_x / factor, step_y / factor
+    return cells
+
+
+def generator_cells(x_origin, y_origin, xspacing, yspacing, n_parent_x, n_parent_y, subgrids, factor, letters):
+    cells = []
+    for subgrid in range(1, subgrids + 1):
+        cells_per_parentcell = factor ** (subgrid - 1)
+        for row in NestedGrid.rectangle_subgrid_rows(x_origin, y_origin, xspacing / cells_per_parentcell, yspacing / cells_per_parentcell,
+                                                     n_parent_x * cells_per_parentcell, n_parent_y * cells_per_parentcell, cells_per_parentcell, cells_per_parentcell,
+                                                     subgrid, str(subgrid).zfill(len(str(subgrids))), letters, letters):
+            cells.extend(row)
+    return cells
+
+
+def same(former, new):
+    ring, attributes = former
+    wkb, new_attributes = new
+    coords = struct.unpack('<10d', wkb[13:])
+    close = lambda a, b: abs(a - b) <= 1e-9 * max(1.0, abs(a))
+    if not all(close(a, b) for a, b in zip([c for point in ring for c in point], coords)):
+        return False
+    for index, (a, b) in enumerate(zip(attributes, new_attributes)):
+        if index == 8: # v_coords
+            if not all(close(float(x), float(y)) for x, y in zip(a.replace(';', ',').split(','), b.replace(';', ',').split(','))):
+                return False
+        elif isinstance(a, float):
+            if not close(a, b):
+                return False
+        elif a != b:
+            return False
+    return True
+
+
+def check_hexagon_parents(factor, n_parent_x = 9, n_parent_y = 7):
+    # Ties on the edges of the parent cells have to be decided the same way for every parent cell
+    xspacing = 1000.0
+    yspacing = xspacing * math.sqrt(3) / 2
+    hexagon_subgrid = NestedGrid.HexagonSubgrid(4468000.0, 5334000.0, xspacing, yspacing, n_parent_x, n_parent_y, xspacing / factor, yspacing / factor)
+    children = Counter(hexagon_subgrid.parent(row, column) for row, left, right in hexagon_subgrid.row_columns for column in range(left, right + 1))
+    del children[None]
+    assert len(children) == n_parent_x * n_parent_y and set(children.values()) == {factor * factor}, \
+        'factor ' + str(factor) + ': childcells per parent cell ' + str(sorted(Counter(children.values()).items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Former cell by cell computation vs. row generator')
+    parser.add_argument('--parent-cells', type = int, default = 100, help = 'parent cells per axis')
+    parser.add_argument('--subgrids', type = int, default = 3)
+    parser.add_argument('--factor', type = int, default = 2)
+    parser.add_argument('--letters', type = int, default = 0)
+    args = parser.parse_args()
+    arguments = (4468000.0, 5334000.0, 1000.0, 1000.0, args.parent_cells, args.parent_cells, args.subgrids, args.factor, bool(args.letters))
+
+    results = []
+    for name, function in (('former cell by cell', former_cells), ('row generator', generator_cells)):
+        gc.disable() # all cells are kept for the comparison, do not measure the garbage collector walking them
+        start = time.perf_counter()
+        cells = function(*arguments)
+        seconds = time.perf_counter() - start
+        gc.enable()
+        results.append(cells)
+        print('{:<25} {:>9.3f} s {:>10.2f} us/cell {:>10} cells'.format(name, seconds, seconds * 1e6 / len(cells), len(cells)))
+    assert len(results[0]) == len(results[1]) and all(same(a, b) for a, b in zip(*results)), 'the generator has to give the same cells'
+    print('numpy: ' + ('yes' if NestedGrid.numpy is not None else 'no'))
+
+    for factor in (2, 3):
+        check_hexagon_parents(factor)
+    xspacing = 1000.0
+    yspacing = xspacing * math.sqrt(3) / 2
+    gc.disable()
+    start = time.perf_counter()
+    hexagons = []
+    for subgrid in range(1, args.subgrids + 1):
+        hexagon_subgrid = NestedGrid.HexagonSubgrid(arguments[0], arguments[1], xspacing, yspacing, args.parent_cells, args.parent_cells,
+                                                    xspacing / args.factor ** (subgrid - 1), yspacing / args.factor ** (subgrid - 1))
+        for row in hexagon_subgrid.rows(subgrid, str(subgrid), bool(args.letters), bool(args.letters)):
+            hexagons.extend(row)
+    seconds = time.perf_counter() - start
+    gc.enable()
+    assert len(set(cell[1][0] for cell in hexagons)) == len(hexagons), 'uids have to be unique'
+    print('{:<25} {:>9.3f} s {:>10.2f} us/cell {:>10} cells'.format('hexagon rows', seconds, seconds * 1e6 / len(hexagons), len(hexagons)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmark for the OTP algorithms against the offline mock server (benchmarks/otp_mock_server.py).
+
+Runs OTP Routes, OTP Traveltime and OTP Traveltime Comparison on a generated source layer and reports
+requests per second, the time spent decoding and parsing responses and the time spent writing to the output sink.
+Without QGIS only the request engine is measured (requests per second and parse time).
+Run it before and after changes on concurrency, caching or parsing to get comparable numbers.
+
+Usage: python benchmarks/bench_otp_throughput.py [--features 300] [--workers 1,4,16] [--latency 20] [--jitter 5] [--error-rate 0]
+                                                 [--responses file.json or directory] [--engine-only]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+sys.path.insert(0, os.path.join(here, '..')) # algorithms.opentripplanner as namespace package
+from otp_mock_server import start_mock_server, load_responses
+from algorithms.opentripplanner import OtpRequestEngine as engine_module
+
+engines = [] # all request engines created during a run, to read their statistics
+
+
+class RecordingEngine(engine_module.OtpRequestEngine):
+    def __init__(self, *args, **kwargs):
+        engine_module.OtpRequestEngine.__init__(self, *args, **kwargs)
+        engines.append(self)
+
+
+def od_pairs(n, seed = 1):
+    rng = random.Random(seed)
+    return [(48.1 + rng.uniform(0, 0.1), 11.5 + rng.uniform(0, 0.1), 48.1 + rng.uniform(0, 0.1), 11.5 + rng.uniform(0, 0.1)) for i in range(n)]
+
+
+def print_row(name, workers, n_requests, seconds, parse_seconds, sink_seconds = None):
+    print('{:<28} {:>7} {:>9} {:>9.2f} {:>10.1f} {:>12.3f} {:>12}'.format(
+        name, workers, n_requests, seconds, n_requests / seconds if seconds else 0, parse_seconds * 1000 / max(1, n_requests),
+        '{:.3f}'.format(sink_seconds * 1000 / max(1, n_requests)) if sink_seconds is not None else '-'))
+
+
+def print_header():
+    print('{:<28} {:>7} {:>9} {:>9} {:>10} {:>12} {:>12}'.format('', 'workers', 'requests', 'seconds', 'requests/s', 'parse ms/req', 'sink ms/req'))
+
+
+def bench_engine(server, n_features, workers_list):
+    pairs = od_pairs(n_features)
+    print_header()
+    for workers in workers_list:
+        engine = engine_module.OtpRequestEngine(max_workers = workers)
+        jobs = ((i, server.url + 'plan?fromPlace=' + str(a) + ',' + str(b) + '&toPlace=' + str(c) + ',' + str(d) + '&mode=TRANSIT') for i, (a, b, c, d) in enumerate(pairs))
+        start = time.perf_counter()
+        errors = sum(1 for result in engine.fetch_ordered(jobs) if result[3] is not None)
+        seconds = time.perf_counter() - start
+        engine.close()
+        print_row('request engine', workers, engine.requests_sent, seconds, engine.parse_seconds)
+        if errors:
+            print('  ' + str(errors) + ' requests failed')
+
+
+def bench_algorithms(server, n_features, workers_list):
+    from qgis.core import QgsApplication, QgsVectorLayer, QgsFeature, QgsGeometry, QgsPointXY, QgsProcessingContext, QgsProcessingFeedback
+    app = QgsApplication([], False)
+    app.initQgis()
+    from algorithms.opentripplanner import OtpRoutes, OtpTraveltime, OtpTraveltimeComparison
+    for module in (OtpRoutes, OtpTraveltime, OtpTraveltimeComparison):
+        module.OtpRequestEngine = RecordingEngine
+
+    sink_seconds = [0.0]
+
+    class TimedSink():
+        # Measures the time spent in addFeature of the real sink
+        def __init__(self, sink):
+            self.sink = sink
+
+        def addFeature(self, *args):
+            start = time.perf_counter()
+            result = self.sink.addFeature(*args)
+            sink_seconds[0] += time.perf_counter() - start
+            return result
+
+    def timed(algorithm_class):
+        # The algorithm is run on a copy created by createInstance, so the timing has to be part of the class
+        class TimedAlgorithm(algorithm_class):
+            def parameterAsSink(self, *args):
+                sink, dest_id = algorithm_class.parameterAsSink(self, *args)
+                return TimedSink(sink), dest_id
+
+            def createInstance(self):
+                return TimedAlgorithm()
+        return TimedAlgorithm
+
+    layer = QgsVectorLayer('Point?crs=EPSG:4326&field=Start_Lat:double&field=Start_Lon:double&field=End_Lat:double&field=End_Lon:double'
+                           '&field=Start_date:string&field=Start_time:string', 'od', 'memory')
+    features = []
+    for a, b, c, d in od_pairs(n_features):
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(b, a)))
+        feature.setAttributes([a, b, c, d, '2022-04-15', '08:00:00'])
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+
+    print_header()
+    for algorithm_class in (OtpRoutes.OtpRoutes, OtpTraveltime.OtpTraveltime, OtpTraveltimeComparison.OtpTraveltimeComparison):
+        for workers in workers_list:
+            algorithm = timed(algorithm_class)()
+            algorithm.initAlgorithm()
+            parameters = {'SERVER_URL': server.url, 'SOURCE_LYR': layer, 'OUTPUT': 'memory:'}
+            if algorithm.parameterDefinition('MAX_WORKERS') is not None:
+                parameters['MAX_WORKERS'] = workers
+            elif workers != workers_list[0]:
+                continue # no parallel requests in this algorithm
+            if algorithm.parameterDefinition('DEDUPLICATE') is not None:
+                parameters['DEDUPLICATE'] = False # measure every request
+            del engines[:]
+            sink_seconds[0] = 0.0
+            context = QgsProcessingContext()
+            feedback = QgsProcessingFeedback()
+            start = time.perf_counter()
+            results, ok = algorithm.run(parameters, context, feedback)
+            seconds = time.perf_counter() - start
+            if not ok:
+                print(algorithm_class.__name__ + ' failed')
+                continue
+            n_requests = sum(engine.requests_sent for engine in engines)
+            parse_seconds = sum(engine.parse_seconds for engine in engines)
+            print_row(algorithm_class.__name__, parameters.get('MAX_WORKERS', 1), n_requests, seconds, parse_seconds, sink_seconds[0])
+    app.exitQgis()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Throughput benchmark for the OTP algorithms against a local mock server')
+    parser.add_argument('--features', type = int, default = 300)
+    parser.add_argument('--workers', default = '1,4,16', help = 'comma separated list of numbers of parallel requests')
+    parser.add_argument('--latency', type = float, default = 20.0, help = 'milliseconds per request')
+    parser.add_argument('--jitter', type = float, default = 5.0, help = 'milliseconds')
+    parser.add_argument('--error-rate', type = float, default = 0.0)
+    parser.add_argument('--responses', help = 'recorded plan response (.json) or directory of them; synthetic responses if omitted')
+    parser.add_argument('--engine-only', action = 'store_true', help = 'only measure the request engine, no QGIS needed')
+    args = parser.parse_args()
+    workers_list = [int(workers) for workers in args.workers.split(',')]
+
+    server = start_mock_server(load_responses(args.responses), args.latency / 1000.0, args.jitter / 1000.0, args.error_rate, seed = 42)
+    print('Mock server at ' + server.url + ' with ' + str(len(server.responses)) + ' responses, ' + str(args.latency) + ' ms latency, ' +
+          str(args.error_rate * 100) + ' % errors, ' + str(args.features) + ' features')
+    if not args.engine_only:
+        try:
+            import qgis.core
+        except ImportError:
+            print('QGIS not available, only measuring the request engine')
+            args.engine_only = True
+    if args.engine_only:
+        bench_engine(server, args.features, workers_list)
+    else:
+        bench_algorithms(server, args.features, workers_list)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: counting the candidate points of one polygon, as CountPointsInPolygonsWithCondition does.
+
+Compares a per-point test (pure python ray casting, and the prepared GEOS engine on one QgsGeometry per point as the algorithm
+did before if QGIS is available) with the vectorized kernel in algorithms/vector_conditionals/PointInPolygon.py.
+
+Usage: python benchmarks/bench_point_in_polygon.py [number of points] [number of polygon vertices] [repetitions]
+"""
+
+import os
+import sys
+import math
+import random
+import timeit
+import importlib.util
+
+here = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location('PointInPolygon', os.path.join(here, '..', 'algorithms', 'vector_conditionals', 'PointInPolygon.py'))
+PointInPolygon = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(PointInPolygon)
+numpy = PointInPolygon.numpy
+
+try:
+    from qgis.core import QgsGeometry, QgsPointXY
+except ImportError:
+    QgsGeometry = None
+
+
+def python_contains(ring, xs, ys):
+    count = 0
+    edges = list(zip(ring[:-1], ring[1:]))
+    for x, y in zip(xs, ys):
+        inside = False
+        for (x1, y1), (x2, y2) in edges:
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        count += inside
+    return count
+
+
+def geos_contains(polygon, xs, ys):
+    engine = QgsGeometry.createGeometryEngine(polygon.constGet())
+    engine.prepareGeometry()
+    return sum(1 for x, y in zip(xs, ys) if engine.contains(QgsGeometry.fromPointXY(QgsPointXY(x, y)).constGet()))
+
+
+def kernel_contains(ring, xs, ys):
+    edges = PointInPolygon.polygon_edges([ring])
+    xs = numpy.array(xs)
+    ys = numpy.array(ys)
+    inside, on_boundary = PointInPolygon.points_in_polygon(xs, ys, edges, PointInPolygon.boundary_tolerance(edges, xs, ys))
+    return int(numpy.count_nonzero(inside)), int(numpy.count_nonzero(on_boundary))
+
+
+def main():
+    n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n_vertices = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    repetitions = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    if numpy is None:
+        print('numpy not available')
+        return
+    random.seed(42)
+    ring = []
+    for i in range(n_vertices): # a star shaped polygon, similar to a district boundary
+        angle = 2 * math.pi * i / n_vertices
+        radius = random.uniform(800, 1000)
+        ring.append((4468000 + radius * math.cos(angle), 5333000 + radius * math.sin(angle)))
+    ring.append(ring[0])
+    xs = [random.uniform(4467000, 4469000) for i in range(n_points)] # GPS points in the bounding box of the polygon
+    ys = [random.uniform(5332000, 5334000) for i in range(n_points)]
+
+    inside, on_boundary = kernel_contains(ring, xs, ys)
+    print(str(n_points) + ' points, polygon with ' + str(n_vertices) + ' vertices: ' + str(inside) + ' inside by ray casting, ' +
+          str(on_boundary) + ' close to the boundary (tested with GEOS by the algorithm)')
+    candidates = [('vectorized kernel', lambda: kernel_contains(ring, xs, ys))]
+    if QgsGeometry is not None:
+        polygon = QgsGeometry.fromPolygonXY([[QgsPointXY(x, y) for x, y in ring]])
+        assert abs(geos_contains(polygon, xs, ys) - inside) <= on_boundary # the algorithm decides points on the boundary with GEOS
+        candidates.append(('prepared GEOS engine per point', lambda: geos_contains(polygon, xs, ys)))
+    else:
+        print('QGIS not available, skipping the GEOS engine')
+    if n_points * n_vertices <= 20000000:
+        assert python_contains(ring, xs, ys) == inside
+        candidates.append(('python ray casting per point', lambda: python_contains(ring, xs, ys)))
+
+    baseline = None
+    for name, function in candidates:
+        seconds = min(timeit.repeat(function, number = repetitions, repeat = 3)) / repetitions
+        if baseline is None:
+            baseline = seconds
+        print('{:<40} {:>10.1f} ms   x{:.2f}'.format(name, seconds * 1000, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
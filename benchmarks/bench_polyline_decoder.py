@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: decoding OTP leg geometries (encoded polylines).
+
+Compares the former per-character decoder of OtpRoutes (one dict update per value and one point per vertex)
+with the buffer based decoders in algorithms/opentripplanner/OtpPolyline.py.
+If QGIS is available, building the linestring geometry is measured as well.
+
+Usage: python benchmarks/bench_polyline_decoder.py [number of vertices] [repetitions]
+"""
+
+import os
+import sys
+import random
+import timeit
+import importlib.util
+
+here = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location('OtpPolyline', os.path.join(here, '..', 'algorithms', 'opentripplanner', 'OtpPolyline.py'))
+OtpPolyline = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(OtpPolyline)
+
+try:
+    from qgis.core import QgsGeometry, QgsLineString, QgsPoint
+except ImportError:
+    QgsGeometry = None
+
+
+def encode_polyline(coordinates, precision = 5):
+    factor = 10 ** precision
+    encoded = []
+    prev_lat, prev_lng = 0, 0
+    for lat, lng in coordinates:
+        lat, lng = int(round(lat * factor)), int(round(lng * factor))
+        for value in (lat - prev_lat, lng - prev_lng):
+            value = ~(value << 1) if value < 0 else (value << 1)
+            while value >= 0x20:
+                encoded.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            encoded.append(chr(value + 63))
+        prev_lat, prev_lng = lat, lng
+    return ''.join(encoded)
+
+
+def legacy_decode(polyline_str):
+    # The decoder OtpRoutes used before, returning coordinate tuples instead of QgsPoints
+    index, lat, lng = 0, 0, 0
+    coordinates = []
+    changes = {'latitude': 0, 'longitude': 0}
+    while index < len(polyline_str):
+        for unit in ['latitude', 'longitude']:
+            shift, result = 0, 0
+            while True:
+                byte = ord(polyline_str[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if not byte >= 0x20:
+                    break
+            if (result & 1):
+                changes[unit] = ~(result >> 1)
+            else:
+                changes[unit] = (result >> 1)
+        lat += changes['latitude']
+        lng += changes['longitude']
+        coordinates.append((float(lng / 100000.0), float(lat / 100000.0)))
+    return coordinates
+
+
+def legacy_geometry(polyline_str):
+    return QgsGeometry.fromPolyline([QgsPoint(x, y) for x, y in legacy_decode(polyline_str)])
+
+
+def new_geometry(polyline_str):
+    xs, ys = OtpPolyline.decode_polyline(polyline_str)
+    return QgsGeometry(QgsLineString(list(xs), list(ys)))
+
+
+def main():
+    n_vertices = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    random.seed(42)
+    lat, lng = 48.137, 11.575
+    coordinates = []
+    for i in range(n_vertices): # a random walk, similar to a long transit leg
+        lat += random.uniform(-0.002, 0.002)
+        lng += random.uniform(-0.002, 0.002)
+        coordinates.append((lat, lng))
+    polyline = encode_polyline(coordinates)
+
+    # All decoders have to return exactly the same coordinates
+    reference = legacy_decode(polyline)
+    xs, ys = OtpPolyline.decode_polyline_python(polyline)
+    assert list(zip(xs, ys)) == reference
+    if OtpPolyline.numpy is not None:
+        xs, ys = OtpPolyline.decode_polyline_numpy(polyline)
+        assert list(zip(xs.tolist(), ys.tolist())) == reference
+
+    print('Polyline with ' + str(n_vertices) + ' vertices (' + str(len(polyline)) + ' characters), ' + str(repetitions) + ' repetitions')
+    candidates = [('legacy decoder', lambda: legacy_decode(polyline)),
+                  ('buffer decoder (python)', lambda: OtpPolyline.decode_polyline_python(polyline))]
+    if OtpPolyline.numpy is not None:
+        candidates.append(('buffer decoder (numpy)', lambda: OtpPolyline.decode_polyline_numpy(polyline)))
+    else:
+        print('numpy not available, skipping the vectorized decoder')
+    if QgsGeometry is not None:
+        candidates.append(('legacy decoder + QgsPoint list + fromPolyline', lambda: legacy_geometry(polyline)))
+        candidates.append(('buffer decoder + QgsLineString', lambda: new_geometry(polyline)))
+    else:
+        print('QGIS not available, skipping geometry construction')
+
+    baseline = None
+    for name, function in candidates:
+        seconds = min(timeit.repeat(function, number = repetitions, repeat = 3)) / repetitions
+        if baseline is None:
+            baseline = seconds
+        print('{:<48} {:>10.3f} ms   x{:.1f}'.format(name, seconds * 1000, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: finding random placements inside a thin polygon, as RandomlyRedistributeFeaturesInsidePolygon does.
+
+Compares the former sampling (one candidate after another, translated within +/- the diagonal of the polygons bounding box,
+then rotated) with the batched sampler in algorithms/vector_creation/RandomPlacement.py. Without QGIS, a candidate counts as
+placed when all its vertices are inside the polygon (python ray casting for the former sampling, the vectorized kernel for the
+batched one); the algorithm additionally tests the candidates passing this with GEOS. In the algorithm every former try cost a
+geometry copy, translation, rotation and a GEOS test, so the tries per feature matter more than the times measured here.
+With --workers > 1 the features are also placed in a thread pool with per feature random generators (derived from the seed
+and the feature id, as the algorithm does), and the placements have to be identical to placing them one after another.
+
+Usage: python benchmarks/bench_random_placement.py [--features 200] [--width 20] [--rotate 1] [--seed 42] [--workers 4]
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+from algorithms.vector_creation import RandomPlacement
+from algorithms.vector_conditionals import PointInPolygon
+numpy = PointInPolygon.numpy
+
+
+def corridor(length, width):
+    # A thin polygon along a diagonal with a bend, similar to a river or road buffer
+    centerline = [(0, 0), (length, length), (2 * length, length)]
+    left, right = [], []
+    for (x1, y1), (x2, y2) in zip(centerline[:-1], centerline[1:]):
+        dx, dy = x2 - x1, y2 - y1
+        norm = math.hypot(dx, dy)
+        nx, ny = -dy / norm * width / 2, dx / norm * width / 2
+        left += [(x1 + nx, y1 + ny), (x2 + nx, y2 + ny)]
+        right += [(x1 - nx, y1 - ny), (x2 - nx, y2 - ny)]
+    ring = left + right[::-1]
+    return ring + [ring[0]]
+
+
+def python_inside(ring, x, y):
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring[:-1], ring[1:]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def former_sampling(ring, features, rotate, rng, max_try):
+    xs = [x for x, y in ring]
+    ys = [y for x, y in ring]
+    overlay_max = math.hypot(max(xs) - min(xs), max(ys) - min(ys))
+    tries = 0
+    for vertices, (cx, cy) in features:
+        for attempt in range(max_try):
+            tries += 1
+            dx = rng.uniform(-overlay_max, overlay_max)
+            dy = rng.uniform(-overlay_max, overlay_max)
+            angle = math.radians(rng.uniform(0, 360)) if rotate else 0
+            cos, sin = math.cos(angle), math.sin(angle)
+            # translate, then rotate around the former centroid
+            if all(python_inside(ring, cx + (x + dx - cx) * cos + (y + dy - cy) * sin, cy - (x + dx - cx) * sin + (y + dy - cy) * cos) for x, y in vertices):
+                break
+    return tries
+
+
+def batched_sampling(ring, features, rotate, rng, max_try):
+    edges = PointInPolygon.polygon_edges([ring])
+    bbox = (edges[:, [0, 2]].min(), edges[:, [1, 3]].min(), edges[:, [0, 2]].max(), edges[:, [1, 3]].max())
+    tries = 0
+    for vertices, (cx, cy) in features:
+        placement = RandomPlacement.RandomPlacement([x for x, y in vertices], [y for x, y in vertices], cx, cy, edges, bbox, rotate)
+        feature_tries = 0
+        while feature_tries < max_try:
+            batch_size = min(placement.batch_size, max_try - feature_tries)
+            angles, dxs, dys, possible = placement.candidates(rng, batch_size)
+            if possible.any():
+                feature_tries += int(numpy.flatnonzero(possible)[0]) + 1 # the first possible candidate would be tested with GEOS
+                break
+            feature_tries += batch_size
+        tries += feature_tries
+    return tries
+
+
+def place_feature(edges, bbox, rotate, seed, feature_id, feature):
+    # The first candidate with all vertices inside, drawn with the random generator of the feature
+    vertices, (cx, cy) = feature
+    python_rng, rng = RandomPlacement.feature_random_generators(seed, feature_id)
+    placement = RandomPlacement.RandomPlacement([x for x, y in vertices], [y for x, y in vertices], cx, cy, edges, bbox, rotate)
+    while True:
+        angles, dxs, dys, possible = placement.candidates(rng, placement.batch_size)
+        if possible.any():
+            i = int(numpy.flatnonzero(possible)[0])
+            return float(angles[i]), float(dxs[i]), float(dys[i])
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Former one by one sampling vs. batched sampling')
+    parser.add_argument('--features', type = int, default = 200)
+    parser.add_argument('--width', type = float, default = 20.0, help = 'width of the corridor, its legs are 1000 long')
+    parser.add_argument('--rotate', type = int, default = 1)
+    parser.add_argument('--seed', type = int, default = 42)
+    parser.add_argument('--workers', type = int, default = 4)
+    args = parser.parse_args()
+    if numpy is None:
+        print('numpy not available')
+        return
+
+    ring = corridor(1000, args.width)
+    random.seed(args.seed)
+    features = []
+    for i in range(args.features): # small squares (e.g. buildings) and points, all fitting into the corridor
+        cx = random.uniform(100, 900)
+        cy = cx
+        if i % 2:
+            size = args.width / 4
+            vertices = [(cx - size, cy - size), (cx + size, cy - size), (cx + size, cy + size), (cx - size, cy + size)]
+        else:
+            vertices = [(cx, cy)]
+        features.append((vertices, (cx, cy)))
+    max_try = 10000000
+
+    print(str(args.features) + ' features in a corridor of width ' + str(args.width) + (' with' if args.rotate else ' without') + ' rotation')
+    for name, function, rng in (('former one by one sampling', former_sampling, random.Random(args.seed)),
+                                ('batched sampling', batched_sampling, numpy.random.default_rng(args.seed))):
+        start = time.perf_counter()
+        tries = function(ring, features, bool(args.rotate), rng, max_try)
+        seconds = time.perf_counter() - start
+        print('{:<30} {:>9.3f} s {:>12.0f} tries per feature'.format(name, seconds, tries / args.features))
+
+
+    if args.workers > 1:
+        edges = PointInPolygon.polygon_edges([ring])
+        bbox = (edges[:, [0, 2]].min(), edges[:, [1, 3]].min(), edges[:, [0, 2]].max(), edges[:, [1, 3]].max())
+        arguments = [(edges, bbox, bool(args.rotate), args.seed, feature_id, feature) for feature_id, feature in enumerate(features)]
+        start = time.perf_counter()
+        serial = [place_feature(*argument) for argument in arguments]
+        serial_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = args.workers) as executor:
+            parallel = list(executor.map(lambda argument: place_feature(*argument), arguments))
+        parallel_seconds = time.perf_counter() - start
+        assert serial == parallel, 'placements in parallel threads have to be identical to the serial ones'
+        print('{:<30} {:>9.3f} s'.format('per feature streams, serial', serial_seconds))
+        print('{:<30} {:>9.3f} s (identical placements)'.format('per feature streams, ' + str(args.workers) + ' threads', parallel_seconds))
+
+
+if __name__ == '__main__':
+    main()
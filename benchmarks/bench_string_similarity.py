@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: similarity tests of SelectDuplicatesBySimilarity for all pairs of a set of POI names.
+
+Compares testing every pair with the metric functions (as the algorithm did before, including the soundex of both values)
+with the engine in algorithms/vector_conditionals/StringSimilarity.py (precomputed keys, pruning, banded Levenshtein).
+Uses QgsStringUtils if QGIS is available, otherwise python implementations of the same metrics (case insensitive).
+Both have to find the same similar pairs.
+
+Usage: python benchmarks/bench_string_similarity.py [--values 600] [--algorithms 2] [--and-or 0] [--levenshtein 3] [--substring 2] [--hamming 2]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import importlib.util
+
+here = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location('StringSimilarity', os.path.join(here, '..', 'algorithms', 'vector_conditionals', 'StringSimilarity.py'))
+StringSimilarity = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(StringSimilarity)
+
+try:
+    from qgis.core import QgsStringUtils
+except ImportError:
+    QgsStringUtils = None
+
+
+def levenshtein_distance(a, b):
+    a, b = a.lower(), b.lower()
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+        previous = current
+    return previous[-1]
+
+
+def longest_common_substring(a, b):
+    folded_a, folded_b = a.lower(), b.lower()
+    best, end = 0, 0
+    previous = [0] * (len(folded_b) + 1)
+    for i, char_a in enumerate(folded_a, 1):
+        current = [0] * (len(folded_b) + 1)
+        for j, char_b in enumerate(folded_b, 1):
+            if char_a == char_b:
+                current[j] = previous[j - 1] + 1
+                if current[j] > best:
+                    best, end = current[j], i
+        previous = current
+    return a[end - best:end]
+
+
+def hamming_distance(a, b):
+    if len(a) != len(b):
+        return -1
+    return sum(1 for char_a, char_b in zip(a.lower(), b.lower()) if char_a != char_b)
+
+
+def soundex(text):
+    codes = {}
+    for letters, code in (('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'), ('mn', '5'), ('r', '6')):
+        for letter in letters:
+            codes[letter] = code
+    letters = [char for char in text.lower() if char.isalpha()]
+    if not letters:
+        return ''
+    result = letters[0].upper()
+    last = codes.get(letters[0], '')
+    for letter in letters[1:]:
+        code = codes.get(letter, '')
+        if code and code != last:
+            result += code
+        if letter not in 'hw':
+            last = code
+    return (result + '000')[:4]
+
+
+def poi_names(n, seed = 42):
+    rng = random.Random(seed)
+    words = ['Bakery', 'Cafe', 'Pharmacy', 'Station', 'Market', 'Bistro', 'School', 'Library', 'Museum', 'Hotel', 'Garage', 'Kiosk',
+             'Main', 'Central', 'Old Town', 'Riverside', 'North', 'Park', 'Corner', 'Royal', 'Golden', 'Green', 'Saint Mary', 'Lindenhof']
+    names = []
+    while len(names) < n:
+        if names and rng.random() < 0.3: # a possible duplicate: a typo or a different case of an existing name
+            name = list(rng.choice(names))
+            position = rng.randrange(len(name))
+            if rng.random() < 0.5:
+                name[position] = rng.choice('abcdefghijklmnopqrstuvwxyz')
+            else:
+                del name[position]
+            names.append(''.join(name).upper() if rng.random() < 0.2 else ''.join(name))
+        else:
+            names.append(' '.join(rng.sample(words, rng.randint(1, 3))) + ' ' + str(rng.randint(1, 99)))
+    return names
+
+
+def naive_pairs(values, algorithms, all_must_match, th_levenshtein, th_substring, th_hamming, metrics):
+    # The former per pair tests of SelectDuplicatesBySimilarity
+    soundex_function, levenshtein_function, substring_function, hamming_function = metrics
+    pairs = 0
+    for i, a in enumerate(values):
+        th_levenshtein_new = max(0, th_levenshtein)
+        th_substring_new = max(0, len(a) - th_substring)
+        th_hamming_new = max(0, len(a) - th_hamming)
+        for b in values[:i]:
+            s = [None] * 5
+            if 0 in algorithms:
+                s[0] = int(a == b)
+            if 1 in algorithms:
+                s[1] = int(soundex_function(a) == soundex_function(b))
+            if 2 in algorithms:
+                s[2] = int(levenshtein_function(a, b) < th_levenshtein_new)
+            if 3 in algorithms:
+                s[3] = int(len(substring_function(a, b)) > th_substring_new)
+            if 4 in algorithms:
+                s[4] = int(hamming_function(a, b) > th_hamming_new)
+            if (0 not in s) if all_must_match else (1 in s):
+                pairs += 1
+    return pairs
+
+
+def engine_pairs(values, algorithms, all_must_match, th_levenshtein, th_substring, th_hamming, metrics):
+    engine = StringSimilarity.SimilarityEngine(algorithms, all_must_match, th_levenshtein, th_substring, th_hamming, *metrics)
+    keys = [engine.keys(value) for value in values]
+    pairs = 0
+    for i, a in enumerate(keys):
+        for b in keys[:i]:
+            if engine.similar(a, b):
+                pairs += 1
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Per pair metrics vs. similarity engine')
+    parser.add_argument('--values', type = int, default = 600)
+    parser.add_argument('--algorithms', default = '2', help = 'comma separated: 0 exact, 1 soundex, 2 levenshtein, 3 longest common substring, 4 hamming')
+    parser.add_argument('--and-or', type = int, default = 0, help = '0: all need to match, 1: at least one')
+    parser.add_argument('--levenshtein', type = int, default = 3)
+    parser.add_argument('--substring', type = int, default = 2)
+    parser.add_argument('--hamming', type = int, default = 2)
+    args = parser.parse_args()
+    algorithms = [int(algorithm) for algorithm in args.algorithms.split(',') if algorithm != '']
+
+    if QgsStringUtils is not None:
+        metrics = (QgsStringUtils.soundex, QgsStringUtils.levenshteinDistance, QgsStringUtils.longestCommonSubstring, QgsStringUtils.hammingDistance)
+        print('Using QgsStringUtils')
+    else:
+        metrics = (soundex, levenshtein_distance, longest_common_substring, hamming_distance)
+        print('QGIS not available, using python implementations of the metrics')
+    values = poi_names(args.values)
+    arguments = (values, algorithms, args.and_or == 0, args.levenshtein, args.substring, args.hamming, metrics)
+    n_pairs = len(values) * (len(values) - 1) // 2
+    results = []
+    for name, function in (('every pair with the metrics', naive_pairs), ('similarity engine', engine_pairs)):
+        start = time.perf_counter()
+        similar = function(*arguments)
+        seconds = time.perf_counter() - start
+        results.append(similar)
+        print('{:<30} {:>9.3f} s {:>10.2f} us/pair {:>8} similar pairs'.format(name, seconds, seconds * 1e6 / n_pairs, similar))
+    assert results[0] == results[1], 'the engine has to find the same pairs'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Offline stand-in for an OpenTripPlanner instance, for benchmarks and manual tests of the OTP algorithms.
+
+Answers every request to .../plan with a recorded plan response. The same url always gets the same response,
+chosen from the recorded ones by a hash of the query. Latency, jitter and a share of failing requests can be configured.
+Without recorded responses, synthetic ones are generated (transit itineraries with encoded leg geometries).
+Supports keep-alive connections and gzip-compressed responses like a real OTP behind a web server.
+
+Usage: python benchmarks/otp_mock_server.py [--port 8080] [--responses file.json or directory] [--latency 20] [--jitter 5] [--error-rate 0.01]
+The OTP algorithms then use http://127.0.0.1:8080/otp/routers/default/ as server url.
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import zlib
+import random
+import socket
+import argparse
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def encode_polyline(coordinates, precision = 5):
+    factor = 10 ** precision
+    encoded = []
+    prev_lat, prev_lng = 0, 0
+    for lat, lng in coordinates:
+        lat, lng = int(round(lat * factor)), int(round(lng * factor))
+        for value in (lat - prev_lat, lng - prev_lng):
+            value = ~(value << 1) if value < 0 else (value << 1)
+            while value >= 0x20:
+                encoded.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            encoded.append(chr(value + 63))
+        prev_lat, prev_lng = lat, lng
+    return ''.join(encoded)
+
+
+def synthetic_response(rng, n_itineraries = 3, n_legs = 5, n_vertices = 50):
+    # A plan response shaped like the ones of OTP 1.x/2.x
+    start = 1650000000000
+    lat, lng = 48.137 + rng.uniform(-0.05, 0.05), 11.575 + rng.uniform(-0.05, 0.05)
+    place = lambda lat, lng: {'name': 'Stop ' + str(rng.randint(1, 9999)), 'stopId': '1:' + str(rng.randint(1, 99999)), 'stopCode': str(rng.randint(1, 999)),
+                              'lat': lat, 'lon': lng, 'departure': start, 'arrival': start, 'vertexType': 'TRANSIT'}
+    itineraries = []
+    for i in range(n_itineraries):
+        legs = []
+        leg_start = start + i * 600000
+        leg_lat, leg_lng = lat, lng
+        for j in range(n_legs):
+            coordinates = []
+            for k in range(n_vertices):
+                leg_lat += rng.uniform(-0.0005, 0.0005)
+                leg_lng += rng.uniform(-0.0005, 0.0005)
+                coordinates.append((leg_lat, leg_lng))
+            duration = rng.randint(60, 900)
+            legs.append({'startTime': leg_start, 'endTime': leg_start + duration * 1000, 'departureDelay': 0, 'arrivalDelay': 0, 'realTime': False,
+                         'distance': rng.uniform(100, 5000), 'duration': float(duration), 'mode': 'WALK' if j % 2 == 0 else 'BUS', 'route': '',
+                         'from': place(coordinates[0][0], coordinates[0][1]), 'to': place(coordinates[-1][0], coordinates[-1][1]),
+                         'legGeometry': {'points': encode_polyline(coordinates), 'length': n_vertices}, 'steps': []})
+            leg_start += duration * 1000
+        duration = int((leg_start - start - i * 600000) / 1000)
+        itineraries.append({'duration': duration, 'startTime': start + i * 600000, 'endTime': leg_start, 'walkTime': duration // 3, 'transitTime': duration // 2,
+                            'waitingTime': duration - duration // 3 - duration // 2, 'walkDistance': 800.0, 'transfers': n_legs // 2, 'legs': legs})
+    return {'requestParameters': {}, 'plan': {'date': start, 'from': place(lat, lng), 'to': place(leg_lat, leg_lng), 'itineraries': itineraries}}
+
+
+def load_responses(path = None, count = 20, seed = 42):
+    """Returns a list of response bodies (bytes): the recorded responses in path (a .json file or a directory of them) or synthetic ones."""
+    if not path:
+        rng = random.Random(seed)
+        return [json.dumps(synthetic_response(rng)).encode('utf-8') for i in range(count)]
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.json'))
+    else:
+        files = [path]
+    responses = []
+    for file in files:
+        with open(file, 'rb') as response_file:
+            responses.append(response_file.read())
+    if not responses:
+        raise ValueError('No recorded responses found in ' + str(path))
+    return responses
+
+
+class OtpMockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive
+    wbufsize = -1 # write headers and body at once
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send_body(self, status, body, content_type = 'application/json'):
+        use_gzip = 'gzip' in (self.headers.get('Accept-Encoding') or '')
+        if use_gzip:
+            body = gzip.compress(body, 6)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type + '; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        parts = urllib.parse.urlsplit(self.path)
+        with server.lock:
+            server.requests += 1
+        if not parts.path.endswith('/plan'):
+            self.send_body(404, b'Not found', 'text/plain')
+            return
+        latency = server.latency + server.rng.uniform(-server.jitter, server.jitter)
+        if latency > 0:
+            time.sleep(latency)
+        if server.error_rate > 0 and server.rng.random() < server.error_rate:
+            with server.lock:
+                server.errors += 1
+            self.send_body(server.error_status, b'Server busy', 'text/plain')
+            return
+        response = server.responses[zlib.crc32(parts.query.encode('utf-8')) % len(server.responses)] # same url, same response
+        self.send_body(200, response)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class OtpMockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, responses, latency = 0.0, jitter = 0.0, error_rate = 0.0, error_status = 503, seed = None, verbose = False):
+        ThreadingHTTPServer.__init__(self, address, OtpMockHandler)
+        self.responses = responses
+        self.latency = latency # seconds
+        self.jitter = jitter # seconds
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def url(self):
+        return 'http://' + self.server_address[0] + ':' + str(self.server_address[1]) + '/otp/routers/default/'
+
+
+def start_mock_server(responses = None, latency = 0.0, jitter = 0.0, error_rate = 0.0, error_status = 503, port = 0, seed = None):
+    """Starts a mock server on localhost in a background thread and returns it; its url is the server url for the OTP algorithms."""
+    if responses is None:
+        responses = load_responses()
+    server = OtpMockServer(('127.0.0.1', port), responses, latency, jitter, error_rate, error_status, seed)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Offline stand-in for an OpenTripPlanner instance')
+    parser.add_argument('--port', type = int, default = 8080)
+    parser.add_argument('--responses', help = 'recorded plan response (.json) or directory of them; synthetic responses if omitted')
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'milliseconds per request')
+    parser.add_argument('--jitter', type = float, default = 0.0, help = 'milliseconds, latency varies by up to this much')
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'share of requests answered with an error status')
+    parser.add_argument('--error-status', type = int, default = 503)
+    parser.add_argument('--seed', type = int)
+    parser.add_argument('--verbose', action = 'store_true')
+    args = parser.parse_args()
+    server = OtpMockServer(('127.0.0.1', args.port), load_responses(args.responses), args.latency / 1000.0, args.jitter / 1000.0,
+                           args.error_rate, args.error_status, args.seed, args.verbose)
+    print('Serving ' + str(len(server.responses)) + ' plan responses at ' + server.url + ' (Ctrl+C to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(str(server.requests) + ' requests, ' + str(server.errors) + ' answered with an error')
+
+
+if __name__ == '__main__':
+    main()
@@ -50,6 +50,7 @@ from .algorithms.vector_conditionals.ConditionalDifference import *
 from .algorithms.vector_creation.CreateTimepolygonsWithPointcount import *
 from .algorithms.vector_creation.GeometryLayerFromGeojsonStringField import *
 from .algorithms.vector_creation.CreateNestedGrid import *
+from .algorithms.vector_creation.CountPointsInNestedGrid import *
 from .algorithms.vector_creation.NearestPointsToPath import *
 from .algorithms.vector_creation.CreatePolygonFromExtent import *
 from .algorithms.vector_creation.RandomlyRedistributeFeaturesInsidePolygon import *
@@ -60,6 +61,8 @@ from .algorithms.vector_interpolation.InterpolateDateTimeAlongLine import *
 # OpenTripPlanner
 from .algorithms.opentripplanner.OtpRoutes import *
 from .algorithms.opentripplanner.OtpTraveltime import *
+from .algorithms.opentripplanner.OtpTraveltimeComparison import *
+from .algorithms.opentripplanner.OtpTraveltimeMatrix import *
 
 pluginPath = os.path.split(os.path.dirname(__file__))[0]
 
@@ -98,6 +101,7 @@ class ProcessXProvider(QgsProcessingProvider):
         self.addAlgorithm(CreateTimepolygonsWithPointcount())
         self.addAlgorithm(GeometryLayerFromGeojsonStringField())
         self.addAlgorithm(CreateNestedGrid())
+        self.addAlgorithm(CountPointsInNestedGrid())
         self.addAlgorithm(NearestPointsToPath())
         self.addAlgorithm(CreatePolygonFromExtent())
         self.addAlgorithm(RandomlyRedistributeFeaturesInsidePolygon())
@@ -108,6 +112,8 @@ class ProcessXProvider(QgsProcessingProvider):
         # OpenTripPlanner
         self.addAlgorithm(OtpRoutes())
         self.addAlgorithm(OtpTraveltime())
+        self.addAlgorithm(OtpTraveltimeComparison())
+        self.addAlgorithm(OtpTraveltimeMatrix())
 
     def id(self):
         """